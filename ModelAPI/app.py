@@ -1,33 +1,160 @@
-from fastapi import FastAPI, File, UploadFile
+from fastapi import FastAPI, File, Header, Query, Request, UploadFile, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel
+from typing import Dict, List, Optional
 from ultralytics import YOLO
-from io import BytesIO
-from PIL import Image
 from fastapi.middleware.cors import CORSMiddleware
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
+import hmac
+import itertools
+import json
 import logging
+import os
+import time
 import traceback
-import numpy as np
+import uuid
+
 import torch
-import tempfile
-import os
+
+import config
+from backends import load_backend, pytorch_info, synthetic_samples
+from batching import MicroBatcher
+from cascade import needs_escalation
+from cpu_plan import pin_thread, plan_cpus, run_in_child, set_interop_threads
+from encoding import FORMATS, MSGPACK_MEDIA_TYPE, encode_result, pack_msgpack, render_columnar, render_predictions
+from executor import InferenceExecutor, Overloaded
+from cache import PredictionCache, make_key
+from jobs import FINISHED_STATES, JobQueueFull, JobStore
+from ingest import (MaxBodySizeMiddleware, UploadTooLarge, decode_image, iter_zip_images, keep_uploads_in_memory,
+                    read_upload)
+from metrics import CONTENT_TYPE, Registry, SlowRequestLog, StageTimer
+from model_store import resolve_weights, warmup
+from registry import ModelRegistry, ModelVersion, RegistryError
+from streaming import LatestFrameSlot, StreamStats, decode_frame, signature_distance
+from tiling import content_tiles, merge_detections, offset_detections
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, 
                     format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
+# Per-request introspection (result attributes, class maps, ...) is only logged when asked for
+if config.DEBUG_INTROSPECTION:
+    logger.setLevel(logging.DEBUG)
 
 app = FastAPI()
 
-# Ensure the model path is correct and the model file is accessible in the Docker container.
-try:
-    model = YOLO("best.pt")
-    logger.info("YOLO model loaded successfully.")
-    
+# Inter-op parallelism can only be sized before torch does any parallel work
+set_interop_threads(config.CPU_INTEROP_THREADS)
+
+# Set once the first model is loaded (or by serve.py in each worker); see plan_cpu
+active_cpu_plan = None
+cpu_worker = 0
+
+# Models are served as versions from the registry. The startup version loads in
+# the background (see start_model_loader), so the process answers /livez straight
+# away and /predict returns 503 until a version is warmed up and serving.
+def load_version(version, configure_cpu=True):
+    """Fetches, loads and warms up one model version. Blocking; the registry runs it on a worker thread.
+
+    The first version loaded with ``configure_cpu`` also sets up the CPU plan, benchmarked on it.
+    """
+    source = version.source
+    model_load_started = time.perf_counter()
+    weights_path, weights_checksum = resolve_source(source)
+    version.details.update(weights=weights_path, sha256=weights_checksum)
+    loaded_model = YOLO(weights_path)
+    logger.info(f"YOLO model {version.name} loaded successfully.")
+
     # Log model information
-    model_type = model.task if hasattr(model, 'task') else type(model).__name__
+    model_type = loaded_model.task if hasattr(loaded_model, 'task') else type(loaded_model).__name__
     logger.info(f"Model type: {model_type}")
-except Exception as model_load_error:
-    logger.error(f"Failed to load YOLO model: {model_load_error}", exc_info=True)
-    model = None
+
+    # Optionally swap in a faster exported runtime (ONNX Runtime / OpenVINO / TorchScript)
+    loaded_model, backend_info = configured_backend(
+        loaded_model, weights_path, weights_checksum, prepared_backends.get(weights_checksum))
+    version.details["load_seconds"] = time.perf_counter() - model_load_started
+    version.imgsz = config.IMGSZ
+
+    # Pay for predictor setup and first-shape allocations before taking traffic
+    version.state = "warming"
+    warmup_started = time.perf_counter()
+    version.details["warmup"] = warmup(
+        loaded_model, config.WARMUP_SIZES, config.WARMUP_BATCH_SIZES, config.WARMUP_ITERATIONS)
+    version.details["warmup_seconds"] = time.perf_counter() - warmup_started
+
+    # Identifies the weights and runtime in prediction cache keys
+    version.model_id = f"{source['path']}@{weights_checksum[:16]}:{backend_info['backend']}-{backend_info['precision']}"
+    version.backend_info = backend_info
+    version.model = loaded_model
+    logger.info(f"Model {version.name} loaded in {version.details['load_seconds']:.2f}s, "
+                f"warmed up in {version.details['warmup_seconds']:.2f}s")
+    if configure_cpu and active_cpu_plan is None:
+        use_cpu_plan(plan_cpu(loaded_model))
+
+def resolve_source(source):
+    """(path, sha256) of a version's weights, fetched into the model store when one is configured."""
+    # Ensure the model path is correct and the model file is accessible in the Docker container.
+    return resolve_weights(
+        source["path"],
+        store_dir=config.MODEL_STORE_DIR,
+        expected_sha256=source.get("sha256"),
+        url=source.get("url"),
+        offline=config.MODEL_OFFLINE,
+        name=source.get("store_name"),
+    )
+
+def configured_backend(model, weights_path, weights_checksum, prepared=None):
+    return load_backend(
+        model,
+        weights_path,
+        weights_checksum,
+        config.MODEL_BACKEND,
+        config.MODEL_PRECISION,
+        config.IMGSZ,
+        export_dir=config.BACKEND_EXPORT_DIR,
+        calibration_data=config.BACKEND_CALIBRATION_DATA,
+        parity_samples_dir=config.BACKEND_PARITY_SAMPLES_DIR,
+        parity_sample_count=config.BACKEND_PARITY_SAMPLE_COUNT,
+        parity_tolerance=config.BACKEND_PARITY_TOLERANCE,
+        parity_min_agreement=config.BACKEND_PARITY_MIN_AGREEMENT,
+        prepared=prepared,
+    )
+
+def plan_cpu(model=None, workers=1, isolated=False):
+    """CPU plan for ``workers`` serving processes, benchmarked on one full-size prediction of model."""
+    samples = synthetic_samples(1, config.IMGSZ, seed=0)
+
+    def run():
+        model.predict(source=samples, imgsz=config.IMGSZ, verbose=False)
+
+    return plan_cpus(
+        run if model is not None and config.CPU_BENCHMARK else None,
+        workers=workers,
+        intra_op=config.CPU_INTRA_OP_THREADS,
+        decode_cpus=config.CPU_DECODE_CPUS,
+        pin=config.CPU_PIN,
+        iterations=config.CPU_BENCHMARK_ITERATIONS,
+        tolerance=config.CPU_BENCHMARK_TOLERANCE,
+        isolated=isolated,
+    )
+
+def use_cpu_plan(plan, worker=0):
+    """Applies this process's share of plan: its torch thread count, and pinning through the pool initializers."""
+    global active_cpu_plan, cpu_worker
+    torch.set_num_threads(plan.intra_op)
+    active_cpu_plan, cpu_worker = plan, worker
+    logger.info(f"Using {plan.intra_op} intra-op threads on CPUs {plan.inference_cpus(worker)} "
+                f"(pinned: {plan.pin}, decode CPUs: {plan.decode_cpus or 'shared'})")
+
+def pin_decode_thread():
+    if active_cpu_plan is not None and active_cpu_plan.pin:
+        pin_thread(active_cpu_plan.decode_cpus)
+
+def pin_inference_thread():
+    if active_cpu_plan is not None and active_cpu_plan.pin:
+        pin_thread(active_cpu_plan.inference_cpus(cpu_worker))
 
 app.add_middleware(
     CORSMiddleware,
@@ -37,25 +164,453 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Helper function to convert any numpy values to Python native types
-def convert_numpy_to_python(obj):
-    if isinstance(obj, np.ndarray):
-        return obj.tolist()
-    elif isinstance(obj, np.generic):
-        return obj.item()  # Convert numpy scalars to Python scalars
-    elif isinstance(obj, dict):
-        return {k: convert_numpy_to_python(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_numpy_to_python(item) for item in obj]
+# Reject oversized uploads while the body streams in, before it is buffered
+app.add_middleware(
+    MaxBodySizeMiddleware,
+    limits={
+        "/predict": config.MAX_UPLOAD_BYTES + config.MULTIPART_OVERHEAD_BYTES,
+        "/jobs": config.MAX_UPLOAD_BYTES + config.MULTIPART_OVERHEAD_BYTES,
+        "/predict/batch": config.MAX_BATCH_REQUEST_BYTES,
+    },
+)
+
+# Uploads are decoded from memory; do not let the form parser spool them to temp files first
+keep_uploads_in_memory(config.MAX_UPLOAD_BYTES + config.MULTIPART_OVERHEAD_BYTES)
+
+executor = InferenceExecutor(
+    workers=config.INFERENCE_WORKERS,
+    max_queue=config.INFERENCE_MAX_QUEUE,
+    retry_after=config.RETRY_AFTER_SECONDS,
+    initializer=pin_decode_thread,
+)
+
+# With CPU_PIN, batchers run model.predict on their own threads, kept on the
+# inference cores; decoding stays on the executor's threads
+batch_pool = (ThreadPoolExecutor(max_workers=2, thread_name_prefix="batch",
+                                 initializer=pin_inference_thread)
+              if config.CPU_PIN else None)
+
+prediction_cache = PredictionCache(
+    max_entries=config.CACHE_MAX_ENTRIES,
+    max_bytes=config.CACHE_MAX_BYTES,
+    ttl=config.CACHE_TTL_SECONDS,
+    sizeof=lambda encoded: encoded.nbytes + 256,
+)
+
+metrics = Registry()
+request_latency = metrics.histogram(
+    "modelapi_request_duration_seconds", "End-to-end /predict latency by outcome and model version",
+    ["outcome", "model_version"])
+stage_latency = metrics.histogram(
+    "modelapi_stage_duration_seconds", "Time spent in each /predict stage", ["stage"])
+batch_size = metrics.histogram(
+    "modelapi_batch_size", "Images per batched model call", ["model_version", "imgsz"],
+    buckets=(1, 2, 4, 8, 16, 32, 64))
+metrics.gauge("modelapi_inflight_requests", "Admitted /predict requests being handled",
+              callback=lambda: executor.in_flight)
+metrics.gauge("modelapi_queue_depth", "Images waiting for each model version's micro-batchers",
+              ["model_version", "imgsz"],
+              callback=lambda: {(version.name, imgsz): batcher.queue_depth()
+                                for version in registry.versions for imgsz, batcher in version.batchers.items()})
+metrics.gauge("modelapi_model_load_seconds", "Time taken to load each model version", ["model_version"],
+              callback=lambda: version_details("load_seconds"))
+metrics.gauge("modelapi_model_warmup_seconds", "Time taken by each model version's warmup predictions",
+              ["model_version"], callback=lambda: version_details("warmup_seconds"))
+metrics.gauge("modelapi_model_loaded", "1 once a model version is loaded, warmed up and serving",
+              callback=lambda: int(model_ready()))
+metrics.gauge("modelapi_model_version_info", "1 for the primary model version, 0 for other loaded versions",
+              ["model_version"], callback=lambda: {(version.name,): int(version.name == registry.primary)
+                                                   for version in registry.versions})
+metrics.counter("modelapi_model_swaps_total", "Times the primary model version was replaced",
+                callback=lambda: registry.swaps)
+metrics.counter("modelapi_rejected_requests_total", "Requests rejected because the admission queue was full",
+                callback=lambda: executor.stats()["rejected"])
+metrics.counter("modelapi_cache_lookups_total", "Prediction cache lookups by result", ["result"],
+                callback=lambda: {(name,): prediction_cache.stats()[name] for name in ("hits", "misses", "coalesced")})
+metrics.counter("modelapi_cache_evictions_total", "Prediction cache entries evicted for size or age",
+                callback=lambda: prediction_cache.evictions + prediction_cache.expirations)
+metrics.gauge("modelapi_cache_bytes", "Estimated size of cached predictions",
+              callback=lambda: prediction_cache.stats()["bytes"])
+batch_items = metrics.counter(
+    "modelapi_batch_endpoint_images_total", "Images processed through /predict/batch by outcome", ["outcome"])
+tiles_total = metrics.counter(
+    "modelapi_tiles_total", "Tiles of tiled=true requests, run through the model or skipped as empty", ["outcome"])
+cascade_requests = metrics.counter(
+    "modelapi_cascade_total", "Cascade requests by the stage that answered and why", ["stage", "reason"])
+cascade_confidence = metrics.histogram(
+    "modelapi_cascade_low_top1_confidence", "Top score of the low-resolution cascade pass",
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99))
+stream_frames = metrics.counter(
+    "modelapi_stream_frames_total", "WebSocket /stream frames by what happened to them", ["outcome"])
+metrics.gauge("modelapi_active_streams", "Open WebSocket /stream connections",
+              callback=lambda: len(active_streams))
+shadow_predictions = metrics.counter(
+    "modelapi_shadow_predictions_total", "Shadow predictions by whether their top class agreed with the served one",
+    ["model_version", "outcome"])
+metrics.gauge("modelapi_cpu_usable_cores", "Cores the CPU plan shares out: affinity mask cut down to the cgroup quota",
+              callback=lambda: len(active_cpu_plan.cpus) if active_cpu_plan else 0)
+metrics.gauge("modelapi_torch_threads", "Torch thread pool sizes in this process", ["pool"],
+              callback=lambda: {("intra_op",): torch.get_num_threads(),
+                                ("inter_op",): torch.get_num_interop_threads()})
+jobs_total = metrics.counter(
+    "modelapi_jobs_total", "Asynchronous jobs by what happened to them", ["outcome"])
+job_queue_wait = metrics.histogram(
+    "modelapi_job_queue_seconds", "Time asynchronous jobs waited before a worker picked them up",
+    buckets=(0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0))
+slow_requests = SlowRequestLog(capacity=config.SLOW_REQUEST_LOG_SIZE, window=config.SLOW_REQUEST_WINDOW_SECONDS)
+
+def make_batchers(version):
+    """One micro-batcher per inference size: the full IMGSZ and, for cascades, CASCADE_IMGSZ."""
+    sizes = [version.imgsz]
+    if 0 < config.CASCADE_IMGSZ < version.imgsz:
+        sizes.append(config.CASCADE_IMGSZ)
+    return {imgsz: make_batcher(version, imgsz) for imgsz in sizes}
+
+def make_batcher(version, imgsz):
+    model = version.model
+
+    def predict_batch(sources):
+        # Runs one batched forward pass; YOLO returns one result per source, in order
+        with version.predict_lock:
+            results = model.predict(source=sources, imgsz=imgsz, verbose=False)
+        if config.DEBUG_INTROSPECTION:
+            log_result_structure(results)
+        return results
+
+    return MicroBatcher(
+        predict_batch,
+        max_batch_size=config.BATCH_MAX_SIZE,
+        max_wait_ms=config.BATCH_MAX_WAIT_MS,
+        executor=batch_pool or executor.pool,
+        on_batch=lambda size: batch_size.observe(size, model_version=version.name, imgsz=imgsz),
+    )
+
+def log_result_structure(results):
+    """DEBUG-level dump of what YOLO returned, for debugging result parsing"""
+    for i, result in enumerate(results):
+        logger.debug(f"Result {i} type: {type(result)}")
+        logger.debug(f"Result {i} attributes: {dir(result)}")
+        probs = getattr(result, "probs", None)
+        if probs is not None:
+            logger.debug(f"Probs attributes: {dir(probs)}")
+        logger.debug(f"Class names: {result.names}")
+
+registry = ModelRegistry(load_version, make_batchers)
+
+def version_details(key):
+    return {(version.name,): version.details[key] for version in registry.versions if key in version.details}
+
+# Set by serve.py, which loads and warms the startup version once in its parent
+# process and forks workers that share it copy-on-write
+preloaded_version = None
+
+# Set by serve.py when the backend cannot be shared across fork(): weights sha256 ->
+# the outcome of the export and parity check its parent ran, which workers reuse
+prepared_backends = {}
+
+def startup_source():
+    return {"path": config.MODEL_PATH, "sha256": config.MODEL_SHA256, "url": config.MODEL_URL}
+
+def prepare_backend():
+    """Exports the startup weights to MODEL_BACKEND and checks parity once, for serve.py's workers to reuse.
+
+    Runs in a throwaway child process: the parity check starts the backend's
+    runtime threads, which must not exist in a process that forks. Should the
+    child die, the workers serve PyTorch rather than each exporting at once.
+    """
+    weights_path, weights_checksum = resolve_source(startup_source())
+    try:
+        backend_info = run_in_child(
+            lambda: configured_backend(YOLO(weights_path), weights_path, weights_checksum)[1])
+    except RuntimeError as prepare_error:
+        logger.error(f"Preparing the {config.MODEL_BACKEND} backend failed, serving PyTorch: {prepare_error}")
+        backend_info = pytorch_info(weights_path, config.MODEL_BACKEND, config.MODEL_PRECISION,
+                                    f"Preparing the backend failed: {prepare_error}")
+    prepared_backends[weights_checksum] = backend_info
+
+def preload_model():
+    """Loads and warms up the startup version in this process, for start_model_loader to adopt."""
+    global preloaded_version
+    version = ModelVersion(config.MODEL_VERSION, startup_source())
+    load_version(version, configure_cpu=False)
+    preloaded_version = version
+    return version
+
+@app.on_event("startup")
+async def start_model_loader():
+    if preloaded_version is not None:
+        registry.add(preloaded_version, activate=True)
     else:
-        return obj
+        registry.load(config.MODEL_VERSION, startup_source(), activate=True)
+
+@app.on_event("shutdown")
+async def stop_batcher():
+    await registry.stop()
+    executor.shutdown()
+    if batch_pool is not None:
+        batch_pool.shutdown(wait=False)
+
+def model_ready():
+    return registry.ready
+
+def not_ready_response():
+    if registry.versions and all(version.state == "failed" for version in registry.versions):
+        return JSONResponse(status_code=503, content={
+            "predictions": [], "error": f"Model not loaded: {registry.versions[0].error}"})
+    return JSONResponse(
+        status_code=503,
+        headers={"Retry-After": str(config.RETRY_AFTER_SECONDS)},
+        content={"predictions": [], "error": "Model is still loading, please retry later."},
+    )
+
+def overloaded_response(overload):
+    return JSONResponse(
+        status_code=503,
+        headers={"Retry-After": str(overload.retry_after)},
+        content={"predictions": [], "error": str(overload)},
+    )
 
 @app.post("/predict")
-async def predict(file: UploadFile = File(None), imageFile: UploadFile = File(None)):
-    if model is None:
-        logger.error("Model not loaded, cannot predict.")
-        return {"predictions": [], "error": "Model not loaded."}
-        
+async def predict(
+    request: Request,
+    file: UploadFile = File(None),
+    imageFile: UploadFile = File(None),
+    top_k: int = Query(None, ge=0, description="Return at most this many predictions"),
+    conf: float = Query(None, ge=0.0, le=1.0, description="Drop predictions scoring below this"),
+    response_format: str = Query(None, alias="format", description="json (default), columnar or msgpack"),
+    tiled: bool = Query(False, description="Detect on overlapping full-resolution tiles (detection models)"),
+    cascade: bool = Query(None, description="Try a low-resolution pass first (default: CASCADE_BY_DEFAULT)"),
+):
+    response_format = negotiate_format(response_format, request.headers.get("accept", ""))
+    if response_format not in FORMATS:
+        return JSONResponse(status_code=400, content={
+            "predictions": [], "error": f"Unknown format '{response_format}', expected one of {', '.join(FORMATS)}."})
+
+    if not model_ready():
+        logger.error("Model not ready, cannot predict.")
+        return not_ready_response()
+
+    # Reject straight away when the worker pool is saturated instead of queueing
+    try:
+        admission = executor.admit()
+    except Overloaded as overload:
+        logger.warning("Inference queue full, rejecting request.")
+        return overloaded_response(overload)
+
+    timer = StageTimer()
+    # The lease keeps the chosen version loaded until this request is done, even if it is swapped out meanwhile
+    with admission, registry.lease() as version:
+        mode = inference_mode(version, tiled, cascade)
+        response = await run_prediction(version, file, imageFile, timer, response_format, top_k, conf, mode)
+    upload_file = file if file is not None else imageFile
+    return finish_request(response, timer, upload_file.filename if upload_file is not None else None, version.name)
+
+def inference_mode(version, tiled, cascade):
+    """standard, tiled or cascade for one request and the version answering it."""
+    # Classification looks at the whole image anyway, so tiling only applies to detection
+    if tiled and version.task == "detect":
+        return "tiled"
+    if config.CASCADE_BY_DEFAULT if cascade is None else cascade:
+        if len(version.batchers) > 1:
+            return "cascade"
+    return "standard"
+
+def negotiate_format(response_format, accept):
+    if response_format:
+        return response_format.lower()
+    if MSGPACK_MEDIA_TYPE in accept and "msgpack" in FORMATS:
+        return "msgpack"
+    return "json"
+
+def render_response(encoded, response_format, top_k, min_confidence, model_version):
+    """Builds the response body for one image in the requested format."""
+    if top_k is None and encoded.task == "classify":
+        top_k = config.CLASSIFY_TOP_K
+    if response_format == "json":
+        payload = {"predictions": render_predictions(encoded, top_k, min_confidence), "error": None,
+                   "model_version": model_version}
+    else:
+        payload = {"predictions": render_columnar(encoded, top_k, min_confidence), "error": None,
+                   "format": "columnar", "model_version": model_version}
+    if encoded.stage is not None:
+        payload["cascade_stage"] = encoded.stage
+    if response_format == "msgpack":
+        return Response(content=pack_msgpack(payload), media_type=MSGPACK_MEDIA_TYPE)
+    return payload
+
+def finish_request(response, timer, filename, model_version):
+    """Serializes the response and records its stage timings."""
+    if isinstance(response, dict):
+        outcome = "ok" if response.get("error") is None else "error"
+        with timer.stage("serialize"):
+            response = JSONResponse(content=response)
+    elif response.status_code == 200:
+        outcome = "ok"
+    else:
+        outcome = "too_large" if response.status_code == 413 else "error"
+
+    response.headers["X-Model-Version"] = model_version
+    total = timer.elapsed()
+    request_latency.observe(total, outcome=outcome, model_version=model_version)
+    for stage, seconds in timer.stages.items():
+        stage_latency.observe(seconds, stage=stage)
+    slow_requests.add(total, {
+        "file": filename,
+        "outcome": outcome,
+        "model_version": model_version,
+        "stages_ms": {stage: seconds * 1000.0 for stage, seconds in timer.stages.items()},
+    })
+    return response
+
+class PredictionError(Exception):
+    """A failure that is reported to the client in the "error" field."""
+
+async def infer_image(version, contents, filename, timer, mode="standard"):
+    # Decode once, in memory and on the worker pool, into the array YOLO expects
+    try:
+        with timer.stage("decode"):
+            if mode == "tiled":
+                image = await executor.run(decode_image, contents, None, config.TILE_MAX_PIXELS)
+            else:
+                image = await executor.run(decode_image, contents, config.IMGSZ)
+        logger.debug(f"Successfully loaded image: {filename}, decoded size: {image.shape[1]}x{image.shape[0]}")
+    except Exception as decode_error:
+        logger.error(f"Error loading image: {decode_error}")
+        raise PredictionError(f"Could not load image: {str(decode_error)}")
+    return await predict_decoded(version, image, timer, mode)
+
+async def predict_decoded(version, image, timer, mode="standard"):
+    if mode == "tiled":
+        try:
+            with timer.stage("tiles"):
+                return await predict_tiles(version, image)
+        except Exception as predict_error:
+            logger.error(f"Tiled prediction error: {predict_error}", exc_info=True)
+            raise PredictionError(f"Error during prediction: {str(predict_error)}")
+
+    if mode == "cascade":
+        try:
+            encoded = await predict_cascade(version, image, timer)
+        except Exception as predict_error:
+            logger.error(f"Cascade prediction error: {predict_error}", exc_info=True)
+            raise PredictionError(f"Error during prediction: {str(predict_error)}")
+        mirror_to_shadows(image, encoded)
+        return encoded
+
+    try:
+        # The batcher groups this with other concurrent uploads
+        results = [await submit_timed(version.batcher, image, timer)]
+        logger.debug(f"Prediction completed. Results type: {type(results)}")
+    except Exception as predict_error:
+        logger.error(f"Prediction error: {predict_error}", exc_info=True)
+        raise PredictionError(f"Error during prediction: {str(predict_error)}")
+
+    if not results:
+        logger.info("Model returned no results.")
+        raise PredictionError("Model returned no results.")
+
+    # One device-to-host copy per tensor; the cache keeps the arrays and each
+    # request renders its own top-k / threshold / format from them
+    with timer.stage("postprocess"):
+        encoded = encode_result(results[0])
+    mirror_to_shadows(image, encoded)
+    return encoded
+
+async def submit_timed(batcher, image, timer):
+    submitted = time.perf_counter()
+    result = await batcher.submit(image)
+    record_model_stages(timer, result, time.perf_counter() - submitted)
+    return result
+
+async def predict_cascade(version, image, timer):
+    """Answers from a CASCADE_IMGSZ pass when it is confident, from a full IMGSZ pass otherwise."""
+    low_result = await submit_timed(version.batchers[config.CASCADE_IMGSZ], image, timer)
+    with timer.stage("postprocess"):
+        encoded = encode_result(low_result)
+    if len(encoded):
+        cascade_confidence.observe(float(encoded.scores[0]))
+    reason = needs_escalation(encoded, config.CASCADE_MIN_CONFIDENCE, config.CASCADE_MIN_MARGIN)
+    if reason is None:
+        cascade_requests.inc(stage="low", reason="confident")
+        encoded.stage = "low"
+        return encoded
+
+    cascade_requests.inc(stage="full", reason=reason)
+    full_result = await submit_timed(version.batcher, image, timer)
+    with timer.stage("postprocess"):
+        encoded = encode_result(full_result)
+    encoded.stage = "full"
+    return encoded
+
+async def predict_tiles(version, image):
+    """Detects on overlapping full-resolution tiles and merges them into one result for the whole image."""
+    tiles, skipped = await executor.run(
+        content_tiles, image, config.TILE_SIZE, config.TILE_OVERLAP, config.TILE_MIN_STD)
+    tiles_total.inc(skipped, outcome="skipped")
+    tiles_total.inc(len(tiles), outcome="processed")
+    if config.TILE_FULL_IMAGE:
+        tiles.append((image, (0, 0)))
+
+    # Tiles are views into the decoded image; only TILE_BATCH_SIZE of them are
+    # preprocessed at a time, so memory does not grow with the number of tiles
+    detections = []
+    for start in range(0, len(tiles), config.TILE_BATCH_SIZE):
+        chunk = tiles[start:start + config.TILE_BATCH_SIZE]
+        results = await asyncio.gather(*[version.batcher.submit(view) for view, _ in chunk])
+        detections.extend(offset_detections(result, offset) for result, (_, offset) in zip(results, chunk))
+
+    height, width = image.shape[:2]
+    logger.debug(f"Tiled {width}x{height} image: {len(tiles)} passes, {skipped} empty tiles skipped")
+    return merge_detections(detections, version.model.names, width, height, config.TILE_NMS_IOU)
+
+shadow_tasks = set()
+
+def mirror_to_shadows(image, served):
+    """Sends a copy of the image to each shadow version; their answers are compared, never returned."""
+    for version in registry.shadow_versions():
+        if version.batcher.queue_depth() >= config.SHADOW_MAX_QUEUE:
+            # Shadow traffic must never slow down the versions that answer requests
+            shadow_predictions.inc(model_version=version.name, outcome="skipped")
+            continue
+        task = asyncio.ensure_future(shadow_predict(registry.lease(version), image, served))
+        shadow_tasks.add(task)
+        task.add_done_callback(shadow_tasks.discard)
+
+async def shadow_predict(lease, image, served):
+    with lease as version:
+        try:
+            shadow = encode_result(await version.batcher.submit(image))
+        except Exception as shadow_error:
+            logger.warning(f"Shadow prediction on {version.name} failed: {shadow_error}")
+            outcome = "error"
+        else:
+            served_top = served.class_ids[:1].tolist()
+            outcome = "agree" if shadow.class_ids[:1].tolist() == served_top else "disagree"
+    shadow_predictions.inc(model_version=version.name, outcome=outcome)
+
+def record_model_stages(timer, result, wall_seconds):
+    # YOLO reports per-image preprocess/inference/postprocess milliseconds (the batch
+    # time divided by its size); the rest of the wait is time queued in the batcher
+    speed = getattr(result, "speed", None) or {}
+    model_seconds = 0.0
+    for stage in ("preprocess", "inference", "postprocess"):
+        seconds = (speed.get(stage) or 0.0) / 1000.0
+        timer.add(stage, seconds)
+        model_seconds += seconds
+    timer.add("queue", wall_seconds - model_seconds)
+
+async def predict_image(version, contents, filename, timer, mode="standard"):
+    # Identical images (retries, re-opened history entries) are served from the
+    # cache; identical uploads already being computed share that computation
+    with timer.stage("hash"):
+        cache_key = await executor.run(
+            make_key, contents, version.model_id, imgsz=config.IMGSZ, task=version.task, mode=mode)
+    return await prediction_cache.get_or_compute(
+        cache_key, lambda: infer_image(version, contents, filename, timer, mode)
+    )
+
+async def run_prediction(version, file, imageFile, timer, response_format="json", top_k=None, min_confidence=None,
+                         mode="standard"):
     try:
         upload_file = file if file is not None else imageFile
         
@@ -63,150 +618,20 @@ async def predict(file: UploadFile = File(None), imageFile: UploadFile = File(No
             logger.warning("No file provided in the request.")
             return {"predictions": [], "error": "No file provided. Please upload an image file using 'file' or 'imageFile' parameter."}
         
-        contents = await upload_file.read()
-        
-        # For classification models, we'll save the image to a temporary file
-        # This is a workaround for the issue with PIL/numpy conversion in YOLO classify
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp_file:
-            temp_file.write(contents)
-            temp_file_path = temp_file.name
-        
         try:
-            # Log the temp file path
-            logger.info(f"Saved image to temporary file: {temp_file_path}")
-            
-            # Open image just to log the dimensions and format
-            with Image.open(BytesIO(contents)) as img:
-                logger.info(f"Successfully loaded image: {upload_file.filename}, size: {img.size}, mode: {img.mode}")
-            
-            # Call predict with the file path instead of the PIL Image object
-            results = model.predict(source=temp_file_path, imgsz=640, verbose=False)
-            logger.info(f"Prediction completed. Results type: {type(results)}")
-            
-            # Delete the temporary file after prediction
-            try:
-                os.unlink(temp_file_path)
-                logger.info(f"Deleted temporary file: {temp_file_path}")
-            except Exception as delete_error:
-                logger.warning(f"Failed to delete temporary file: {delete_error}")
-                
-        except Exception as predict_error:
-            # If prediction fails, clean up and log error
-            logger.error(f"Prediction error: {predict_error}", exc_info=True)
-            try:
-                os.unlink(temp_file_path)
-                logger.info(f"Deleted temporary file after error: {temp_file_path}")
-            except:
-                pass
-            return {"predictions": [], "error": f"Error during prediction: {str(predict_error)}"}
+            with timer.stage("read"):
+                contents = await read_upload(upload_file, config.MAX_UPLOAD_BYTES)
+        except UploadTooLarge as too_large:
+            logger.warning(f"Rejected upload {upload_file.filename}: {too_large}")
+            return JSONResponse(status_code=413, content={"predictions": [], "error": str(too_large)})
 
-        # Process results
-        if not results:
-            logger.info("Model returned no results.")
-            return {"predictions": [], "error": "Model returned no results."}
-
-        processed_predictions = []
-        
-        # Determine if it's a classification model
-        is_classification = hasattr(model, 'task') and model.task == 'classify'
-        logger.info(f"Processing results for model task type: {'classification' if is_classification else 'detection'}")
-        
-        # Log the structure of the results object
-        for i, result in enumerate(results):
-            logger.info(f"Result {i} type: {type(result)}")
-            logger.info(f"Result {i} attributes: {dir(result)}")
-        
-        # Process results based on model type
-        for result_item in results:
-            if is_classification or (hasattr(result_item, 'probs') and result_item.probs is not None):
-                # Handle classification results
-                logger.info("Processing classification results")
-                
-                if hasattr(result_item, 'probs') and result_item.probs is not None:
-                    logger.info(f"Probs attributes: {dir(result_item.probs)}")
-                    names = result_item.names
-                    logger.info(f"Class names: {names}")
-                    
-                    # Different ways to access probabilities based on the structure
-                    if hasattr(result_item.probs, 'top5'):
-                        # Access top 5 predictions
-                        logger.info("Using top5 method")
-                        top5_indices = result_item.probs.top5.cpu().numpy().tolist() if hasattr(result_item.probs.top5, 'cpu') else convert_numpy_to_python(result_item.probs.top5)
-                        top5_conf = result_item.probs.top5conf.cpu().numpy().tolist() if hasattr(result_item.probs.top5conf, 'cpu') else convert_numpy_to_python(result_item.probs.top5conf)
-                        
-                        logger.info(f"Top 5 indices: {top5_indices}")
-                        logger.info(f"Top 5 confidences: {top5_conf}")
-                        
-                        for idx, conf in zip(top5_indices, top5_conf):
-                            if idx in names:
-                                processed_predictions.append({
-                                    "class": names[idx],
-                                    "probability": float(conf)
-                                })
-                    elif hasattr(result_item.probs, 'data'):
-                        # Access all class probabilities
-                        logger.info("Using data method")
-                        probs_data = result_item.probs.data
-                        
-                        # Convert to Python list depending on data type
-                        if hasattr(probs_data, 'cpu'):
-                            probs_list = probs_data.cpu().numpy().tolist()
-                        else:
-                            probs_list = convert_numpy_to_python(probs_data)
-                        
-                        logger.info(f"Probabilities length: {len(probs_list)}")
-                        
-                        # Add each class prediction
-                        for i, prob in enumerate(probs_list):
-                            if i in names:
-                                processed_predictions.append({
-                                    "class": names[i],
-                                    "probability": float(prob)
-                                })
-                    else:
-                        # Fallback method - try to access probs directly
-                        logger.warning("Using fallback method for probabilities")
-                        try:
-                            # Try different attributes that might contain probabilities
-                            for attr_name in dir(result_item.probs):
-                                if attr_name.startswith("__"):
-                                    continue
-                                    
-                                logger.info(f"Checking attribute: {attr_name}")
-                                try:
-                                    attr_value = getattr(result_item.probs, attr_name)
-                                    if isinstance(attr_value, (torch.Tensor, np.ndarray, list)) and not callable(attr_value):
-                                        logger.info(f"Found potential probability data in {attr_name}")
-                                except:
-                                    pass
-                        except Exception as prob_error:
-                            logger.error(f"Error accessing probabilities: {prob_error}")
-            elif hasattr(result_item, 'boxes') and result_item.boxes is not None:
-                # Handle object detection results
-                logger.info("Processing detection results")
-                boxes = result_item.boxes
-                names = result_item.names
-                
-                for i in range(len(boxes.cls)):
-                    class_id = int(boxes.cls[i].item())
-                    confidence = float(boxes.conf[i].item())
-                    
-                    box_coords = boxes.xyxyn[i].cpu().numpy().tolist() if hasattr(boxes.xyxyn[i], 'cpu') else convert_numpy_to_python(boxes.xyxyn[i])
-                    
-                    prediction_item = {
-                        "class": names[class_id],
-                        "confidence": confidence,
-                        "box": box_coords
-                    }
-                    processed_predictions.append(prediction_item)
-            else:
-                logger.warning(f"Unrecognized result type or missing expected attributes")
-
-        # Final safety check to ensure all predictions are JSON serializable
-        processed_predictions = convert_numpy_to_python(processed_predictions)
-        
-        logger.info(f"Successfully processed {len(processed_predictions)} predictions.")
-        return {"predictions": processed_predictions, "error": None}
+        try:
+            encoded = await predict_image(version, contents, upload_file.filename, timer, mode)
+        except PredictionError as prediction_error:
+            return {"predictions": [], "error": str(prediction_error)}
+        logger.debug(f"Successfully processed {len(encoded)} predictions.")
+        with timer.stage("serialize"):
+            return render_response(encoded, response_format, top_k, min_confidence, version.name)
 
     except Exception as e:
         tb = traceback.format_exc()
@@ -217,7 +642,554 @@ async def predict(file: UploadFile = File(None), imageFile: UploadFile = File(No
             "error": f"{error_type}: {str(e)}"
         }
 
+@app.post("/predict/batch")
+async def predict_batch_endpoint(
+    files: List[UploadFile] = File(None),
+    archive: UploadFile = File(None),
+    top_k: int = Query(None, ge=0, description="Return at most this many predictions per image"),
+    conf: float = Query(None, ge=0.0, le=1.0, description="Drop predictions scoring below this"),
+    response_format: str = Query("json", alias="format", description="json or columnar"),
+    tiled: bool = Query(False, description="Detect on overlapping full-resolution tiles (detection models)"),
+    cascade: bool = Query(None, description="Try a low-resolution pass first (default: CASCADE_BY_DEFAULT)"),
+):
+    """Scores many images in one request, streaming one NDJSON line per image as it finishes.
+
+    Images come as repeated 'files' parts and/or a zip 'archive'. Each line has
+    the /predict response schema plus "index" and "filename"; a failing image
+    only sets "error" on its own line.
+    """
+    response_format = (response_format or "json").lower()
+    if response_format not in ("json", "columnar"):
+        return JSONResponse(status_code=400, content={
+            "predictions": [], "error": f"Unknown format '{response_format}', expected json or columnar."})
+    if not model_ready():
+        return not_ready_response()
+    if not files and archive is None:
+        return JSONResponse(status_code=400, content={
+            "predictions": [], "error": "No files provided. Upload images as 'files' parts or a zip as 'archive'."})
+
+    # The batch keeps up to BATCH_ENDPOINT_CONCURRENCY images in flight and is admitted for as many
+    try:
+        admission = executor.admit(max(1, min(config.BATCH_ENDPOINT_CONCURRENCY, executor.capacity)))
+    except Overloaded as overload:
+        logger.warning("Inference queue full, rejecting batch request.")
+        return overloaded_response(overload)
+
+    # One version answers the whole batch
+    lease = registry.lease()
+
+    def release():
+        lease.release()
+        admission.release()
+
+    try:
+        items = await list_batch_items(files or [], archive)
+    except Exception as archive_error:
+        release()
+        return JSONResponse(status_code=400, content={
+            "predictions": [], "error": f"Could not read archive: {archive_error}"})
+
+    logger.info(f"Batch request with {len(items)} images for model version {lease.version.name}")
+    return ReleasingStreamingResponse(
+        stream_batch(items, admission.slots, lease.version, response_format, top_k, conf,
+                     inference_mode(lease.version, tiled, cascade)),
+        release,
+        media_type="application/x-ndjson",
+        headers={"X-Model-Version": lease.version.name},
+    )
+
+class ReleasingStreamingResponse(StreamingResponse):
+    """A StreamingResponse that calls ``release()`` once it is over, however it ends.
+
+    A finally in the body generator is not enough: when the client goes away
+    before the body is sent, the generator never starts, and a generator that
+    never started does not run its finally.
+    """
+
+    def __init__(self, content, release, **kwargs):
+        super().__init__(content, **kwargs)
+        self.release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+            self.release()
+
+async def list_batch_items(files, archive):
+    """[(filename, read)] for every image, where ``await read()`` returns its bytes.
+
+    Nothing is read yet: stream_batch reads each image only once it has a slot,
+    so the parts and zip members are never all copied out of the request at
+    once. The form files stay open until the response is over.
+    """
+    items = [(upload_file.filename, functools.partial(read_batch_part, upload_file))
+             for upload_file in files[:config.BATCH_ENDPOINT_MAX_FILES]]
+    if archive is not None and len(items) < config.BATCH_ENDPOINT_MAX_FILES:
+        remaining = config.BATCH_ENDPOINT_MAX_FILES - len(items)
+        members = await executor.run(
+            lambda: list(iter_zip_images(archive.file, config.MAX_UPLOAD_BYTES, remaining)))
+        items.extend((name, functools.partial(executor.run, read)) for name, read in members)
+    return items
+
+async def read_batch_part(upload_file):
+    try:
+        return await read_upload(upload_file, config.MAX_UPLOAD_BYTES)
+    finally:
+        # Frees the part's buffer now instead of when the response is over
+        await upload_file.close()
+
+async def stream_batch(items, concurrency, version, response_format, top_k, min_confidence, mode="standard"):
+    # Bounds how many images are read, decoded and waiting for the batcher at once, to what was admitted
+    slots = asyncio.Semaphore(concurrency)
+
+    async def score(index, filename, read):
+        line = {"index": index, "filename": filename, "model_version": version.name}
+        timer = StageTimer()
+        async with slots:
+            try:
+                contents = await read()
+            except Exception as read_error:
+                # An oversized or corrupt part or zip member only fails its own line
+                line.update({"predictions": [], "error": f"{type(read_error).__name__}: {read_error}"})
+                return line
+            try:
+                encoded = await predict_image(version, contents, filename, timer, mode)
+                line.update(render_response(encoded, response_format, top_k, min_confidence, version.name))
+            except PredictionError as prediction_error:
+                line.update({"predictions": [], "error": str(prediction_error)})
+            except Exception as item_error:
+                logger.error(f"Batch item {index} ({filename}) failed: {item_error}", exc_info=True)
+                line.update({"predictions": [], "error": f"{type(item_error).__name__}: {item_error}"})
+        for stage, seconds in timer.stages.items():
+            stage_latency.observe(seconds, stage=stage)
+        return line
+
+    tasks = [asyncio.ensure_future(score(index, *item)) for index, item in enumerate(items)]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            line = await finished
+            batch_items.inc(outcome="ok" if line.get("error") is None else "error")
+            yield json.dumps(line, separators=(",", ":")) + "\n"
+    finally:
+        for task in tasks:
+            task.cancel()
+
+active_streams = {}
+stream_ids = itertools.count(1)
+
+@app.websocket("/stream")
+async def stream(
+    websocket: WebSocket,
+    top_k: int = Query(None, ge=0),
+    conf: float = Query(None, ge=0.0, le=1.0),
+    cascade: bool = Query(None),
+):
+    """Live inference on a sequence of camera frames.
+
+    The client sends each frame as one binary message (JPEG/PNG bytes). Every
+    frame that gets answered produces one JSON text message: the /predict
+    response plus "frame" (1-based arrival number), "deduplicated",
+    "latency_ms" and the stream's "stats". Frames that arrive while the
+    previous one is still being processed replace each other and only the
+    newest is answered. A frame that looks like the last inferred one is
+    answered with that frame's result.
+    """
+    await websocket.accept()
+    if not model_ready() or len(active_streams) >= config.STREAM_MAX_CONNECTIONS:
+        # 1013: try again later
+        await websocket.close(code=1013, reason="Model not ready" if not model_ready() else "Too many streams")
+        return
+
+    stream_id = next(stream_ids)
+    stats = active_streams[stream_id] = StreamStats(config.STREAM_FPS_WINDOW_SECONDS)
+    slot = LatestFrameSlot()
+    worker = asyncio.ensure_future(stream_worker(websocket, slot, stats, top_k, conf, cascade))
+    logger.info(f"Stream {stream_id} opened")
+    try:
+        sequence = 0
+        while not worker.done():
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            data = message.get("bytes")
+            if data is None:
+                await websocket.close(code=1003, reason="Frames must be sent as binary messages")
+                break
+            if len(data) > config.MAX_UPLOAD_BYTES:
+                await websocket.close(code=1009, reason=f"Frames are limited to {config.MAX_UPLOAD_BYTES} bytes")
+                break
+            sequence += 1
+            stats.record_received()
+            if slot.put((sequence, data, time.perf_counter())):
+                stats.record_dropped()
+                stream_frames.inc(outcome="dropped")
+    except WebSocketDisconnect:
+        pass
+    finally:
+        slot.close()
+        worker.cancel()
+        active_streams.pop(stream_id, None)
+        logger.info(f"Stream {stream_id} closed: {stats.snapshot()}")
+
+async def stream_worker(websocket, slot, stats, top_k, min_confidence, cascade):
+    # Signature, result and version of the last frame that actually went through the model
+    previous = None
+    while True:
+        frame = await slot.get()
+        if frame is None:
+            return
+        sequence, data, received = frame
+        reply = {"frame": sequence, "deduplicated": False}
+        try:
+            image, signature = await executor.run(decode_frame, data, config.IMGSZ)
+            if previous is not None and signature_distance(signature, previous[0]) < config.STREAM_DEDUP_THRESHOLD:
+                _, encoded, model_version = previous
+                reply["deduplicated"] = True
+                outcome = "deduplicated"
+            else:
+                with registry.lease() as version:
+                    encoded = await predict_decoded(version, image, StageTimer(), inference_mode(version, False, cascade))
+                    model_version = version.name
+                previous = (signature, encoded, model_version)
+                outcome = "inferred"
+            reply.update(render_response(encoded, "json", top_k, min_confidence, model_version))
+        except Exception as frame_error:
+            logger.warning(f"Stream frame {sequence} failed: {frame_error}")
+            reply.update({"predictions": [], "error": f"{type(frame_error).__name__}: {frame_error}"})
+            outcome = "errors"
+        stats.record_answered(outcome, time.perf_counter() - received)
+        stream_frames.inc(outcome=outcome)
+        reply["latency_ms"] = (time.perf_counter() - received) * 1000.0
+        reply["stats"] = stats.snapshot()
+        await websocket.send_text(json.dumps(reply, separators=(",", ":")))
+
+@app.get("/stats/streams")
+async def stream_stats():
+    """Frame rate, drop and deduplication statistics of the open /stream connections"""
+    return {str(stream_id): stats.snapshot() for stream_id, stats in active_streams.items()}
+
+# Asynchronous jobs: POST /jobs answers 202 with a job id as soon as the image
+# is stored, and job workers run it through the same pipeline as /predict.
+# Clients poll (or long-poll) GET /jobs/{job_id} for the result.
+job_store = JobStore(config.JOBS_DB_PATH) if config.JOBS_DB_PATH else None
+# Identifies this server run. serve.py's workers inherit it from the parent, so
+# at startup only the jobs an earlier run left running are queued again.
+server_run_id = uuid.uuid4().hex
+job_tasks = []
+# Created on the serving loop: before Python 3.10 an Event binds to the loop current when it is made
+job_submitted = None
+# job id -> the Events of the requests long-polling it, one per request
+job_waiters = {}
+
+@app.on_event("startup")
+async def start_job_workers():
+    global job_submitted
+    if job_store is None:
+        return
+    job_submitted = asyncio.Event()
+    requeued = await asyncio.to_thread(job_store.requeue_abandoned, server_run_id)
+    if requeued:
+        logger.info(f"Queued {requeued} jobs again that were running when the service last stopped")
+        jobs_total.inc(requeued, outcome="requeued")
+    loop = asyncio.get_running_loop()
+    job_tasks.extend(loop.create_task(job_worker()) for _ in range(config.JOBS_WORKERS))
+    job_tasks.append(loop.create_task(evict_jobs()))
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    # Jobs interrupted here are still marked running under this run and are picked up on the next start
+    for task in job_tasks:
+        task.cancel()
+    if job_store is not None:
+        await asyncio.gather(*job_tasks, return_exceptions=True)
+        job_store.close()
+
+async def job_worker():
+    while True:
+        if not model_ready():
+            await asyncio.sleep(config.JOBS_POLL_SECONDS)
+            continue
+        job_submitted.clear()
+        try:
+            job = await asyncio.to_thread(
+                job_store.claim, server_run_id, config.JOBS_STALE_SECONDS, config.JOBS_MAX_ATTEMPTS)
+        except Exception as claim_error:
+            logger.error(f"Could not claim a job: {claim_error}", exc_info=True)
+            job = None
+        if job is None:
+            # Also wakes up now and then for jobs submitted through other workers
+            try:
+                await asyncio.wait_for(job_submitted.wait(), config.JOBS_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        await run_job(job)
+
+async def run_job(job):
+    params = job["params"]
+    job_queue_wait.observe(max(0.0, time.time() - job["created_at"]))
+    timer = StageTimer()
+    try:
+        with registry.lease() as version:
+            mode = inference_mode(version, params.get("tiled", False), params.get("cascade"))
+            encoded = await predict_image(version, job["image"], job["filename"], timer, mode)
+            result = render_response(encoded, "json", params.get("top_k"), params.get("conf"), version.name)
+        await asyncio.to_thread(job_store.complete, job["id"], result)
+        outcome = "done"
+    except PredictionError as prediction_error:
+        await asyncio.to_thread(job_store.fail, job["id"], str(prediction_error))
+        outcome = "failed"
+    except Exception as job_error:
+        logger.error(f"Job {job['id']} failed: {type(job_error).__name__}: {job_error}", exc_info=True)
+        await asyncio.to_thread(job_store.fail, job["id"], f"{type(job_error).__name__}: {job_error}")
+        outcome = "failed"
+    jobs_total.inc(outcome=outcome)
+    for waiter in job_waiters.get(job["id"], ()):
+        waiter.set()
+
+async def evict_jobs():
+    while True:
+        try:
+            evicted = await asyncio.to_thread(job_store.evict, config.JOBS_TTL_SECONDS, config.JOBS_MAX_BYTES)
+            if evicted:
+                logger.info(f"Evicted {evicted} finished jobs")
+                jobs_total.inc(evicted, outcome="evicted")
+        except Exception as evict_error:
+            logger.error(f"Job eviction failed: {evict_error}", exc_info=True)
+        await asyncio.sleep(config.JOBS_EVICT_INTERVAL_SECONDS)
+
+def jobs_disabled_response():
+    return JSONResponse(status_code=404, content={"job_id": None, "error": "The job API is disabled (JOBS_DB_PATH is not set)."})
+
+@app.post("/jobs", status_code=202)
+async def submit_job(
+    file: UploadFile = File(None),
+    imageFile: UploadFile = File(None),
+    top_k: int = Query(None, ge=0, description="Return at most this many predictions"),
+    conf: float = Query(None, ge=0.0, le=1.0, description="Drop predictions scoring below this"),
+    tiled: bool = Query(False, description="Detect on overlapping full-resolution tiles (detection models)"),
+    cascade: bool = Query(None, description="Try a low-resolution pass first (default: CASCADE_BY_DEFAULT)"),
+):
+    """Queues an image for prediction and returns its job id straight away"""
+    if job_store is None:
+        return jobs_disabled_response()
+    upload_file = file if file is not None else imageFile
+    if upload_file is None:
+        return JSONResponse(status_code=400, content={
+            "job_id": None, "error": "No file provided. Please upload an image file using 'file' or 'imageFile' parameter."})
+    try:
+        contents = await read_upload(upload_file, config.MAX_UPLOAD_BYTES)
+    except UploadTooLarge as too_large:
+        return JSONResponse(status_code=413, content={"job_id": None, "error": str(too_large)})
+
+    params = {"top_k": top_k, "conf": conf, "tiled": tiled, "cascade": cascade}
+    try:
+        job_id = await asyncio.to_thread(
+            job_store.submit, upload_file.filename, contents, params, config.JOBS_MAX_QUEUED)
+    except JobQueueFull as full:
+        jobs_total.inc(outcome="rejected")
+        return JSONResponse(status_code=503, headers={"Retry-After": str(config.RETRY_AFTER_SECONDS)},
+                            content={"job_id": None, "error": str(full)})
+    jobs_total.inc(outcome="submitted")
+    if job_submitted is not None:
+        job_submitted.set()
+    status_url = f"/jobs/{job_id}"
+    return JSONResponse(status_code=202, headers={"Location": status_url},
+                        content={"job_id": job_id, "state": "queued", "status_url": status_url})
+
+@app.get("/jobs/{job_id}")
+async def job_status(
+    job_id: str,
+    wait: float = Query(0.0, ge=0.0, description="Seconds to wait for the job to finish (long-poll)"),
+):
+    """A job's state, with the /predict response body as its result once it is done"""
+    if job_store is None:
+        return jobs_disabled_response()
+    deadline = time.monotonic() + min(wait, config.JOBS_MAX_WAIT_SECONDS)
+    waiter = asyncio.Event() if wait else None
+    if waiter is not None:
+        job_waiters.setdefault(job_id, set()).add(waiter)
+    try:
+        while True:
+            job = await asyncio.to_thread(job_store.get, job_id)
+            if job is None:
+                return JSONResponse(status_code=404, content={"job_id": job_id, "error": f"Unknown job '{job_id}'"})
+            remaining = deadline - time.monotonic()
+            if job["state"] in FINISHED_STATES or remaining <= 0:
+                return job
+            # Set when a job finishes in this process; the timeout catches jobs run by other workers
+            try:
+                await asyncio.wait_for(waiter.wait(), min(remaining, config.JOBS_POLL_SECONDS))
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        if waiter is not None:
+            waiters = job_waiters.get(job_id)
+            waiters.discard(waiter)
+            if not waiters:
+                del job_waiters[job_id]
+
+@app.get("/stats/jobs")
+async def job_stats():
+    """Asynchronous jobs by state and the space they take up"""
+    if job_store is None:
+        return jobs_disabled_response()
+    return {**await asyncio.to_thread(job_store.stats), "workers": config.JOBS_WORKERS}
+
 @app.get("/ping")
 async def ping():
     """Health check endpoint"""
-    return {"status": "ok", "model_loaded": model is not None}
\ No newline at end of file
+    primary = registry.primary_version()
+    return {
+        "status": "ok",
+        "model_loaded": primary is not None,
+        "model_state": primary.state if primary is not None else startup_state(),
+        "model_version": registry.primary,
+        "backend": primary.backend_info["backend"] if primary is not None else None,
+    }
+
+def startup_state():
+    states = [version.state for version in registry.versions]
+    if states and all(state == "failed" for state in states):
+        return "failed"
+    return states[0] if states else "starting"
+
+@app.get("/livez")
+async def livez():
+    """Liveness probe: the process and its event loop are responsive"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness probe: 200 only once the model is loaded, warmed up and serving"""
+    if model_ready():
+        return {"status": "ready", "model_version": registry.primary, **registry.primary_version().describe()}
+    return JSONResponse(status_code=503, content={"status": startup_state(), **registry.describe()})
+
+@app.get("/stats/backend")
+async def backend_stats():
+    """Inference backend of the primary version, and the parity report if an exported backend was requested"""
+    primary = registry.primary_version()
+    return primary.backend_info if primary is not None else None
+
+@app.get("/stats/cpu")
+async def cpu_stats():
+    """Cores, thread counts and pinning chosen for this process"""
+    if active_cpu_plan is None:
+        return {"planned": False, "pid": os.getpid()}
+    return {"planned": True, "pid": os.getpid(), "worker": cpu_worker, **active_cpu_plan.describe(cpu_worker),
+            "torch_threads": torch.get_num_threads()}
+
+@app.get("/stats/executor")
+async def executor_stats():
+    """Worker pool and admission queue statistics"""
+    return executor.stats()
+
+@app.get("/stats/batching")
+async def batching_stats():
+    """Micro-batching statistics for tuning BATCH_MAX_SIZE / BATCH_MAX_WAIT_MS, per model version"""
+    return {
+        version.name: {str(imgsz): batcher.stats() for imgsz, batcher in version.batchers.items()}
+        for version in registry.versions
+    }
+
+@app.get("/stats/cache")
+async def cache_stats():
+    """Prediction cache hit/miss/eviction counters"""
+    return prediction_cache.stats()
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus scrape endpoint: latency histograms per stage, queue depth, in-flight count, cache counters"""
+    return PlainTextResponse(metrics.render(), media_type=CONTENT_TYPE)
+
+@app.get("/stats/slow")
+async def slowest_requests():
+    """The slowest recent /predict requests with their per-stage breakdown"""
+    return slow_requests.snapshot()
+
+class LoadModelRequest(BaseModel):
+    version: str
+    path: str
+    sha256: Optional[str] = None
+    url: Optional[str] = None
+    activate: bool = False
+
+class TrafficRequest(BaseModel):
+    split: Dict[str, float] = {}
+    shadow: List[str] = []
+
+def admin_denied(token):
+    """Error response unless ADMIN_TOKEN is set and matches the X-Admin-Token header"""
+    # Loading a version unpickles whatever it points at, so without a token the admin API stays off
+    if config.ADMIN_TOKEN is None:
+        return JSONResponse(status_code=403, content={"error": "The admin API is disabled (ADMIN_TOKEN is not set)."})
+    # Each serve.py worker has its own registry, so a change would only reach whichever worker took the request
+    if active_cpu_plan is not None and active_cpu_plan.workers > 1:
+        return JSONResponse(status_code=403, content={
+            "error": "The admin API is disabled with more than one serve.py worker (SERVE_WORKERS)."})
+    if hmac.compare_digest(token or "", config.ADMIN_TOKEN):
+        return None
+    return JSONResponse(status_code=401, content={"error": "Missing or wrong X-Admin-Token."})
+
+def registry_error_response(registry_error):
+    return JSONResponse(status_code=registry_error.status_code, content={"error": str(registry_error)})
+
+@app.get("/admin/models")
+async def list_models(x_admin_token: str = Header(None)):
+    """Loaded model versions, the primary, and the traffic split / shadow settings"""
+    return admin_denied(x_admin_token) or registry.describe()
+
+@app.post("/admin/models", status_code=202)
+async def load_model_version(body: LoadModelRequest, x_admin_token: str = Header(None)):
+    """Loads and warms up a new version in the background; with activate it becomes the primary when ready"""
+    denied = admin_denied(x_admin_token)
+    if denied:
+        return denied
+    # Each version gets its own file in the model store so versions never overwrite each other
+    stem, extension = os.path.splitext(os.path.basename(body.path))
+    source = {"path": body.path, "sha256": body.sha256, "url": body.url,
+              "store_name": f"{stem}-{body.version}{extension}"}
+    try:
+        version = registry.load(body.version, source, activate=body.activate)
+    except RegistryError as registry_error:
+        return registry_error_response(registry_error)
+    return {"version": version.name, **version.describe()}
+
+@app.post("/admin/models/{name}/activate")
+async def activate_model_version(name: str, x_admin_token: str = Header(None)):
+    """Atomically makes a ready version the primary; the old primary drains and is unloaded"""
+    denied = admin_denied(x_admin_token)
+    if denied:
+        return denied
+    try:
+        registry.activate(name)
+    except RegistryError as registry_error:
+        return registry_error_response(registry_error)
+    return registry.describe()
+
+@app.put("/admin/traffic")
+async def set_traffic(body: TrafficRequest, x_admin_token: str = Header(None)):
+    """Percentages of requests answered by non-primary versions, and versions that get shadow copies"""
+    denied = admin_denied(x_admin_token)
+    if denied:
+        return denied
+    try:
+        registry.set_traffic(body.split, body.shadow)
+    except RegistryError as registry_error:
+        return registry_error_response(registry_error)
+    return registry.describe()
+
+@app.delete("/admin/models/{name}")
+async def retire_model_version(name: str, x_admin_token: str = Header(None)):
+    """Stops routing to a version and unloads it once its in-flight requests finish"""
+    denied = admin_denied(x_admin_token)
+    if denied:
+        return denied
+    try:
+        registry.retire(name)
+    except RegistryError as registry_error:
+        return registry_error_response(registry_error)
+    return registry.describe()
@@ -0,0 +1,237 @@
+import logging
+import os
+import shutil
+
+import numpy as np
+from ultralytics import YOLO
+
+logger = logging.getLogger(__name__)
+
+# Backend name -> (ultralytics export format, suffix of the exported artifact)
+EXPORT_FORMATS = {
+    "onnx": ("onnx", ".onnx"),
+    "openvino": ("openvino", "_openvino_model"),
+    "torchscript": ("torchscript", ".torchscript"),
+}
+BACKENDS = ("pytorch",) + tuple(EXPORT_FORMATS)
+PRECISIONS = ("fp32", "fp16", "int8")
+
+# Precisions each backend really produces on CPU. Ultralytics quietly exports
+# fp32 when half=True is asked of ONNX or TorchScript on CPU, and only
+# OpenVINO honours int8.
+SUPPORTED_PRECISIONS = {
+    "pytorch": ("fp32",),
+    "onnx": ("fp32",),
+    "openvino": ("fp32", "fp16", "int8"),
+    "torchscript": ("fp32",),
+}
+
+# Formats that can be exported with a dynamic batch dimension, which the
+# micro-batcher needs to send variable-sized batches
+DYNAMIC_BATCH_FORMATS = ("onnx", "openvino")
+
+
+def artifact_path(weights_path, backend, precision, checksum, export_dir=None):
+    """Where the exported artifact for these weights lives: next to the weights by default.
+
+    The weights checksum is part of the name, so replacing best.pt never picks
+    up an artifact exported from the old weights.
+    """
+    directory = export_dir or os.path.dirname(os.path.abspath(weights_path))
+    stem = os.path.splitext(os.path.basename(weights_path))[0]
+    suffix = EXPORT_FORMATS[backend][1]
+    return os.path.join(directory, f"{stem}-{checksum[:12]}-{precision}{suffix}")
+
+
+def export_model(weights_path, backend, precision, checksum, imgsz, export_dir=None, calibration_data=None):
+    """Exports weights to the backend once and returns the cached artifact path."""
+    target = artifact_path(weights_path, backend, precision, checksum, export_dir)
+    if os.path.exists(target):
+        logger.info(f"Using cached {backend} ({precision}) export: {target}")
+        return target
+
+    export_format = EXPORT_FORMATS[backend][0]
+    export_args = {"format": export_format, "imgsz": imgsz}
+    if export_format in DYNAMIC_BATCH_FORMATS:
+        export_args["dynamic"] = True
+    if precision == "fp16":
+        export_args["half"] = True
+    elif precision == "int8":
+        export_args["int8"] = True
+        if calibration_data:
+            export_args["data"] = calibration_data
+
+    logger.info(f"Exporting {weights_path} to {backend} ({precision}), this only happens once per weights checksum")
+    exported = YOLO(weights_path).export(**export_args)
+    if not exported or not os.path.exists(exported):
+        raise RuntimeError(f"Export to {backend} did not produce an artifact")
+
+    # Move into place under the checksum-keyed name; a directory export (OpenVINO)
+    # is staged alongside so readers never see a half-moved artifact
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    staging = target + ".tmp"
+    if os.path.isdir(staging):
+        shutil.rmtree(staging)
+    shutil.move(str(exported), staging)
+    os.replace(staging, target)
+    logger.info(f"Cached {backend} export at {target}")
+    return target
+
+
+def synthetic_samples(count, imgsz, seed=0):
+    """Smooth random images: unlike white noise they give the model something to be confident about."""
+    rng = np.random.default_rng(seed)
+    samples = []
+    for _ in range(count):
+        coarse = rng.integers(0, 256, size=(8, 8, 3), dtype=np.uint8)
+        image = np.kron(coarse, np.ones((imgsz // 8, imgsz // 8, 1), dtype=np.uint8))
+        noise = rng.integers(-12, 13, size=image.shape)
+        samples.append(np.clip(image.astype(np.int16) + noise, 0, 255).astype(np.uint8))
+    return samples
+
+
+def load_samples(samples_dir, imgsz, limit):
+    from ingest import decode_image
+
+    samples = []
+    for name in sorted(os.listdir(samples_dir)):
+        path = os.path.join(samples_dir, name)
+        if not os.path.isfile(path):
+            continue
+        try:
+            with open(path, "rb") as f:
+                samples.append(decode_image(f.read(), imgsz))
+        except Exception as sample_error:
+            logger.warning(f"Skipping parity sample {path}: {sample_error}")
+            continue
+        if len(samples) >= limit:
+            break
+    return samples
+
+
+def _scores(result):
+    """Per-class score vector for a classification or detection result."""
+    if getattr(result, "probs", None) is not None:
+        return result.probs.data.float().cpu().numpy()
+    scores = np.zeros(len(result.names), dtype=np.float32)
+    boxes = getattr(result, "boxes", None)
+    if boxes is not None and len(boxes):
+        cls = boxes.cls.cpu().numpy().astype(int)
+        conf = boxes.conf.cpu().numpy()
+        np.maximum.at(scores, cls, conf)
+    return scores
+
+
+def parity_check(reference, candidate, samples, imgsz, tolerance, min_agreement):
+    """Compares candidate outputs with the PyTorch reference on the same inputs.
+
+    Per-class scores (classification probabilities, or the best detection
+    confidence per class) must stay within ``tolerance`` of the reference, and
+    the top-1 class must agree on at least ``min_agreement`` of the samples
+    where the reference itself is not ambiguous. When no sample has an
+    unambiguous top-1 (typical for a detection model on synthetic noise, which
+    finds nothing), nothing was actually compared and the check fails as
+    unverified.
+    """
+    reference_results = reference.predict(source=samples, imgsz=imgsz, verbose=False)
+    candidate_results = candidate.predict(source=samples, imgsz=imgsz, verbose=False)
+
+    max_diff = 0.0
+    compared = 0
+    agreed = 0
+    for ref, cand in zip(reference_results, candidate_results):
+        ref_scores = _scores(ref)
+        cand_scores = _scores(cand)
+        max_diff = max(max_diff, float(np.abs(ref_scores - cand_scores).max()))
+        top2 = np.sort(ref_scores)[-2:] if ref_scores.size > 1 else np.array([0.0, ref_scores.max()])
+        if top2[1] - top2[0] <= tolerance:
+            continue
+        compared += 1
+        agreed += int(ref_scores.argmax() == cand_scores.argmax())
+
+    agreement = (agreed / compared) if compared else None
+    report = {
+        "samples": len(samples),
+        "compared_top1": compared,
+        "top1_agreement": agreement,
+        "max_score_diff": max_diff,
+        "tolerance": tolerance,
+        "min_agreement": min_agreement,
+        "verified": compared > 0,
+    }
+    report["passed"] = compared > 0 and max_diff <= tolerance and agreement >= min_agreement
+    return report
+
+
+def pytorch_info(weights_path, backend, precision, fallback_reason=None):
+    """Backend info for serving the PyTorch weights when ``backend`` at ``precision`` was requested."""
+    info = {"backend": "pytorch", "precision": "fp32", "requested": backend,
+            "requested_precision": precision, "artifact": weights_path, "parity": None}
+    if fallback_reason:
+        info["fallback_reason"] = fallback_reason
+    return info
+
+
+def load_backend(reference, weights_path, checksum, backend, precision, imgsz, export_dir=None,
+                 calibration_data=None, parity_samples_dir=None, parity_sample_count=8,
+                 parity_tolerance=0.02, parity_min_agreement=1.0, prepared=None):
+    """Returns (model, info) for the configured backend.
+
+    Falls back to the PyTorch ``reference`` model, with the reason in ``info``,
+    when the export fails, the runtime is not installed or the parity check
+    does not pass. ``prepared`` is the info an earlier call returned for the
+    same weights (in serve.py's parent). Its outcome is reused: the cached
+    artifact is opened without exporting or checking parity again.
+    """
+    if prepared is not None:
+        info = dict(prepared)
+        if info["backend"] == "pytorch":
+            return reference, info
+        logger.info(f"Serving {info['backend']} ({info['precision']}) backend from {info['artifact']}, "
+                    f"parity: {info['parity']}")
+        return YOLO(info["artifact"], task=reference.task), info
+    info = pytorch_info(weights_path, backend, precision)
+    if backend not in BACKENDS:
+        info["fallback_reason"] = f"Unknown backend '{backend}', expected one of {', '.join(BACKENDS)}"
+        logger.error(info["fallback_reason"])
+        return reference, info
+    if precision not in PRECISIONS:
+        info["fallback_reason"] = f"Unknown precision '{precision}', expected one of {', '.join(PRECISIONS)}"
+        logger.error(info["fallback_reason"])
+        return reference, info
+    if precision not in SUPPORTED_PRECISIONS[backend]:
+        info["fallback_reason"] = (f"The {backend} backend does not support {precision} on CPU, "
+                                   f"expected one of {', '.join(SUPPORTED_PRECISIONS[backend])}")
+        logger.error(f"{info['fallback_reason']}; serving PyTorch fp32 instead")
+        return reference, info
+    if backend == "pytorch":
+        return reference, info
+
+    try:
+        artifact = export_model(weights_path, backend, precision, checksum, imgsz,
+                                export_dir=export_dir, calibration_data=calibration_data)
+        candidate = YOLO(artifact, task=reference.task)
+
+        if parity_samples_dir:
+            samples = load_samples(parity_samples_dir, imgsz, parity_sample_count)
+        else:
+            samples = synthetic_samples(parity_sample_count, imgsz)
+        report = parity_check(reference, candidate, samples, imgsz, parity_tolerance, parity_min_agreement)
+        info["parity"] = report
+        if not report["verified"]:
+            info["fallback_reason"] = ("Parity could not be verified: no sample had a clear top-1 prediction; "
+                                       "point BACKEND_PARITY_SAMPLES_DIR at real images")
+            logger.error(f"{backend} ({precision}) parity unverified, serving PyTorch instead: {report}")
+            return reference, info
+        if not report["passed"]:
+            info["fallback_reason"] = "Parity check against PyTorch failed"
+            logger.error(f"{backend} ({precision}) parity check failed, serving PyTorch instead: {report}")
+            return reference, info
+    except Exception as backend_error:
+        info["fallback_reason"] = f"{type(backend_error).__name__}: {backend_error}"
+        logger.error(f"Could not enable {backend} backend, serving PyTorch instead: {backend_error}", exc_info=True)
+        return reference, info
+
+    logger.info(f"Serving {backend} ({precision}) backend from {artifact}, parity: {report}")
+    info.update({"backend": backend, "precision": precision, "artifact": artifact})
+    return candidate, info
@@ -0,0 +1,171 @@
+import asyncio
+import collections
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """Groups concurrent single-image requests into batched model calls.
+
+    Callers ``await submit(source)`` and get back the result for their own
+    source. A runner collects queued sources until ``max_batch_size`` are
+    waiting or ``max_wait_ms`` has passed since the first one arrived, then
+    calls ``predict_fn(list_of_sources)`` once (off the event loop) and hands
+    each result back to the request that sent it. ``predict_fn`` must return
+    one result per source, in order.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=8, max_wait_ms=10.0, executor=None,
+                 concurrency=1, stats_window=1000, on_batch=None):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.executor = executor
+        self.concurrency = max(1, concurrency)
+        self.on_batch = on_batch
+
+        self._pending = collections.deque()
+        self._wakeup = None
+        self._runners = []
+
+        self._batches = 0
+        self._items = 0
+        self._failed_batches = 0
+        self._batch_sizes = collections.Counter()
+        self._queue_waits = collections.deque(maxlen=stats_window)
+        self._max_queue_wait = 0.0
+        self._total_queue_wait = 0.0
+
+    @property
+    def running(self):
+        return bool(self._runners)
+
+    def start(self):
+        if self._runners:
+            return
+        self._wakeup = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        self._runners = [loop.create_task(self._run()) for _ in range(self.concurrency)]
+        logger.info(f"Micro-batcher started (max_batch_size={self.max_batch_size}, "
+                    f"max_wait_ms={self.max_wait * 1000:.1f}, concurrency={self.concurrency})")
+
+    async def stop(self):
+        runners, self._runners = self._runners, []
+        for task in runners:
+            task.cancel()
+        for task in runners:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        while self._pending:
+            _, future, _ = self._pending.popleft()
+            if not future.done():
+                future.set_exception(RuntimeError("Batcher stopped"))
+
+    async def submit(self, source):
+        if not self._runners:
+            raise RuntimeError("Batcher is not running")
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((source, future, time.perf_counter()))
+        self._wakeup.set()
+        return await future
+
+    def queue_depth(self):
+        return len(self._pending)
+
+    async def _next_item(self):
+        while True:
+            while self._pending:
+                item = self._pending.popleft()
+                # Skip requests whose client already went away
+                if not item[1].cancelled():
+                    return item
+            self._wakeup.clear()
+            await self._wakeup.wait()
+
+    async def _collect(self):
+        batch = [await self._next_item()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if self._pending:
+                item = self._pending.popleft()
+                if not item[1].cancelled():
+                    batch.append(item)
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            started = time.perf_counter()
+            for _, _, enqueued in batch:
+                self._record_wait(started - enqueued)
+            self._batches += 1
+            self._items += len(batch)
+            self._batch_sizes[len(batch)] += 1
+            if self.on_batch is not None:
+                self.on_batch(len(batch))
+
+            sources = [source for source, _, _ in batch]
+            try:
+                results = await loop.run_in_executor(self.executor, self.predict_fn, sources)
+                if len(results) != len(sources):
+                    raise RuntimeError(f"Model returned {len(results)} results for a batch of {len(sources)}")
+            except Exception as batch_error:
+                self._failed_batches += 1
+                logger.error(f"Batched prediction failed for {len(sources)} images: {batch_error}", exc_info=True)
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(batch_error)
+                continue
+
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def _record_wait(self, wait):
+        self._queue_waits.append(wait)
+        self._total_queue_wait += wait
+        if wait > self._max_queue_wait:
+            self._max_queue_wait = wait
+
+    def stats(self):
+        waits = sorted(self._queue_waits)
+
+        def percentile(p):
+            if not waits:
+                return 0.0
+            return waits[min(len(waits) - 1, int(p * len(waits)))] * 1000.0
+
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "queue_depth": len(self._pending),
+            "batches": self._batches,
+            "items": self._items,
+            "failed_batches": self._failed_batches,
+            "avg_batch_size": (self._items / self._batches) if self._batches else 0.0,
+            "batch_size_histogram": {str(size): count for size, count in sorted(self._batch_sizes.items())},
+            "queue_wait_ms": {
+                "avg": (self._total_queue_wait / self._items * 1000.0) if self._items else 0.0,
+                "max": self._max_queue_wait * 1000.0,
+                "p50": percentile(0.50),
+                "p95": percentile(0.95),
+                "p99": percentile(0.99),
+            },
+        }
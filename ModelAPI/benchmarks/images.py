@@ -0,0 +1,51 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+DEFAULT_SIZES = ((640, 480), (1920, 1080), (4032, 3024))
+DEFAULT_FORMATS = ("JPEG", "PNG", "WEBP")
+
+
+def synthetic_image(width, height, seed):
+    """Smooth colour blobs plus sensor-like noise, so encoders and the model see photo-like content."""
+    rng = np.random.default_rng(seed)
+    coarse = Image.fromarray(rng.integers(0, 256, size=(6, 8, 3), dtype=np.uint8))
+    image = np.asarray(coarse.resize((width, height), Image.BICUBIC)).astype(np.int16)
+    image += rng.integers(-8, 9, size=image.shape, dtype=np.int16)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def encode(array, image_format, quality=90):
+    buffer = io.BytesIO()
+    options = {"quality": quality} if image_format in ("JPEG", "WEBP") else {}
+    Image.fromarray(array).save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def build_corpus(count, sizes=DEFAULT_SIZES, formats=DEFAULT_FORMATS, seed=0):
+    """Deterministic list of (name, bytes, content_type) cycling through sizes and formats.
+
+    Every image is distinct, so a warm prediction cache cannot hide the real
+    cost of a request.
+    """
+    corpus = []
+    for index in range(count):
+        width, height = sizes[index % len(sizes)]
+        image_format = formats[(index // len(sizes)) % len(formats)]
+        data = encode(synthetic_image(width, height, seed + index), image_format)
+        extension = "jpg" if image_format == "JPEG" else image_format.lower()
+        corpus.append((f"synthetic_{index}_{width}x{height}.{extension}", data, f"image/{extension.replace('jpg', 'jpeg')}"))
+    return corpus
+
+
+def parse_sizes(value):
+    sizes = []
+    for item in value.split(","):
+        width, height = item.lower().split("x")
+        sizes.append((int(width), int(height)))
+    return tuple(sizes)
+
+
+def parse_formats(value):
+    return tuple(item.strip().upper().replace("JPG", "JPEG") for item in value.split(","))
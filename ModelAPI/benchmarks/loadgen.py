@@ -0,0 +1,78 @@
+import asyncio
+import itertools
+import time
+from collections import Counter
+
+import httpx
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+async def run_load(client, corpus, concurrency, requests, path="/predict", field="file"):
+    """Drives ``requests`` uploads through the app with ``concurrency`` clients in flight."""
+    latencies = []
+    status_codes = Counter()
+    errors = 0
+    counter = itertools.count()
+
+    async def worker():
+        nonlocal errors
+        while True:
+            index = next(counter)
+            if index >= requests:
+                return
+            name, data, content_type = corpus[index % len(corpus)]
+            started = time.perf_counter()
+            response = await client.post(path, files={field: (name, data, content_type)})
+            latencies.append((time.perf_counter() - started) * 1000.0)
+            status_codes[response.status_code] += 1
+            if response.status_code != 200 or response.json().get("error"):
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "wall_s": wall,
+        "throughput_rps": requests / wall if wall else 0.0,
+        "mean_ms": sum(latencies) / len(latencies) if latencies else 0.0,
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "error_rate": errors / requests if requests else 0.0,
+        "status_codes": {str(code): count for code, count in sorted(status_codes.items())},
+    }
+
+
+async def wait_until_ready(client, timeout=600.0, interval=0.2):
+    """Polls /readyz while the model loads in the background; apps without the probe count as ready."""
+    deadline = time.perf_counter() + timeout
+    while True:
+        response = await client.get("/readyz")
+        if response.status_code != 503:
+            return
+        if response.json().get("status") == "failed" or time.perf_counter() > deadline:
+            raise RuntimeError(f"App did not become ready: {response.text}")
+        await asyncio.sleep(interval)
+
+
+async def run_load_levels(app, corpus, concurrency_levels, requests, warmup=4):
+    """Runs the app's startup/shutdown hooks once and measures each concurrency level in turn."""
+    results = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600.0) as client:
+            await wait_until_ready(client)
+            if warmup:
+                await run_load(client, corpus, 1, warmup)
+            for concurrency in concurrency_levels:
+                results[f"c{concurrency}"] = await run_load(client, corpus, concurrency, requests)
+    return results
@@ -0,0 +1,88 @@
+import statistics
+import time
+
+import numpy as np
+import torch
+
+import config
+from encoding import EncodedResult, encode_result, render_columnar, render_predictions
+from ingest import decode_image
+from registry import ModelVersion
+
+
+def measure(fn, repeat, warmup=2):
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000.0)
+    timings.sort()
+    return {
+        "runs": repeat,
+        "mean_ms": statistics.fmean(timings),
+        "p50_ms": timings[len(timings) // 2],
+        "p95_ms": timings[min(len(timings) - 1, int(0.95 * len(timings)))],
+        "min_ms": timings[0],
+    }
+
+
+def crowded_detection(count, num_classes=38):
+    """A detection result with ``count`` boxes, as the encoder would hold it."""
+    rng = np.random.default_rng(0)
+    names = {i: f"class_{i}" for i in range(num_classes)}
+    scores = np.sort(rng.random(count, dtype=np.float32))[::-1].copy()
+    class_ids = rng.integers(0, num_classes, size=count)
+    boxes = rng.random((count, 4), dtype=np.float32)
+    return EncodedResult("detect", names, class_ids, scores, boxes)
+
+
+def run_micro(app_module, corpus, imgsz, repeat, batch_sizes):
+    """Micro-benchmarks for each stage of the /predict path: decode, preprocess, inference, result encoding."""
+    results = {}
+
+    # One sample per distinct size/format in the corpus
+    samples = {}
+    for name, data, _ in corpus:
+        key = name.split("_", 2)[2]
+        samples.setdefault(key, data)
+    for key, data in samples.items():
+        results[f"decode/{key}"] = measure(lambda: decode_image(data, imgsz), repeat)
+
+    arrays = [decode_image(data, imgsz) for data in samples.values()]
+    if hasattr(app_module, "load_version"):
+        # The app loads its model in the background at startup; load a private copy here instead
+        version = ModelVersion("benchmark", {"path": config.MODEL_PATH})
+        app_module.load_version(version)
+        model = version.model
+    else:
+        model = app_module.model
+    model.predict(source=arrays[0], imgsz=imgsz, verbose=False)
+    predictor = model.predictor
+
+    results["preprocess/batch1"] = measure(lambda: predictor.preprocess([arrays[0]]), repeat)
+    for batch_size in batch_sizes:
+        batch = [arrays[i % len(arrays)] for i in range(batch_size)]
+        tensor = predictor.preprocess(batch)
+
+        def infer():
+            with torch.inference_mode():
+                predictor.inference(tensor)
+
+        timing = measure(infer, repeat)
+        timing["per_image_ms"] = timing["p50_ms"] / batch_size
+        results[f"inference/batch{batch_size}"] = timing
+
+    results["predict/batch1"] = measure(
+        lambda: model.predict(source=arrays[0], imgsz=imgsz, verbose=False), repeat)
+
+    model_results = model.predict(source=arrays[0], imgsz=imgsz, verbose=False)
+    results["encode_result"] = measure(lambda: encode_result(model_results[0]), repeat)
+    encoded = encode_result(model_results[0])
+    results["render/json"] = measure(lambda: render_predictions(encoded, top_k=5), repeat)
+    for count in (10, 1000):
+        crowded = crowded_detection(count)
+        results[f"render/json/{count}_boxes"] = measure(lambda: render_predictions(crowded), repeat)
+        results[f"render/columnar/{count}_boxes"] = measure(lambda: render_columnar(crowded), repeat)
+    return results
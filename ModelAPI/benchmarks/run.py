@@ -0,0 +1,205 @@
+"""Benchmark suite for the ModelAPI /predict path.
+
+Run from the ModelAPI directory:
+
+    python -m benchmarks.run                          # micro + load, compare with baseline
+    python -m benchmarks.run --app app_fixed --no-micro
+    python -m benchmarks.run --update-baseline        # accept the current numbers
+
+Results are written as JSON. When a baseline exists, the run fails with exit
+code 1 when a load metric is worse than the baseline by more than --threshold
+(relative), or when the load error rate is higher than the baseline's at all,
+so failing fast cannot pass for a speedup. Micro-benchmarks take microseconds
+and are noisy at that scale; they are reported, and only gated when
+--micro-threshold is given.
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import platform
+import sys
+import time
+
+from benchmarks.images import DEFAULT_FORMATS, DEFAULT_SIZES, build_corpus, parse_formats, parse_sizes
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+DEFAULT_OUTPUT = os.path.join(BENCH_DIR, "results", "latest.json")
+
+# Metric name suffix -> True when higher is better
+TRACKED = {
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "throughput_rps": True,
+    "error_rate": False,
+}
+# Compared as an absolute difference: any increase over the baseline fails
+ABSOLUTE = ("error_rate",)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ModelAPI /predict path.")
+    parser.add_argument("--app", default="app", help="Module exposing the FastAPI `app` (app or app_fixed)")
+    parser.add_argument("--micro", action=argparse.BooleanOptionalAction, default=True,
+                        help="Run decode/preprocess/inference/encoding micro-benchmarks")
+    parser.add_argument("--load", action=argparse.BooleanOptionalAction, default=True,
+                        help="Run the in-process load generator against /predict")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=64, help="Requests per concurrency level")
+    parser.add_argument("--corpus", type=int, default=24, help="Number of distinct synthetic images")
+    parser.add_argument("--sizes", type=parse_sizes, default=DEFAULT_SIZES, help="e.g. 640x480,4032x3024")
+    parser.add_argument("--formats", type=parse_formats, default=DEFAULT_FORMATS, help="e.g. jpeg,png,webp")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--repeat", type=int, default=20, help="Timed runs per micro-benchmark")
+    parser.add_argument("--batch-sizes", default="1,8", help="Batch sizes for the inference micro-benchmark")
+    parser.add_argument("--cache", action="store_true",
+                        help="Leave the prediction cache on (off by default so every request does real work)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Allowed relative regression of load metrics against the baseline (0.10 = 10%%)")
+    parser.add_argument("--micro-threshold", type=float, default=None,
+                        help="Also gate micro-benchmarks at this relative regression (default: report only)")
+    parser.add_argument("--update-baseline", action="store_true", help="Write these results as the new baseline")
+    return parser.parse_args(argv)
+
+
+def environment():
+    info = {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()}
+    try:
+        import torch
+        info["torch"] = torch.__version__
+        info["torch_threads"] = torch.get_num_threads()
+    except ImportError:
+        pass
+    try:
+        import ultralytics
+        info["ultralytics"] = ultralytics.__version__
+    except ImportError:
+        pass
+    return info
+
+
+def flatten(results):
+    """{"load.c4.p95_ms": value, ...} for every tracked metric."""
+    flat = {}
+    for section in ("micro", "load"):
+        for name, metrics in results.get(section, {}).items():
+            for metric, value in metrics.items():
+                if metric in TRACKED:
+                    flat[f"{section}.{name}.{metric}"] = value
+    return flat
+
+
+def compare(current, baseline, threshold, micro_threshold=None):
+    """Returns (rows, regressions) comparing every metric present in both result sets.
+
+    Error rates change by their absolute difference and regress on any
+    increase. Micro metrics only regress when ``micro_threshold`` is given.
+    """
+    rows = []
+    regressions = []
+    current_flat = flatten(current)
+    baseline_flat = flatten(baseline)
+    for key in sorted(set(current_flat) & set(baseline_flat)):
+        old, new = baseline_flat[key], current_flat[key]
+        metric = key.rsplit(".", 1)[1]
+        if metric in ABSOLUTE:
+            change = new - old
+            regressed = change > 0
+        else:
+            if not old:
+                continue
+            higher_is_better = TRACKED[metric]
+            change = (new - old) / old
+            limit = micro_threshold if key.startswith("micro.") else threshold
+            regressed = limit is not None and (-change if higher_is_better else change) > limit
+        rows.append((key, old, new, change, regressed))
+        if regressed:
+            regressions.append(key)
+    return rows, regressions
+
+
+def print_comparison(rows):
+    width = max((len(row[0]) for row in rows), default=10)
+    print(f"{'metric':<{width}}  {'baseline':>10}  {'current':>10}  {'change':>8}")
+    for key, old, new, change, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{key:<{width}}  {old:>10.2f}  {new:>10.2f}  {change:>+7.1%}{flag}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.cache:
+        os.environ["CACHE_MAX_ENTRIES"] = "0"
+    # Lossless 12 MP synthetic images can exceed the default 20 MB upload cap
+    os.environ.setdefault("MAX_UPLOAD_BYTES", str(64 * 1024 * 1024))
+
+    print(f"Building a corpus of {args.corpus} synthetic images...")
+    corpus = build_corpus(args.corpus, sizes=args.sizes, formats=args.formats)
+    app_module = importlib.import_module(args.app)
+
+    results = {
+        "meta": {
+            "app": args.app,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "imgsz": args.imgsz,
+            "corpus": args.corpus,
+            "sizes": ["%dx%d" % size for size in args.sizes],
+            "formats": list(args.formats),
+            "cache": args.cache,
+            "environment": environment(),
+        }
+    }
+
+    if args.micro:
+        if not hasattr(app_module, "infer_image"):
+            print(f"Skipping micro-benchmarks: {args.app} does not expose the app.py pipeline functions")
+        else:
+            from benchmarks.micro import run_micro
+            batch_sizes = [int(size) for size in args.batch_sizes.split(",")]
+            print("Running micro-benchmarks...")
+            results["micro"] = run_micro(app_module, corpus, args.imgsz, args.repeat, batch_sizes)
+            for name, timing in results["micro"].items():
+                print(f"  {name:<40} p50 {timing['p50_ms']:9.3f} ms   p95 {timing['p95_ms']:9.3f} ms")
+
+    if args.load:
+        from benchmarks.loadgen import run_load_levels
+        levels = [int(level) for level in args.concurrency.split(",")]
+        print(f"Running load at concurrency {levels}, {args.requests} requests each...")
+        results["load"] = asyncio.run(run_load_levels(app_module.app, corpus, levels, args.requests))
+        for name, load in results["load"].items():
+            print(f"  {name:<5} {load['throughput_rps']:8.2f} req/s   p50 {load['p50_ms']:8.1f} ms   "
+                  f"p95 {load['p95_ms']:8.1f} ms   p99 {load['p99_ms']:8.1f} ms   errors {load['error_rate']:.1%}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one.")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    rows, regressions = compare(results, baseline, args.threshold, args.micro_threshold)
+    print_comparison(rows)
+    if regressions:
+        print(f"{len(regressions)} metric(s) regressed against the baseline: {', '.join(regressions)}")
+        return 1
+    print("No regressions against the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,388 @@
+"""Offline bulk scoring of image archives with resumable checkpoints.
+
+Examples (run from the ModelAPI directory):
+
+    python bulk_score.py /data/orchard --output scores.jsonl
+    python bulk_score.py manifest.txt --output scores.sqlite --format sqlite --workers 8
+    python bulk_score.py /data/orchard --output scores_parquet --format parquet
+
+The input is a directory (walked recursively in sorted order) or a manifest
+(.txt with one path per line, or .csv with a 'path' column). Images are
+decoded by a pool of worker processes that stays --prefetch batches ahead of
+the model. Results are written incrementally. Every --flush-every images the
+output is flushed and a checkpoint is saved. Re-running the same command
+resumes after the last checkpoint. It refuses, unless --restart is given, to
+mix in results from different weights, or to resume when the images before
+the checkpoint are no longer the ones that were scored (files added, removed
+or renamed there would shift every later position). Each result carries its
+input position as "index".
+"""
+import argparse
+import collections
+import csv
+import hashlib
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import config
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("bulk_score")
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff")
+FORMATS = ("jsonl", "parquet", "sqlite")
+
+
+def iter_directory(root):
+    """Deterministic recursive listing, so a checkpoint's position means the same file on resume
+    as long as the files before it did not change (see ListingDigest)."""
+    for directory, subdirectories, filenames in os.walk(root):
+        subdirectories.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(directory, filename)
+
+
+def iter_manifest(manifest):
+    base = os.path.dirname(os.path.abspath(manifest))
+    with open(manifest, newline="") as f:
+        if manifest.lower().endswith(".csv"):
+            rows = (row["path"] for row in csv.DictReader(f))
+        else:
+            rows = (line.strip() for line in f)
+        for path in rows:
+            if path and not path.startswith("#"):
+                yield path if os.path.isabs(path) else os.path.join(base, path)
+
+
+def iter_inputs(source):
+    if os.path.isdir(source):
+        return iter_directory(source)
+    return iter_manifest(source)
+
+
+def decode_path(path, imgsz):
+    """Runs in a worker process: (path, image, error)."""
+    from ingest import decode_image
+
+    try:
+        with open(path, "rb") as f:
+            return path, decode_image(f.read(), imgsz), None
+    except Exception as decode_error:
+        return path, None, f"Could not load image: {type(decode_error).__name__}: {decode_error}"
+
+
+def prefetch(paths, pool, imgsz, window):
+    """Yields decode results in input order with at most ``window`` decodes outstanding."""
+    pending = collections.deque()
+    for path in paths:
+        pending.append(pool.submit(decode_path, path, imgsz))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+class ListingDigest:
+    """sha256 over the input paths scored so far, in order.
+
+    Stored in the checkpoint, it tells whether the first ``completed`` inputs
+    listed on resume are still exactly the images that were scored.
+    """
+
+    def __init__(self):
+        self._digest = hashlib.sha256()
+
+    def update(self, path):
+        self._digest.update(os.path.abspath(path).encode("utf-8", "surrogateescape") + b"\0")
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
+
+
+class Checkpoint:
+    """Progress marker stored next to the output and replaced atomically."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path) as f:
+            return json.load(f)
+
+    def save(self, state):
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class JsonlWriter:
+    def __init__(self, path, resume_state):
+        self.path = path
+        self._file = open(path, "ab")
+        # Anything past the checkpointed offset was written after the last checkpoint; drop it
+        offset = (resume_state or {}).get("output_offset")
+        if offset is not None:
+            self._file.truncate(offset)
+        elif resume_state is None:
+            self._file.truncate(0)
+        self._file.seek(0, os.SEEK_END)
+
+    def write(self, records, start_index):
+        self._file.write(b"".join(
+            json.dumps(dict(index=start_index + offset, **record), separators=(",", ":")).encode("utf-8") + b"\n"
+            for offset, record in enumerate(records)))
+
+    def flush(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return {"output_offset": self._file.tell()}
+
+    def close(self):
+        self._file.close()
+
+
+class SqliteWriter:
+    def __init__(self, path, resume_state):
+        self.connection = sqlite3.connect(path)
+        if resume_state is None:
+            self.connection.execute("DROP TABLE IF EXISTS results")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " idx INTEGER PRIMARY KEY, path TEXT NOT NULL, predictions TEXT, error TEXT)"
+        )
+        self.connection.commit()
+
+    def write(self, records, start_index):
+        # Keyed by input position, so rows redone after a crash replace their first attempt
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO results (idx, path, predictions, error) VALUES (?, ?, ?, ?)",
+            [
+                (start_index + offset, record["path"], json.dumps(record["predictions"]), record["error"])
+                for offset, record in enumerate(records)
+            ],
+        )
+
+    def flush(self):
+        self.connection.commit()
+        return {}
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+
+class ParquetWriter:
+    """Writes one part file per flush into the output directory (part-<first index>.parquet)."""
+
+    def __init__(self, path, resume_state):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise SystemExit("--format parquet requires the 'pyarrow' package")
+        self.directory = path
+        os.makedirs(path, exist_ok=True)
+        if resume_state is None:
+            for name in os.listdir(path):
+                if name.startswith("part-") and name.endswith(".parquet"):
+                    os.remove(os.path.join(path, name))
+        self._rows = []
+        self._start = None
+
+    def write(self, records, start_index):
+        if self._start is None:
+            self._start = start_index
+        self._rows.extend(records)
+
+    def flush(self):
+        if self._rows:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.table({
+                "index": list(range(self._start, self._start + len(self._rows))),
+                "path": [row["path"] for row in self._rows],
+                "predictions": [json.dumps(row["predictions"]) for row in self._rows],
+                "error": [row["error"] for row in self._rows],
+            })
+            target = os.path.join(self.directory, f"part-{self._start:012d}.parquet")
+            pq.write_table(table, target + ".tmp")
+            os.replace(target + ".tmp", target)
+        self._rows = []
+        self._start = None
+        return {}
+
+    def close(self):
+        self.flush()
+
+
+WRITERS = {"jsonl": JsonlWriter, "sqlite": SqliteWriter, "parquet": ParquetWriter}
+
+
+def load_model(weights, backend, precision, imgsz):
+    from ultralytics import YOLO
+
+    from backends import load_backend
+    from cache import file_sha256
+
+    checksum = file_sha256(weights)
+    model = YOLO(weights)
+    model, backend_info = load_backend(
+        model, weights, checksum, backend, precision, imgsz,
+        export_dir=config.BACKEND_EXPORT_DIR,
+        calibration_data=config.BACKEND_CALIBRATION_DATA,
+        parity_samples_dir=config.BACKEND_PARITY_SAMPLES_DIR,
+        parity_sample_count=config.BACKEND_PARITY_SAMPLE_COUNT,
+        parity_tolerance=config.BACKEND_PARITY_TOLERANCE,
+        parity_min_agreement=config.BACKEND_PARITY_MIN_AGREEMENT,
+    )
+    return model, checksum, backend_info
+
+
+def score_batch(model, decoded, imgsz, top_k, min_confidence):
+    """Runs one batched predict over the decodable images; records keep input order."""
+    from encoding import encode_result, render_predictions
+
+    images = [image for _, image, error in decoded if error is None]
+    results = iter(model.predict(source=images, imgsz=imgsz, verbose=False) if images else [])
+    records = []
+    for path, image, error in decoded:
+        if error is not None:
+            records.append({"path": path, "predictions": [], "error": error})
+            continue
+        encoded = encode_result(next(results))
+        limit = top_k if top_k is not None or encoded.task != "classify" else config.CLASSIFY_TOP_K
+        records.append({"path": path, "predictions": render_predictions(encoded, limit, min_confidence),
+                        "error": None})
+    return records
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-score a directory or manifest of images with the YOLO model.")
+    parser.add_argument("input", help="Directory of images, or a .txt/.csv manifest")
+    parser.add_argument("--output", required=True, help="JSONL file, SQLite database or Parquet directory")
+    parser.add_argument("--format", choices=FORMATS, help="Output format (default: from the output extension)")
+    parser.add_argument("--model", default=config.MODEL_PATH, help="Weights to score with")
+    parser.add_argument("--backend", default=config.MODEL_BACKEND, help="pytorch, onnx, openvino or torchscript")
+    parser.add_argument("--precision", default=config.MODEL_PRECISION)
+    parser.add_argument("--imgsz", type=int, default=config.IMGSZ)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help="Decode processes")
+    parser.add_argument("--prefetch", type=int, default=4, help="Batches decoded ahead of the model")
+    parser.add_argument("--flush-every", type=int, default=1024, help="Images between checkpoints")
+    parser.add_argument("--top-k", type=int, default=None)
+    parser.add_argument("--conf", type=float, default=None, help="Drop predictions scoring below this")
+    parser.add_argument("--limit", type=int, default=None, help="Stop after this many images (for trial runs)")
+    parser.add_argument("--restart", action="store_true", help="Ignore any checkpoint and start over")
+    return parser.parse_args(argv)
+
+
+def output_format(args):
+    if args.format:
+        return args.format
+    extension = os.path.splitext(args.output)[1].lower()
+    if extension in (".sqlite", ".sqlite3", ".db"):
+        return "sqlite"
+    if extension == ".parquet" or os.path.isdir(args.output):
+        return "parquet"
+    return "jsonl"
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    fmt = output_format(args)
+    checkpoint = Checkpoint(args.output.rstrip(os.sep) + ".checkpoint.json")
+
+    # Start the decode pool before torch spins up its threads
+    pool = ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn"))
+    model, checksum, backend_info = load_model(args.model, args.backend, args.precision, args.imgsz)
+
+    state = None if args.restart else checkpoint.load()
+    if state is not None:
+        if state.get("input") != os.path.abspath(args.input) or state.get("format") != fmt:
+            raise SystemExit(f"Checkpoint {checkpoint.path} belongs to a different run; use --restart")
+        if state.get("model_sha256") != checksum:
+            raise SystemExit(f"Checkpoint {checkpoint.path} was made with different weights; use --restart")
+        logger.info(f"Resuming after {state['completed']} images")
+    completed = state["completed"] if state else 0
+
+    paths = iter_inputs(args.input)
+    listing = ListingDigest()
+    if completed:
+        for path in itertools.islice(paths, completed):
+            listing.update(path)
+        if listing.hexdigest() != state.get("listing_sha256"):
+            raise SystemExit(f"The first {completed} inputs are no longer the images checkpoint {checkpoint.path} "
+                             "scored (files were added, removed or renamed before it); use --restart")
+
+    writer = WRITERS[fmt](args.output, state)
+    if args.limit is not None:
+        paths = itertools.islice(paths, args.limit)
+    decoded = prefetch(paths, pool, args.imgsz, window=args.batch_size * max(1, args.prefetch))
+
+    started = time.perf_counter()
+    scored = 0
+    since_flush = 0
+    try:
+        while True:
+            chunk = list(itertools.islice(decoded, args.batch_size))
+            if not chunk:
+                break
+            records = score_batch(model, chunk, args.imgsz, args.top_k, args.conf)
+            writer.write(records, completed)
+            for record in records:
+                listing.update(record["path"])
+            completed += len(records)
+            scored += len(records)
+            since_flush += len(records)
+            if since_flush >= args.flush_every:
+                save_checkpoint(checkpoint, writer, args, fmt, checksum, backend_info, completed, listing)
+                since_flush = 0
+                rate = scored / (time.perf_counter() - started)
+                logger.info(f"{completed} images scored ({rate:.1f} images/s this run)")
+        save_checkpoint(checkpoint, writer, args, fmt, checksum, backend_info, completed, listing, finished=True)
+    finally:
+        writer.close()
+        pool.shutdown(cancel_futures=True)
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"Done: {scored} images in {elapsed:.1f}s ({scored / elapsed if elapsed else 0:.1f} images/s), "
+                f"{completed} in total, results in {args.output}")
+    return 0
+
+
+def save_checkpoint(checkpoint, writer, args, fmt, checksum, backend_info, completed, listing, finished=False):
+    state = {
+        "input": os.path.abspath(args.input),
+        "format": fmt,
+        "model_sha256": checksum,
+        "backend": backend_info["backend"],
+        "completed": completed,
+        "listing_sha256": listing.hexdigest(),
+        "finished": finished,
+        "updated_at": time.time(),
+    }
+    # Output first, checkpoint second: a crash in between only repeats work, never skips it
+    state.update(writer.flush())
+    checkpoint.save(state)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,19 @@
+def needs_escalation(encoded, min_confidence, min_margin):
+    """Why a low-resolution answer should not be trusted, or None to keep it.
+
+    Scores are sorted highest first, so for classification ``scores[:2]`` are
+    the top-1 and top-2 probabilities (what ``probs.top5conf`` starts with).
+    """
+    scores = encoded.scores
+    if encoded.task == "classify":
+        if not len(scores) or scores[0] < min_confidence:
+            return "low_confidence"
+        if len(scores) > 1 and scores[0] - scores[1] < min_margin:
+            return "ambiguous"
+        return None
+    if not len(scores):
+        # Small lesions are the first thing to disappear at low resolution
+        return "no_detections"
+    if scores[-1] < min_confidence:
+        return "low_confidence"
+    return None
@@ -0,0 +1,221 @@
+import os
+
+# Runtime settings are read from environment variables so they can be tuned
+# per container (docker-compose / Dockerfile) without code changes.
+
+
+def env_int(name, default):
+    value = os.environ.get(name)
+    if value is None or value.strip() == "":
+        return default
+    return int(value)
+
+
+def env_float(name, default):
+    value = os.environ.get(name)
+    if value is None or value.strip() == "":
+        return default
+    return float(value)
+
+
+def env_bool(name, default):
+    value = os.environ.get(name)
+    if value is None or value.strip() == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def env_str(name, default):
+    value = os.environ.get(name)
+    if value is None or value.strip() == "":
+        return default
+    return value.strip()
+
+
+def env_int_list(name, default):
+    value = os.environ.get(name)
+    if value is None or value.strip() == "":
+        return default
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+MODEL_PATH = env_str("MODEL_PATH", "best.pt")
+IMGSZ = env_int("IMGSZ", 640)
+
+# Model artifact store: with MODEL_STORE_DIR set (the model-data volume in
+# docker-compose) the weights are served from there, verified against
+# MODEL_SHA256 when given. A missing artifact, or one that differs from
+# MODEL_PATH, is seeded from MODEL_PATH; without a MODEL_PATH file it is,
+# unless MODEL_OFFLINE is set, downloaded from MODEL_URL (Google Drive links
+# need gdown). Without a store MODEL_PATH is loaded in place.
+MODEL_STORE_DIR = env_str("MODEL_STORE_DIR", None)
+MODEL_SHA256 = env_str("MODEL_SHA256", None)
+MODEL_URL = env_str("MODEL_URL", None)
+MODEL_OFFLINE = env_bool("MODEL_OFFLINE", False)
+
+# Model versions: the startup model is registered as MODEL_VERSION. More
+# versions can be loaded, swapped in, split or shadowed at runtime through
+# /admin/models and /admin/traffic. Those endpoints are disabled unless
+# ADMIN_TOKEN is set, and then require it in the X-Admin-Token header. Version
+# names may only use letters, digits, ".", "_" and "-". Shadow copies of a
+# request are dropped while a shadow version already has SHADOW_MAX_QUEUE
+# images waiting.
+MODEL_VERSION = env_str("MODEL_VERSION", "v1")
+ADMIN_TOKEN = env_str("ADMIN_TOKEN", None)
+SHADOW_MAX_QUEUE = env_int("SHADOW_MAX_QUEUE", 16)
+
+# Micro-batching: concurrent /predict requests are grouped for up to
+# BATCH_MAX_WAIT_MS (or until BATCH_MAX_SIZE images are waiting) and run
+# through a single model.predict call. A version's model runs one call at a
+# time, whatever the size.
+BATCH_MAX_SIZE = env_int("BATCH_MAX_SIZE", 8)
+BATCH_MAX_WAIT_MS = env_float("BATCH_MAX_WAIT_MS", 10.0)
+
+# Cascade inference (per request with cascade=true, or for every request with
+# CASCADE_BY_DEFAULT): the image is first run at CASCADE_IMGSZ and only goes on
+# to a full IMGSZ pass when that answer is unsure. For classification that
+# means a top-1 probability below CASCADE_MIN_CONFIDENCE or within
+# CASCADE_MIN_MARGIN of the runner-up; for detection, no boxes or any box
+# scoring below CASCADE_MIN_CONFIDENCE. CASCADE_IMGSZ=0 turns cascading off.
+CASCADE_BY_DEFAULT = env_bool("CASCADE_BY_DEFAULT", False)
+CASCADE_IMGSZ = env_int("CASCADE_IMGSZ", 320)
+CASCADE_MIN_CONFIDENCE = env_float("CASCADE_MIN_CONFIDENCE", 0.6)
+CASCADE_MIN_MARGIN = env_float("CASCADE_MIN_MARGIN", 0.2)
+
+# The model loads in the background after startup, then runs WARMUP_ITERATIONS
+# predictions on synthetic images for every size in WARMUP_SIZES (default:
+# IMGSZ and CASCADE_IMGSZ) and batch size in WARMUP_BATCH_SIZES. /readyz only
+# reports ready after that.
+WARMUP_SIZES = env_int_list("WARMUP_SIZES", sorted({IMGSZ, CASCADE_IMGSZ} - {0}))
+WARMUP_BATCH_SIZES = env_int_list("WARMUP_BATCH_SIZES", [1, BATCH_MAX_SIZE])
+WARMUP_ITERATIONS = env_int("WARMUP_ITERATIONS", 2)
+
+# Blocking work (decode, model.predict) runs on INFERENCE_WORKERS threads.
+# Up to INFERENCE_WORKERS + INFERENCE_MAX_QUEUE requests are admitted; the
+# rest get a 503 with a Retry-After of RETRY_AFTER_SECONDS.
+INFERENCE_WORKERS = env_int("INFERENCE_WORKERS", 2)
+INFERENCE_MAX_QUEUE = env_int("INFERENCE_MAX_QUEUE", 32)
+RETRY_AFTER_SECONDS = env_int("RETRY_AFTER_SECONDS", 1)
+
+# Largest accepted image upload. Request bodies on the upload endpoints are
+# capped at this plus MULTIPART_OVERHEAD_BYTES while they stream in.
+MAX_UPLOAD_BYTES = env_int("MAX_UPLOAD_BYTES", 20 * 1024 * 1024)
+MULTIPART_OVERHEAD_BYTES = env_int("MULTIPART_OVERHEAD_BYTES", 64 * 1024)
+
+# Prediction cache keyed by image bytes + model + inference parameters.
+# CACHE_MAX_ENTRIES=0 disables it.
+CACHE_MAX_ENTRIES = env_int("CACHE_MAX_ENTRIES", 1024)
+CACHE_MAX_BYTES = env_int("CACHE_MAX_BYTES", 16 * 1024 * 1024)
+CACHE_TTL_SECONDS = env_float("CACHE_TTL_SECONDS", 3600.0)
+
+# Inference runtime: "pytorch" serves MODEL_PATH directly; "onnx", "openvino"
+# and "torchscript" export it once (cached next to the weights, keyed by the
+# weights checksum) and serve the export after a parity check against PyTorch.
+# MODEL_PRECISION may be "fp16" or "int8" with openvino only (INT8 calibrates
+# on BACKEND_CALIBRATION_DATA); other combinations serve PyTorch fp32 and
+# report why in /stats/backend.
+# onnxruntime / openvino are not in requirements.txt; install the one you use.
+# The parity check runs on BACKEND_PARITY_SAMPLES_DIR images, or on synthetic
+# ones when unset; if no sample gives a clear top-1 the export is not served.
+MODEL_BACKEND = env_str("MODEL_BACKEND", "pytorch").lower()
+MODEL_PRECISION = env_str("MODEL_PRECISION", "fp32").lower()
+BACKEND_EXPORT_DIR = env_str("BACKEND_EXPORT_DIR", None)
+BACKEND_CALIBRATION_DATA = env_str("BACKEND_CALIBRATION_DATA", None)
+BACKEND_PARITY_SAMPLES_DIR = env_str("BACKEND_PARITY_SAMPLES_DIR", None)
+BACKEND_PARITY_SAMPLE_COUNT = env_int("BACKEND_PARITY_SAMPLE_COUNT", 8)
+BACKEND_PARITY_TOLERANCE = env_float("BACKEND_PARITY_TOLERANCE", 0.02)
+BACKEND_PARITY_MIN_AGREEMENT = env_float("BACKEND_PARITY_MIN_AGREEMENT", 1.0)
+
+# Observability: DEBUG_INTROSPECTION logs per-request result structure (dir()
+# of results, class maps) at DEBUG level; keep it off in production.
+# SLOW_REQUEST_LOG_SIZE slowest requests of the last SLOW_REQUEST_WINDOW_SECONDS
+# are kept with their stage breakdown for GET /stats/slow.
+DEBUG_INTROSPECTION = env_bool("DEBUG_INTROSPECTION", False)
+SLOW_REQUEST_LOG_SIZE = env_int("SLOW_REQUEST_LOG_SIZE", 20)
+SLOW_REQUEST_WINDOW_SECONDS = env_float("SLOW_REQUEST_WINDOW_SECONDS", 300.0)
+
+# Classification responses list the CLASSIFY_TOP_K most likely classes unless
+# the request passes top_k; detection responses list every box by default.
+CLASSIFY_TOP_K = env_int("CLASSIFY_TOP_K", 5)
+
+# POST /predict/batch: at most BATCH_ENDPOINT_MAX_FILES images (files or zip
+# members) per request, request bodies up to MAX_BATCH_REQUEST_BYTES, and
+# BATCH_ENDPOINT_CONCURRENCY images read, decoded or in the batcher at once. A
+# batch request takes that many slots of the INFERENCE_WORKERS +
+# INFERENCE_MAX_QUEUE admission limit. The parsed request body itself is held
+# until the response is over: file parts up to MAX_UPLOAD_BYTES in memory,
+# larger parts (a zip archive) spooled to a temporary file.
+BATCH_ENDPOINT_MAX_FILES = env_int("BATCH_ENDPOINT_MAX_FILES", 256)
+MAX_BATCH_REQUEST_BYTES = env_int("MAX_BATCH_REQUEST_BYTES", 512 * 1024 * 1024)
+BATCH_ENDPOINT_CONCURRENCY = env_int("BATCH_ENDPOINT_CONCURRENCY", 16)
+
+# Tiled inference (opt-in per request with tiled=true; detection models only):
+# the image is decoded at up to TILE_MAX_PIXELS and cut into TILE_SIZE tiles
+# overlapping by the TILE_OVERLAP fraction, which go through the batcher
+# TILE_BATCH_SIZE at a time. Tiles whose pixel standard deviation is below
+# TILE_MIN_STD are skipped as empty. Detections from all tiles, plus one
+# whole-image pass for objects larger than a tile when TILE_FULL_IMAGE is on,
+# are merged with class-aware NMS at TILE_NMS_IOU.
+TILE_SIZE = env_int("TILE_SIZE", IMGSZ)
+TILE_OVERLAP = env_float("TILE_OVERLAP", 0.2)
+TILE_BATCH_SIZE = env_int("TILE_BATCH_SIZE", BATCH_MAX_SIZE)
+TILE_MIN_STD = env_float("TILE_MIN_STD", 4.0)
+TILE_NMS_IOU = env_float("TILE_NMS_IOU", 0.5)
+TILE_FULL_IMAGE = env_bool("TILE_FULL_IMAGE", True)
+TILE_MAX_PIXELS = env_int("TILE_MAX_PIXELS", 48 * 1000 * 1000)
+
+# WebSocket /stream: at most STREAM_MAX_CONNECTIONS streams at once. A frame
+# whose 32x32 grayscale thumbnail differs from the last inferred frame by less
+# than STREAM_DEDUP_THRESHOLD (mean absolute difference on the 0-255 scale) is
+# answered with that frame's result; 0 disables deduplication. Reported frame
+# rates are averaged over STREAM_FPS_WINDOW_SECONDS.
+STREAM_MAX_CONNECTIONS = env_int("STREAM_MAX_CONNECTIONS", 16)
+STREAM_DEDUP_THRESHOLD = env_float("STREAM_DEDUP_THRESHOLD", 3.0)
+STREAM_FPS_WINDOW_SECONDS = env_float("STREAM_FPS_WINDOW_SECONDS", 5.0)
+
+# serve.py, the prefork server: SERVE_WORKERS processes (0 = one per inference
+# core, see below) serve SERVE_HOST:SERVE_PORT from one shared listening
+# socket and share the model the parent loaded. Workers keep their own
+# registry, cache and metrics: with more than one, each /metrics scrape only
+# sees the worker that answered it, and the admin API is disabled.
+SERVE_HOST = env_str("SERVE_HOST", "0.0.0.0")
+SERVE_PORT = env_int("SERVE_PORT", 8000)
+SERVE_WORKERS = env_int("SERVE_WORKERS", 1)
+
+# CPU plan (cpu_plan.py), made once the first model is loaded. Usable cores are
+# the CPU affinity mask cut down to the cgroup CPU quota. CPU_DECODE_CPUS of
+# them are kept for decoding (-1 = a quarter when there are at least 4). The
+# rest are shared out among the serving processes. Each process runs the
+# fewest torch intra-op threads within CPU_BENCHMARK_TOLERANCE of the fastest
+# in a short self-benchmark (CPU_BENCHMARK_ITERATIONS timed predictions per
+# thread count). CPU_INTRA_OP_THREADS > 0 skips the benchmark and sets the
+# count. CPU_PIN=1 pins inference threads to their cores and decode threads
+# to the decode cores.
+CPU_INTRA_OP_THREADS = env_int("CPU_INTRA_OP_THREADS", 0)
+CPU_INTEROP_THREADS = env_int("CPU_INTEROP_THREADS", 1)
+CPU_DECODE_CPUS = env_int("CPU_DECODE_CPUS", -1)
+CPU_PIN = env_bool("CPU_PIN", False)
+CPU_BENCHMARK = env_bool("CPU_BENCHMARK", True)
+CPU_BENCHMARK_ITERATIONS = env_int("CPU_BENCHMARK_ITERATIONS", 3)
+CPU_BENCHMARK_TOLERANCE = env_float("CPU_BENCHMARK_TOLERANCE", 0.1)
+
+# Asynchronous jobs (jobs.py): POST /jobs stores the image in the SQLite
+# database at JOBS_DB_PATH (unset by default, which disables the job API;
+# docker-compose keeps it on the job-data volume) and answers 202 with a
+# job id. JOBS_WORKERS tasks per process run queued jobs; at most
+# JOBS_MAX_QUEUED may wait, beyond that submissions get a 503. GET /jobs/{id}
+# long-polls for up to JOBS_MAX_WAIT_SECONDS. A job left running for
+# JOBS_STALE_SECONDS (its worker died) is run again, up to JOBS_MAX_ATTEMPTS
+# times. Every JOBS_EVICT_INTERVAL_SECONDS, finished jobs older than
+# JOBS_TTL_SECONDS are deleted, then the oldest until results fit in
+# JOBS_MAX_BYTES.
+JOBS_DB_PATH = env_str("JOBS_DB_PATH", None)
+JOBS_WORKERS = env_int("JOBS_WORKERS", 2)
+JOBS_MAX_QUEUED = env_int("JOBS_MAX_QUEUED", 1000)
+JOBS_MAX_WAIT_SECONDS = env_float("JOBS_MAX_WAIT_SECONDS", 30.0)
+JOBS_POLL_SECONDS = env_float("JOBS_POLL_SECONDS", 0.5)
+JOBS_STALE_SECONDS = env_float("JOBS_STALE_SECONDS", 600.0)
+JOBS_MAX_ATTEMPTS = env_int("JOBS_MAX_ATTEMPTS", 3)
+JOBS_TTL_SECONDS = env_float("JOBS_TTL_SECONDS", 24 * 3600.0)
+JOBS_MAX_BYTES = env_int("JOBS_MAX_BYTES", 256 * 1024 * 1024)
+JOBS_EVICT_INTERVAL_SECONDS = env_float("JOBS_EVICT_INTERVAL_SECONDS", 60.0)
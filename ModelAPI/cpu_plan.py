@@ -0,0 +1,230 @@
+import json
+import logging
+import os
+import statistics
+import time
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+CGROUP_V2_CPU_MAX = "/sys/fs/cgroup/cpu.max"
+CGROUP_V1_CPU_DIRS = ("/sys/fs/cgroup/cpu", "/sys/fs/cgroup/cpu,cpuacct")
+
+
+def cgroup_cpu_quota():
+    """CPUs granted by the cgroup CPU quota (docker --cpus, Kubernetes limits), or None when unlimited."""
+    try:
+        with open(CGROUP_V2_CPU_MAX) as f:
+            quota, period = f.read().split()[:2]
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    for directory in CGROUP_V1_CPU_DIRS:
+        try:
+            with open(os.path.join(directory, "cpu.cfs_quota_us")) as f:
+                quota = int(f.read())
+            with open(os.path.join(directory, "cpu.cfs_period_us")) as f:
+                period = int(f.read())
+        except (OSError, ValueError):
+            continue
+        return quota / period if quota > 0 and period > 0 else None
+    return None
+
+
+def affinity_cpus():
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+
+def usable_cpus():
+    """(cpus, quota): the cores this process may run on, cut down to what the quota pays for.
+
+    A quota of 2.5 CPUs on a 16-core node gives 2 cores. More threads than
+    that only get throttled by the scheduler.
+    """
+    cpus = affinity_cpus()
+    quota = cgroup_cpu_quota()
+    if quota is not None:
+        cpus = cpus[:max(1, min(len(cpus), int(quota)))]
+    return cpus, quota
+
+
+def split_cpus(cpus, decode_cpus=-1):
+    """(inference, decode) cores; -1 reserves a quarter of cpus for decoding once there are at least four."""
+    reserve = decode_cpus if decode_cpus >= 0 else (len(cpus) // 4 if len(cpus) >= 4 else 0)
+    reserve = min(reserve, len(cpus) - 1)
+    return cpus[:len(cpus) - reserve], cpus[len(cpus) - reserve:]
+
+
+def pin_thread(cpus):
+    """Restricts the calling thread (and the threads it starts later) to cpus; a no-op for an empty list."""
+    if not cpus:
+        return
+    try:
+        os.sched_setaffinity(0, cpus)
+    except (AttributeError, OSError) as pin_error:
+        logger.warning(f"Could not pin thread to CPUs {cpus}: {pin_error}")
+
+
+def set_interop_threads(threads):
+    """Sets torch's inter-op pool size; only possible before any inter-op work. Returns the size in effect."""
+    if threads > 0:
+        try:
+            torch.set_num_interop_threads(threads)
+        except RuntimeError as interop_error:
+            logger.warning(f"Could not set inter-op threads to {threads}: {interop_error}")
+    return torch.get_num_interop_threads()
+
+
+def thread_candidates(limit):
+    """1, 2, 4, ... up to limit, plus limit itself."""
+    candidates = []
+    threads = 1
+    while threads < limit:
+        candidates.append(threads)
+        threads *= 2
+    candidates.append(max(1, limit))
+    return candidates
+
+
+def benchmark_threads(run, candidates, iterations=3, isolated=False):
+    """Median seconds per ``run()`` call at each intra-op thread count.
+
+    With ``isolated`` the measurement runs in a forked child process, so this
+    process never starts an OpenMP pool. serve.py's parent needs that: a pool
+    started before fork() leaves the forked workers hanging in their first
+    parallel region.
+    """
+    if isolated:
+        timings = run_in_child(lambda: benchmark_threads(run, candidates, iterations))
+        return {int(threads): seconds for threads, seconds in timings.items()}
+    previous = torch.get_num_threads()
+    timings = {}
+    try:
+        for threads in candidates:
+            torch.set_num_threads(threads)
+            # The first call at a new thread count grows the pool
+            run()
+            samples = []
+            for _ in range(max(1, iterations)):
+                started = time.perf_counter()
+                run()
+                samples.append(time.perf_counter() - started)
+            timings[threads] = statistics.median(samples)
+    finally:
+        torch.set_num_threads(previous)
+    return timings
+
+
+def run_in_child(fn):
+    """Runs fn() in a forked child process and returns its result, which must be JSON-serializable.
+
+    Whatever fn starts (OpenMP pools, runtime threads) ends with the child, so
+    this process can still fork workers afterwards.
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            os.close(read_fd)
+            with os.fdopen(write_fd, "w") as f:
+                json.dump(fn(), f)
+        except BaseException:
+            logger.exception("Child process failed")
+            code = 1
+        finally:
+            os._exit(code)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        output = f.read()
+    _, status = os.waitpid(pid, 0)
+    if status != 0 or not output:
+        raise RuntimeError(f"Child process exited with status {status}")
+    return json.loads(output)
+
+
+def choose_threads(timings, tolerance=0.1):
+    """The fewest threads within ``tolerance`` of the fastest time. Extra threads that buy
+    less than that only take cores away from decoding and the other workers."""
+    fastest = min(timings.values())
+    return min(threads for threads, seconds in timings.items() if seconds <= fastest * (1.0 + tolerance))
+
+
+class CpuPlan:
+    """How the serving processes share the cores.
+
+    The usable cores are split into ``decode_cpus``, shared by every worker for
+    decoding and request handling, and the inference cores. Each worker gets an
+    equal slice of the inference cores as ``worker_cpus[worker]`` and runs
+    ``intra_op`` torch threads. With ``pin`` set, threads are kept on their
+    cores. Otherwise the cores only size the thread pools, and the scheduler
+    places threads freely.
+    """
+
+    def __init__(self, cpus, quota, workers, intra_op, inter_op, worker_cpus, decode_cpus, pin,
+                 source, benchmark=None):
+        self.cpus = cpus
+        self.quota = quota
+        self.workers = workers
+        self.intra_op = intra_op
+        self.inter_op = inter_op
+        self.worker_cpus = worker_cpus
+        self.decode_cpus = decode_cpus
+        self.pin = pin
+        self.source = source
+        self.benchmark = benchmark or {}
+
+    def inference_cpus(self, worker=0):
+        return self.worker_cpus[worker % len(self.worker_cpus)]
+
+    def describe(self, worker=0):
+        return {
+            "source": self.source,
+            "usable_cpus": len(self.cpus),
+            "affinity_cpus": len(affinity_cpus()),
+            "cgroup_quota": self.quota,
+            "workers": self.workers,
+            "intra_op_threads": self.intra_op,
+            "inter_op_threads": self.inter_op,
+            "pinned": self.pin,
+            "inference_cpus": self.inference_cpus(worker),
+            "decode_cpus": self.decode_cpus,
+            "benchmark_seconds": {str(threads): seconds for threads, seconds in self.benchmark.items()},
+        }
+
+
+def plan_cpus(run=None, workers=1, intra_op=0, decode_cpus=-1, pin=False, iterations=3, tolerance=0.1,
+              isolated=False):
+    """Builds the CpuPlan for ``workers`` serving processes.
+
+    ``decode_cpus`` cores are reserved for decoding (see split_cpus). Cores
+    that do not divide evenly among the workers are added to the decode
+    cores, not to any one worker. An ``intra_op`` above 0 overrides the
+    thread count. Otherwise, when a worker has more than one core and ``run``
+    is given, the count comes from benchmarking ``run`` (one inference call)
+    at 1, 2, 4, ... threads up to the worker's share.
+    """
+    cpus, quota = usable_cpus()
+    inference, decode = split_cpus(cpus, decode_cpus)
+    share = max(1, len(inference) // workers)
+    worker_cpus = [[inference[(worker * share + offset) % len(inference)] for offset in range(share)]
+                   for worker in range(workers)]
+    # Cores left over after the equal shares go to decoding
+    decode = inference[share * workers:] + decode
+
+    benchmark = {}
+    if intra_op > 0:
+        source, threads = "override", intra_op
+    elif run is None or share == 1:
+        source, threads = "cores", share
+    else:
+        benchmark = benchmark_threads(run, thread_candidates(share), iterations, isolated)
+        source, threads = "benchmark", choose_threads(benchmark, tolerance)
+    plan = CpuPlan(cpus, quota, workers, threads, torch.get_num_interop_threads(), worker_cpus, decode, pin,
+                   source, benchmark)
+    logger.info(f"CPU plan: {plan.describe()}")
+    return plan
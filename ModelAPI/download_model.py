@@ -1,14 +1,19 @@
-import gdown
+import os
+
+import config
+from model_store import ModelStore
 from ultralytics import YOLO
 
-# Google Drive dosya linkini buraya ekle (dosya ID'sini kullan)
-url = 'https://drive.google.com/uc?id=1-e1j5cKvcRbElCDHqeqrndbyf9zo7Jmi'  # Model ID'si
-output = 'best.pt'  # İndirilen model dosyasının adı
+# Google Drive dosya linki (dosya ID'sini kullan); MODEL_URL ile değiştirilebilir
+url = config.MODEL_URL or 'https://drive.google.com/uc?id=1-e1j5cKvcRbElCDHqeqrndbyf9zo7Jmi'  # Model ID'si
+
+# Model, MODEL_STORE_DIR varsa oraya (docker-compose'daki model-data volume'u), yoksa MODEL_PATH'in yanına indirilir
+store = ModelStore(config.MODEL_STORE_DIR or os.path.dirname(os.path.abspath(config.MODEL_PATH)))
 
-# Google Drive'dan dosyayı indir
-gdown.download(url, output, quiet=False)
+# Dosya zaten varsa ve checksum (MODEL_SHA256) tutuyorsa tekrar indirilmez
+output, checksum = store.fetch(os.path.basename(config.MODEL_PATH), config.MODEL_SHA256, url=url)
 
 # Modeli yükle
 model = YOLO(output)  # İndirilen model dosyasını burada kullan
 
-print("Model başarıyla yüklendi!")
+print(f"Model başarıyla yüklendi! ({output}, sha256 {checksum})")
@@ -0,0 +1,113 @@
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:  # optional, only needed for format=msgpack
+    msgpack = None
+
+# msgpack is only offered (and negotiated from Accept) when the package is installed
+FORMATS = ("json", "columnar") + (("msgpack",) if msgpack is not None else ())
+MSGPACK_MEDIA_TYPE = "application/x-msgpack"
+
+
+class EncodedResult:
+    """One image's predictions as whole numpy arrays, sorted by score (highest first).
+
+    ``boxes`` holds normalized xyxy coordinates for detection results and is
+    None for classification. ``stage`` records which cascade pass produced the
+    result ("low" or "full"), if any. This is what the prediction cache
+    stores; top-k, thresholds and the wire format are applied per request
+    when rendering.
+    """
+
+    __slots__ = ("task", "names", "class_ids", "scores", "boxes", "stage")
+
+    def __init__(self, task, names, class_ids, scores, boxes=None, stage=None):
+        self.task = task
+        self.names = names
+        self.class_ids = class_ids
+        self.scores = scores
+        self.boxes = boxes
+        self.stage = stage
+
+    @property
+    def nbytes(self):
+        size = self.class_ids.nbytes + self.scores.nbytes
+        if self.boxes is not None:
+            size += self.boxes.nbytes
+        return size
+
+    def __len__(self):
+        return len(self.scores)
+
+
+def encode_result(result):
+    """Moves a YOLO result to the CPU once and keeps it as arrays."""
+    names = result.names
+    probs = getattr(result, "probs", None)
+    if probs is not None:
+        scores = probs.data.float().cpu().numpy()
+        order = np.argsort(-scores, kind="stable")
+        return EncodedResult("classify", names, order, scores[order])
+
+    boxes = getattr(result, "boxes", None)
+    if boxes is not None:
+        # boxes.data is (N, 6): x1, y1, x2, y2, conf, cls in pixels of the original image
+        data = boxes.data.float().cpu().numpy()
+        height, width = result.orig_shape[:2]
+        xyxyn = data[:, :4] / np.array([width, height, width, height], dtype=np.float32)
+        scores = data[:, 4]
+        order = np.argsort(-scores, kind="stable")
+        return EncodedResult("detect", names, data[order, 5].astype(np.int64), scores[order], xyxyn[order])
+
+    return EncodedResult(None, names, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+
+
+def select(encoded, top_k=None, min_confidence=None):
+    """Index of the predictions to return: those at or above min_confidence, at most top_k."""
+    count = len(encoded)
+    if min_confidence:
+        # Scores are sorted in descending order, so the kept ones are a prefix
+        count = int(np.searchsorted(-encoded.scores, -min_confidence, side="right"))
+    if top_k is not None and top_k >= 0:
+        count = min(count, top_k)
+    return slice(0, count)
+
+
+def class_names(encoded, keep):
+    names = encoded.names
+    return [names.get(class_id, str(class_id)) for class_id in encoded.class_ids[keep].tolist()]
+
+
+def render_predictions(encoded, top_k=None, min_confidence=None):
+    """Today's JSON schema: a list of {"class", "probability"} or {"class", "confidence", "box"}."""
+    keep = select(encoded, top_k, min_confidence)
+    classes = class_names(encoded, keep)
+    scores = encoded.scores[keep].tolist()
+    if encoded.boxes is None:
+        return [{"class": name, "probability": score} for name, score in zip(classes, scores)]
+    boxes = encoded.boxes[keep].tolist()
+    return [
+        {"class": name, "confidence": score, "box": box}
+        for name, score, box in zip(classes, scores, boxes)
+    ]
+
+
+def render_columnar(encoded, top_k=None, min_confidence=None):
+    """Compact form: parallel arrays instead of one object per prediction."""
+    keep = select(encoded, top_k, min_confidence)
+    columns = {
+        "task": encoded.task,
+        "classes": class_names(encoded, keep),
+        "class_ids": encoded.class_ids[keep].tolist(),
+        "scores": encoded.scores[keep].tolist(),
+    }
+    if encoded.boxes is not None:
+        columns["boxes"] = encoded.boxes[keep].tolist()
+    return columns
+
+
+def pack_msgpack(payload):
+    if msgpack is None:
+        raise RuntimeError("format=msgpack requires the 'msgpack' package to be installed")
+    return msgpack.packb(payload, use_bin_type=True)
@@ -0,0 +1,89 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class Overloaded(Exception):
+    """Raised when the admission queue is full; maps to a 503 + Retry-After."""
+
+    def __init__(self, retry_after):
+        super().__init__("Server is busy, please retry later.")
+        self.retry_after = retry_after
+
+
+class _Admission:
+    def __init__(self, executor, slots=1):
+        self._executor = executor
+        self.slots = slots
+        self._released = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+    def release(self):
+        # Streaming responses release after the handler returns, so this may be called outside a with block
+        if not self._released:
+            self._released = True
+            self._executor._release(self.slots)
+
+
+class InferenceExecutor:
+    """Bounded worker pool for blocking work (decoding, model.predict).
+
+    ``workers`` threads execute the blocking calls so the event loop stays free
+    for health checks and uploads. At most ``workers + max_queue`` requests are
+    admitted at once; beyond that ``admit()`` raises ``Overloaded`` right away
+    instead of letting latency pile up. A request that keeps several images in
+    flight (/predict/batch) is admitted for that many slots.
+    """
+
+    def __init__(self, workers=2, max_queue=32, retry_after=1, initializer=None):
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.retry_after = retry_after
+        self.capacity = self.workers + self.max_queue
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference",
+                                       initializer=initializer)
+        self._in_flight = 0
+        self._admitted = 0
+        self._rejected = 0
+
+    def admit(self, slots=1):
+        # Only touched from the event loop thread, so a plain counter is enough
+        if self._in_flight + slots > self.capacity:
+            self._rejected += 1
+            raise Overloaded(self.retry_after)
+        self._in_flight += slots
+        self._admitted += 1
+        return _Admission(self, slots)
+
+    def _release(self, slots=1):
+        self._in_flight -= slots
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    async def run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, functools.partial(fn, *args, **kwargs))
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False)
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "capacity": self.capacity,
+            "in_flight": self._in_flight,
+            "admitted": self._admitted,
+            "rejected": self._rejected,
+        }
@@ -0,0 +1,212 @@
+import functools
+import json
+import logging
+import os
+import zipfile
+from io import BytesIO
+
+import numpy as np
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK_SIZE = 1024 * 1024
+EXIF_ORIENTATION = 0x0112
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, max_bytes):
+        super().__init__(f"Upload exceeds the maximum allowed size of {max_bytes} bytes.")
+        self.max_bytes = max_bytes
+
+
+def keep_uploads_in_memory(max_bytes):
+    """Raises Starlette's multipart spool threshold so file parts up to max_bytes stay in memory.
+
+    By default any part over 1 MB is written to a temporary file while the
+    form is parsed, so a phone photo would go through the disk before
+    read_upload sees it. Parts larger than max_bytes are rejected anyway.
+    """
+    from starlette.formparsers import MultiPartParser
+
+    # Renamed from max_file_size to spool_max_size in newer Starlette releases
+    for attribute in ("spool_max_size", "max_file_size"):
+        if hasattr(MultiPartParser, attribute):
+            setattr(MultiPartParser, attribute, max(getattr(MultiPartParser, attribute), max_bytes))
+
+
+async def read_upload(upload_file, max_bytes):
+    """Reads an UploadFile in chunks, giving up as soon as it exceeds max_bytes."""
+    chunks = []
+    total = 0
+    while True:
+        chunk = await upload_file.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        total += len(chunk)
+        if max_bytes and total > max_bytes:
+            raise UploadTooLarge(max_bytes)
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def decode_image(contents, imgsz, max_pixels=None):
+    """Decodes image bytes once, straight into the HWC uint8 BGR array YOLO expects.
+
+    For JPEGs the decoder is asked for a reduced-size version (DCT scaling by
+    1/2, 1/4 or 1/8) whose sides are still at least ``imgsz``, so a 12 MP phone
+    photo is never materialised at full resolution only to be shrunk to 640
+    px. ``imgsz=None`` decodes at full resolution, downscaled to at most
+    ``max_pixels`` pixels when given. EXIF orientation is applied to match
+    what cv2.imread did for the old temp-file path.
+    """
+    with Image.open(BytesIO(contents)) as img:
+        source_size = img.size
+        if imgsz and img.format == "JPEG":
+            img.draft("RGB", (imgsz, imgsz))
+        elif max_pixels and source_size[0] * source_size[1] > max_pixels:
+            scale = (max_pixels / (source_size[0] * source_size[1])) ** 0.5
+            # thumbnail() also uses JPEG draft mode, so the full-size bitmap is never built
+            img.thumbnail((max(1, int(source_size[0] * scale)), max(1, int(source_size[1] * scale))))
+        # exif_transpose copies the image even when there is nothing to do
+        if img.getexif().get(EXIF_ORIENTATION, 1) != 1:
+            img = ImageOps.exif_transpose(img)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        rgb = np.asarray(img)
+    # RGB -> BGR; the copy also makes the array contiguous for OpenCV
+    image = np.ascontiguousarray(rgb[:, :, ::-1])
+    logger.debug(f"Decoded image {source_size} -> {image.shape[1]}x{image.shape[0]}")
+    return image
+
+
+class SeekableFile:
+    """Adds the seekable() that SpooledTemporaryFile lacks before Python 3.11, which zipfile needs."""
+
+    def __init__(self, file):
+        self._file = file
+
+    def seekable(self):
+        return True
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+def iter_zip_images(archive_file, max_member_bytes, max_members):
+    """Yields (name, read) for each file in a zip archive, where ``read()`` returns the member's bytes.
+
+    ``archive_file`` is the archive as bytes or as a seekable file (an upload's
+    spooled file). Members are only decompressed when read() is called, so the
+    caller decides how many are held at once. Directory entries and macOS
+    resource forks are skipped. read() raises UploadTooLarge for a member
+    larger than max_member_bytes (by its header, and again while reading in
+    case the header lies), so one bad entry does not fail the archive. At most
+    max_members files are yielded.
+    """
+    source = BytesIO(archive_file) if isinstance(archive_file, bytes) else SeekableFile(archive_file)
+    archive = zipfile.ZipFile(source)
+    count = 0
+    for info in archive.infolist():
+        name = info.filename
+        if info.is_dir() or name.startswith("__MACOSX/") or os.path.basename(name).startswith("._"):
+            continue
+        if count >= max_members:
+            break
+        count += 1
+        yield name, functools.partial(_read_member, archive, info, max_member_bytes)
+
+
+def _read_member(archive, info, max_bytes):
+    if max_bytes and info.file_size > max_bytes:
+        raise UploadTooLarge(max_bytes)
+    with archive.open(info) as member:
+        contents = member.read(max_bytes + 1 if max_bytes else -1)
+    if max_bytes and len(contents) > max_bytes:
+        raise UploadTooLarge(max_bytes)
+    return contents
+
+
+class MaxBodySizeMiddleware:
+    """Caps request bodies while they stream in, before multipart parsing buffers them.
+
+    ``limits`` maps a path to its byte limit; other paths use ``default``
+    (``None`` or 0 disables the check). Requests that declare a larger
+    Content-Length are rejected without reading the body; otherwise the body is
+    counted as it arrives and the response is replaced with a 413 once the
+    limit is crossed.
+    """
+
+    def __init__(self, app, default=None, limits=None):
+        self.app = app
+        self.default = default
+        self.limits = limits or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        max_bytes = self.limits.get(scope["path"], self.default)
+        if not max_bytes:
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope.get("headers", []):
+            if name == b"content-length":
+                try:
+                    declared = int(value)
+                except ValueError:
+                    break
+                if declared > max_bytes:
+                    await self._send_too_large(send, max_bytes)
+                    return
+                break
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    exceeded = True
+                    raise UploadTooLarge(max_bytes)
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            if exceeded:
+                # Whatever the app made of the aborted body, answer 413 instead
+                if message["type"] == "http.response.start" and not response_started:
+                    response_started = True
+                    await self._send_too_large(send, max_bytes)
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except UploadTooLarge:
+            if not response_started:
+                await self._send_too_large(send, max_bytes)
+
+    @staticmethod
+    async def _send_too_large(send, max_bytes):
+        body = json.dumps({
+            "predictions": [],
+            "error": str(UploadTooLarge(max_bytes)),
+        }).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("ascii")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,229 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATES = ("done", "failed")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    state TEXT NOT NULL,
+    filename TEXT,
+    params TEXT NOT NULL,
+    image BLOB,
+    result TEXT,
+    error TEXT,
+    size INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_state ON jobs (state, seq);
+CREATE INDEX IF NOT EXISTS jobs_by_finish ON jobs (finished_at) WHERE finished_at IS NOT NULL;
+"""
+
+
+class JobQueueFull(Exception):
+    def __init__(self, limit):
+        super().__init__(f"The job queue is full ({limit} jobs waiting), please retry later.")
+        self.limit = limit
+
+
+class JobStore:
+    """Asynchronous prediction jobs in one SQLite database, kept across restarts.
+
+    A job's image is stored with it while it is queued and dropped once the
+    job finishes, leaving only the result. Every method blocks, so the app
+    calls them off the event loop.
+
+    Several processes (serve.py's workers) can share the database. The WAL
+    journal lets readers proceed while one process writes, and ``claim``
+    takes the write lock before picking a job, so no job goes to two workers.
+    Each process opens its own connection on first use; a connection must not
+    cross a fork().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = None
+        self._pid = None
+
+    def _connection(self):
+        if self._db is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=30.0, isolation_level=None, check_same_thread=False)
+            # auto_vacuum only takes effect before the first table is created
+            db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            db.execute("PRAGMA journal_mode = WAL")
+            db.execute("PRAGMA synchronous = NORMAL")
+            db.executescript(SCHEMA)
+            self._db, self._pid = db, os.getpid()
+        return self._db
+
+    def _transaction(self, fn):
+        """Runs fn(db) holding SQLite's write lock, so check-then-update steps are atomic across processes."""
+        with self._lock:
+            db = self._connection()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(db)
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+            return result
+
+    def submit(self, filename, image, params, max_queued):
+        """Queues one image; returns the new job id, or raises JobQueueFull."""
+        job_id = uuid.uuid4().hex
+
+        def insert(db):
+            (queued,) = db.execute("SELECT COUNT(*) FROM jobs WHERE state = 'queued'").fetchone()
+            if queued >= max_queued:
+                raise JobQueueFull(max_queued)
+            db.execute(
+                "INSERT INTO jobs (id, state, filename, params, image, size, created_at) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, filename, json.dumps(params), image, len(image), time.time()))
+
+        self._transaction(insert)
+        return job_id
+
+    def claim(self, owner, stale_after, max_attempts):
+        """Marks the oldest waiting job as running for owner and returns it, or None when there is none.
+
+        Jobs left running for longer than ``stale_after`` seconds count as
+        abandoned by a crashed worker and are handed out again. A job that has
+        already been handed out ``max_attempts`` times fails instead, so an
+        image that keeps killing workers cannot block the queue.
+        """
+
+        def pick(db):
+            now = time.time()
+            while True:
+                row = db.execute(
+                    "SELECT id, filename, params, image, attempts, created_at FROM jobs "
+                    "WHERE state = 'queued' OR (state = 'running' AND started_at < ?) ORDER BY seq LIMIT 1",
+                    (now - stale_after,)).fetchone()
+                if row is None:
+                    return None
+                job_id, filename, params, image, attempts, created_at = row
+                if attempts >= max_attempts:
+                    error = f"Gave up after {attempts} attempts"
+                    db.execute(
+                        "UPDATE jobs SET state = 'failed', error = ?, image = NULL, size = ?, finished_at = ? "
+                        "WHERE id = ?", (error, len(error), now, job_id))
+                    logger.warning(f"Job {job_id}: {error}")
+                    continue
+                db.execute(
+                    "UPDATE jobs SET state = 'running', owner = ?, started_at = ?, attempts = attempts + 1 "
+                    "WHERE id = ?", (owner, now, job_id))
+                return {"id": job_id, "filename": filename, "params": json.loads(params), "image": image,
+                        "attempts": attempts + 1, "created_at": created_at}
+
+        return self._transaction(pick)
+
+    def complete(self, job_id, result):
+        body = json.dumps(result)
+        self._finish(job_id, "done", body, None, len(body))
+
+    def fail(self, job_id, error):
+        self._finish(job_id, "failed", None, error, len(error))
+
+    def _finish(self, job_id, state, result, error, size):
+        with self._lock:
+            self._connection().execute(
+                "UPDATE jobs SET state = ?, result = ?, error = ?, image = NULL, size = ?, finished_at = ? "
+                "WHERE id = ? AND state = 'running'",
+                (state, result, error, size, time.time(), job_id))
+
+    def requeue_abandoned(self, owner):
+        """Queues again the jobs that were running under another owner (an earlier server run); returns how many."""
+        with self._lock:
+            return self._connection().execute(
+                "UPDATE jobs SET state = 'queued', owner = NULL WHERE state = 'running' "
+                "AND (owner IS NULL OR owner != ?)", (owner,)).rowcount
+
+    def get(self, job_id):
+        """The job's status and, once done, its result; None for unknown (or evicted) jobs."""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT state, filename, result, error, attempts, created_at, started_at, finished_at "
+                "FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        state, filename, result, error, attempts, created_at, started_at, finished_at = row
+        return {
+            "job_id": job_id,
+            "state": state,
+            "filename": filename,
+            "attempts": attempts,
+            "created_at": created_at,
+            "started_at": started_at,
+            "finished_at": finished_at,
+            "result": json.loads(result) if result is not None else None,
+            "error": error,
+        }
+
+    def evict(self, ttl, max_bytes):
+        """Deletes finished jobs older than ttl, then the oldest ones until their results fit in max_bytes.
+
+        Queued and running jobs are never evicted. Returns the number of jobs deleted.
+        """
+
+        def delete(db):
+            removed = db.execute(
+                "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (time.time() - ttl,)).rowcount
+            (total,) = db.execute("SELECT COALESCE(SUM(size), 0) FROM jobs WHERE finished_at IS NOT NULL").fetchone()
+            if total > max_bytes:
+                cutoff = None
+                for finished_at, size in db.execute(
+                        "SELECT finished_at, size FROM jobs WHERE finished_at IS NOT NULL ORDER BY finished_at"):
+                    total -= size
+                    cutoff = finished_at
+                    if total <= max_bytes:
+                        break
+                removed += db.execute(
+                    "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at <= ?", (cutoff,)).rowcount
+            return removed
+
+        removed = self._transaction(delete)
+        if removed:
+            with self._lock:
+                # Hands the freed pages back to the file system
+                self._connection().execute("PRAGMA incremental_vacuum")
+        return removed
+
+    def stats(self):
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT state, COUNT(*), COALESCE(SUM(size), 0) FROM jobs GROUP BY state").fetchall()
+        counts = {state: 0 for state in ("queued", "running") + FINISHED_STATES}
+        sizes = dict(counts)
+        for state, count, size in rows:
+            counts[state] = count
+            sizes[state] = size
+        return {
+            **counts,
+            "queued_bytes": sizes["queued"],
+            "result_bytes": sizes["done"] + sizes["failed"],
+            "path": self.path,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None and self._pid == os.getpid():
+                self._db.close()
+            self._db = None
@@ -0,0 +1,178 @@
+import json
+import logging
+import os
+import shutil
+import time
+
+from backends import synthetic_samples
+from cache import file_sha256
+
+logger = logging.getLogger(__name__)
+
+
+class ModelUnavailable(Exception):
+    """The weights are not in the store and cannot be seeded or downloaded."""
+
+
+class ChecksumMismatch(ModelUnavailable):
+    def __init__(self, path, expected, actual):
+        super().__init__(f"{path} has sha256 {actual}, expected {expected}")
+        self.expected = expected
+        self.actual = actual
+
+
+class ModelStore:
+    """Checksum-verified model artifacts in one directory (the model-data volume).
+
+    Each artifact ``<name>`` has a ``<name>.sha256`` sidecar holding its digest
+    with the size and mtime it was computed for. While those still match the
+    file, startup trusts the sidecar instead of re-hashing the weights; any
+    change to the file forces a full re-hash. New artifacts are written under a
+    temporary name, verified and then renamed into place, so a crash or a
+    second container never sees a partial file.
+    """
+
+    def __init__(self, root, offline=False):
+        self.root = root
+        self.offline = offline
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def checksum(self, path):
+        """sha256 of path, from the sidecar when it is still current."""
+        stat = os.stat(path)
+        sidecar = path + ".sha256"
+        try:
+            with open(sidecar) as f:
+                recorded = json.load(f)
+            if recorded["size"] == stat.st_size and recorded["mtime_ns"] == stat.st_mtime_ns:
+                return recorded["sha256"]
+        except (OSError, ValueError, KeyError):
+            pass
+        digest = file_sha256(path)
+        self._record(path, digest)
+        return digest
+
+    def _record(self, path, digest):
+        stat = os.stat(path)
+        sidecar = path + ".sha256"
+        try:
+            with open(sidecar + ".tmp", "w") as f:
+                json.dump({"sha256": digest, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}, f)
+            os.replace(sidecar + ".tmp", sidecar)
+        except OSError as sidecar_error:
+            # A read-only store still works, it just hashes on every start
+            logger.warning(f"Could not write checksum sidecar for {path}: {sidecar_error}")
+
+    def verify(self, path, expected=None):
+        digest = self.checksum(path)
+        if expected and digest != expected.lower():
+            raise ChecksumMismatch(path, expected, digest)
+        return digest
+
+    def fetch(self, name, expected_sha256=None, seed_path=None, url=None):
+        """Returns (path, sha256) of a verified local copy of ``name``.
+
+        Tries, in order: the copy already in the store, ``seed_path`` (weights
+        shipped next to the app), and a download from ``url`` unless offline.
+        A stored copy that differs from the seed is replaced by the seed, so
+        shipping new weights in the image takes effect on restart even with a
+        persistent store. Without a seed the stored copy is used as it is.
+        """
+        target = self.path(name)
+        seed_digest = None
+        if seed_path and os.path.exists(seed_path) and os.path.abspath(seed_path) != os.path.abspath(target):
+            seed_digest = file_sha256(seed_path)
+            if expected_sha256 and seed_digest != expected_sha256.lower():
+                logger.warning(f"Not seeding the store from {seed_path}: sha256 {seed_digest}, "
+                               f"expected {expected_sha256}")
+                seed_digest = None
+
+        if os.path.exists(target):
+            try:
+                digest = self.verify(target, expected_sha256)
+            except ChecksumMismatch as mismatch:
+                logger.warning(f"Discarding stored artifact: {mismatch}")
+            else:
+                if seed_digest is None or digest == seed_digest:
+                    return target, digest
+                logger.warning(f"{seed_path} (sha256 {seed_digest}) differs from the stored {name} "
+                               f"(sha256 {digest}), replacing the stored copy")
+
+        if seed_digest is not None:
+            logger.info(f"Seeding model store with {seed_path}")
+            return target, self._install(target, lambda partial: shutil.copyfile(seed_path, partial),
+                                         expected_sha256)
+
+        if url and not self.offline:
+            logger.info(f"Downloading {name} from {url}")
+            return target, self._install(target, lambda partial: download(url, partial), expected_sha256)
+
+        reason = "offline mode" if url else "no MODEL_URL configured"
+        raise ModelUnavailable(f"{name} is not in the model store at {self.root} ({reason})")
+
+    def _install(self, target, write, expected_sha256):
+        partial = f"{target}.partial-{os.getpid()}"
+        try:
+            write(partial)
+            digest = file_sha256(partial)
+            if expected_sha256 and digest != expected_sha256.lower():
+                raise ChecksumMismatch(partial, expected_sha256, digest)
+            os.replace(partial, target)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+        self._record(target, digest)
+        return digest
+
+
+def download(url, output):
+    """Google Drive links go through gdown; anything else is a plain HTTP GET."""
+    if "drive.google.com" in url:
+        try:
+            import gdown
+        except ImportError:
+            raise ModelUnavailable("Downloading from Google Drive requires the 'gdown' package")
+        if gdown.download(url, output, quiet=True) is None:
+            raise ModelUnavailable(f"Download from {url} failed")
+        return
+    import urllib.request
+
+    with urllib.request.urlopen(url, timeout=60) as response, open(output, "wb") as f:
+        shutil.copyfileobj(response, f, 1024 * 1024)
+
+
+def resolve_weights(model_path, store_dir=None, expected_sha256=None, url=None, offline=False, name=None):
+    """(path, sha256) of the weights to serve; without a store model_path is used in place.
+
+    In the store the artifact is kept as ``name`` (default: the file name of model_path).
+    """
+    if not store_dir:
+        if not os.path.exists(model_path):
+            raise ModelUnavailable(f"{model_path} does not exist and no MODEL_STORE_DIR is configured")
+        digest = file_sha256(model_path)
+        if expected_sha256 and digest != expected_sha256.lower():
+            raise ChecksumMismatch(model_path, expected_sha256, digest)
+        return model_path, digest
+    store = ModelStore(store_dir, offline=offline)
+    return store.fetch(name or os.path.basename(model_path), expected_sha256, seed_path=model_path, url=url)
+
+
+def warmup(model, sizes, batch_sizes, iterations=1):
+    """Runs the serving predict call on synthetic images at every size/batch combination.
+
+    The first calls at a new input shape pay for lazy predictor setup, memory
+    allocation and kernel selection; doing them here keeps that off real requests.
+    Returns the time taken per "imgsz x batch" combination, in seconds.
+    """
+    timings = {}
+    for imgsz in sizes:
+        for batch in batch_sizes:
+            samples = synthetic_samples(batch, imgsz, seed=imgsz + batch)
+            started = time.perf_counter()
+            for _ in range(max(1, iterations)):
+                model.predict(source=samples, imgsz=imgsz, verbose=False)
+            timings[f"{imgsz}x{batch}"] = time.perf_counter() - started
+    return timings
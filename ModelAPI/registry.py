@@ -0,0 +1,300 @@
+import asyncio
+import gc
+import logging
+import random
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Version names end up in model store file names, so no path separators
+VERSION_NAME = re.compile(r"[A-Za-z0-9._-]+")
+
+
+class RegistryError(Exception):
+    """An admin operation that cannot be applied; ``status_code`` is the HTTP status to answer with."""
+
+    def __init__(self, message, status_code=409):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ModelVersion:
+    """One set of weights served side by side with the others, with its own micro-batchers.
+
+    ``batchers`` maps an inference size to the batcher running the model at
+    that size. ``batcher`` is the one at the version's full ``imgsz``.
+    Every predict call on ``model`` must hold ``predict_lock``. Ultralytics
+    sets the predictor's arguments (imgsz included) outside its own lock, so
+    two calls at different sizes would otherwise run at each other's size.
+    """
+
+    def __init__(self, name, source):
+        self.name = name
+        self.source = source
+        self.state = "loading"
+        self.error = None
+        # Filled in by the registry's loader
+        self.model = None
+        self.model_id = None
+        self.backend_info = None
+        self.details = {}
+        self.imgsz = None
+        self.batchers = {}
+        self.predict_lock = threading.Lock()
+        self.leases = 0
+        self.retired = False
+        self.created_at = time.time()
+        self.ready_at = None
+
+    @property
+    def task(self):
+        return self.model.task if self.model is not None else None
+
+    @property
+    def batcher(self):
+        return self.batchers.get(self.imgsz)
+
+    @property
+    def serving(self):
+        return self.state == "ready" and not self.retired
+
+    def describe(self):
+        return {
+            "state": self.state,
+            "error": self.error,
+            "source": self.source,
+            "model_id": self.model_id,
+            "backend": self.backend_info["backend"] if self.backend_info else None,
+            "in_flight": self.leases,
+            "retired": self.retired,
+            "created_at": self.created_at,
+            "ready_at": self.ready_at,
+            **self.details,
+        }
+
+
+class Lease:
+    """Keeps a version loaded while a request uses it; ``release()`` is idempotent."""
+
+    def __init__(self, registry, version):
+        self._registry = registry
+        self.version = version
+        self._released = False
+        version.leases += 1
+
+    def __enter__(self):
+        return self.version
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._registry._release(self.version)
+
+
+class ModelRegistry:
+    """Model versions that can be loaded, swapped and retired without a restart.
+
+    ``loader(version)`` runs on a worker thread and fills in the version's
+    model, model_id, backend_info and details (including warmup). When it
+    finishes, ``make_batchers(version)`` builds the version's batchers as
+    {imgsz: batcher}; they are started before the version takes any traffic.
+    Swapping the primary is a single assignment on the event loop. Requests
+    already holding a lease on the old version finish on it. Once the last
+    lease is released, the old batchers are stopped and the model dropped so
+    the memory can be reclaimed.
+
+    Traffic goes to the primary, except that ``split`` sends a percentage of
+    requests to other versions. ``shadow`` versions are sent a copy of requests
+    whose answers are only compared, never returned.
+    """
+
+    def __init__(self, loader, make_batchers):
+        self.loader = loader
+        self.make_batchers = make_batchers
+        self.primary = None
+        self.split = {}
+        self.shadow = []
+        self._versions = {}
+        self._tasks = set()
+        self.swaps = 0
+
+    @property
+    def ready(self):
+        return self.primary is not None
+
+    @property
+    def versions(self):
+        return list(self._versions.values())
+
+    def get(self, name):
+        version = self._versions.get(name)
+        if version is None:
+            raise RegistryError(f"Unknown model version '{name}'", status_code=404)
+        return version
+
+    def primary_version(self):
+        return self._versions[self.primary] if self.primary is not None else None
+
+    def load(self, name, source, activate=False):
+        """Starts loading a version in the background and returns it straight away."""
+        if not VERSION_NAME.fullmatch(name) or name in (".", ".."):
+            raise RegistryError(f"Invalid model version name '{name}': use letters, digits, '.', '_' and '-'", 400)
+        if name in self._versions:
+            raise RegistryError(f"Model version '{name}' already exists")
+        version = ModelVersion(name, source)
+        self._versions[name] = version
+        self._spawn(self._load(version, activate))
+        return version
+
+    def add(self, version, activate=False):
+        """Registers a version that was already loaded and warmed up elsewhere (serve.py's parent process).
+
+        Must be called on the event loop, which the version's batchers are started on.
+        """
+        if version.name in self._versions:
+            raise RegistryError(f"Model version '{version.name}' already exists")
+        self._versions[version.name] = version
+        version.batchers = self.make_batchers(version)
+        for batcher in version.batchers.values():
+            batcher.start()
+        version.state = "ready"
+        version.ready_at = time.time()
+        if activate:
+            self.activate(version.name)
+        return version
+
+    async def _load(self, version, activate):
+        logger.info(f"Loading model version {version.name} from {version.source}")
+        try:
+            await asyncio.to_thread(self.loader, version)
+            version.batchers = self.make_batchers(version)
+            for batcher in version.batchers.values():
+                batcher.start()
+        except Exception as load_error:
+            logger.error(f"Failed to load model version {version.name}: {load_error}", exc_info=True)
+            version.state = "failed"
+            version.error = f"{type(load_error).__name__}: {load_error}"
+            version.model = None
+            return
+        version.state = "ready"
+        version.ready_at = time.time()
+        logger.info(f"Model version {version.name} is ready")
+        if version.retired:
+            # Deleted while it was loading
+            self._maybe_unload(version)
+        elif activate:
+            self.activate(version.name)
+
+    def activate(self, name):
+        """Makes a ready version the primary; the previous primary is retired."""
+        version = self.get(name)
+        if not version.serving:
+            raise RegistryError(f"Model version '{name}' is not ready (state: {version.state})")
+        previous = self.primary
+        self.split.pop(name, None)
+        if name in self.shadow:
+            self.shadow.remove(name)
+        self.primary = name
+        if previous is not None and previous != name:
+            self.swaps += 1
+            logger.info(f"Primary model version switched from {previous} to {name}")
+            self.retire(previous)
+
+    def set_traffic(self, split=None, shadow=None):
+        split = {name: float(percent) for name, percent in (split or {}).items() if percent}
+        shadow = list(dict.fromkeys(shadow or []))
+        for name in list(split) + shadow:
+            if name == self.primary:
+                raise RegistryError(f"'{name}' is the primary version; it gets the remainder of the traffic", 400)
+            if not self.get(name).serving:
+                raise RegistryError(f"Model version '{name}' is not ready")
+        if any(percent < 0 for percent in split.values()) or sum(split.values()) > 100:
+            raise RegistryError("Split percentages must be non-negative and add up to at most 100", 400)
+        self.split = split
+        self.shadow = shadow
+
+    def retire(self, name):
+        """Stops routing to a version and unloads it once its in-flight requests finish."""
+        version = self.get(name)
+        if name == self.primary:
+            raise RegistryError(f"'{name}' is the primary version; activate another version first")
+        self.split.pop(name, None)
+        if name in self.shadow:
+            self.shadow.remove(name)
+        version.retired = True
+        self._maybe_unload(version)
+
+    def pick(self):
+        """The version that answers the next request."""
+        roll = random.uniform(0.0, 100.0)
+        for name, percent in self.split.items():
+            if roll < percent:
+                version = self._versions.get(name)
+                if version is not None and version.serving:
+                    return version
+                break
+            roll -= percent
+        return self._versions[self.primary]
+
+    def shadow_versions(self):
+        return [self._versions[name] for name in self.shadow if self._versions[name].serving]
+
+    def lease(self, version=None):
+        return Lease(self, version or self.pick())
+
+    def _release(self, version):
+        version.leases -= 1
+        self._maybe_unload(version)
+
+    def _maybe_unload(self, version):
+        if version.retired and version.leases == 0 and version.state in ("ready", "failed"):
+            version.state = "unloading"
+            self._spawn(self._unload(version))
+
+    async def _unload(self, version):
+        for batcher in version.batchers.values():
+            await batcher.stop()
+        version.batchers = {}
+        version.model = None
+        version.state = "unloaded"
+        self._versions.pop(version.name, None)
+        release_memory()
+        logger.info(f"Model version {version.name} unloaded")
+
+    def _spawn(self, coroutine):
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        for version in self.versions:
+            for batcher in version.batchers.values():
+                await batcher.stop()
+
+    def describe(self):
+        return {
+            "primary": self.primary,
+            "split": self.split,
+            "shadow": self.shadow,
+            "swaps": self.swaps,
+            "versions": {version.name: version.describe() for version in self.versions},
+        }
+
+
+def release_memory():
+    """Returns a dropped model's memory: Python objects first, then the CUDA allocator cache."""
+    gc.collect()
+    try:
+        import torch
+    except ImportError:
+        return
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
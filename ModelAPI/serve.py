@@ -0,0 +1,166 @@
+"""Prefork server: loads and warms the model once, then forks workers that share it.
+
+    python serve.py        # SERVE_WORKERS workers on SERVE_HOST:SERVE_PORT
+
+The parent process imports the app and loads and warms up the startup model
+version on a single torch thread. It makes the CPU plan (see cpu_plan.py),
+freezes the garbage collector and forks. Workers inherit the weights
+copy-on-write. Inference never writes to them, and gc.freeze() keeps the
+collector from touching (and so copying) the pages of objects created before
+the fork. Each worker therefore adds its own activations and buffers to the
+memory footprint, not another copy of the model.
+
+Every worker runs its own event loop, batchers and uvicorn server on the one
+listening socket, and the kernel hands each connection to a worker that is
+waiting in accept(). The parent only supervises. A worker that dies is forked
+again from the already-warm parent, so it serves straight away.
+
+Workers do not share state. The prediction cache and metrics are per process,
+and each /metrics scrape reports only the worker that answered it. The
+registry is per process too, so the admin API is disabled when there is more
+than one worker. That is why a single worker is the default.
+"""
+import gc
+import logging
+import os
+import signal
+import socket
+import time
+
+import torch
+
+import config
+from cpu_plan import pin_thread, split_cpus, usable_cpus
+
+logger = logging.getLogger("serve")
+
+# Runtimes that start their own thread pools while a session is created; those
+# threads do not survive fork(), so every worker opens its own session instead.
+# The export and parity check still happen once, before the workers start.
+NOT_FORK_SAFE_BACKENDS = ("onnx", "openvino")
+
+
+def worker_count():
+    """SERVE_WORKERS, or with 0 one worker per inference core of the CPU plan so that no two workers share a core."""
+    if config.SERVE_WORKERS > 0:
+        return config.SERVE_WORKERS
+    cpus, _ = usable_cpus()
+    inference, _ = split_cpus(cpus, config.CPU_DECODE_CPUS)
+    return len(inference)
+
+
+def bind_socket(host, port, backlog=2048):
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(index, sock, plan):
+    """Serves the inherited socket until SIGTERM; runs in the forked child."""
+    import uvicorn
+
+    import app
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    if plan.pin:
+        # Still single-threaded, so every thread the worker starts inherits this
+        pin_thread(plan.inference_cpus(index) + plan.decode_cpus)
+    app.use_cpu_plan(plan, index)
+    logger.info(f"Worker {index} (pid {os.getpid()}) serving with {torch.get_num_threads()} torch threads")
+    server = uvicorn.Server(uvicorn.Config(app.app, lifespan="on"))
+    server.run(sockets=[sock])
+
+
+def main():
+    # One thread while loading: an OpenMP pool started before fork() is unusable in the children
+    torch.set_num_threads(1)
+    import app
+
+    if config.MODEL_BACKEND in NOT_FORK_SAFE_BACKENDS:
+        logger.warning(f"The {config.MODEL_BACKEND} backend cannot be shared across fork(); "
+                       "each worker loads its own copy of the model")
+        try:
+            app.prepare_backend()
+        except Exception as prepare_error:
+            # The weights are unavailable; workers report it on /readyz
+            logger.error(f"Failed to prepare the {config.MODEL_BACKEND} backend: {prepare_error}", exc_info=True)
+    else:
+        started = time.perf_counter()
+        try:
+            app.preload_model()
+            logger.info(f"Model loaded and warmed up in the parent in {time.perf_counter() - started:.1f}s")
+        except Exception as load_error:
+            # Workers fall back to loading the model themselves and report it on /readyz
+            logger.error(f"Failed to preload the model: {load_error}", exc_info=True)
+
+    count = worker_count()
+    if count > 1:
+        logger.warning(f"{count} workers: /metrics reports one worker per scrape and the admin API is disabled")
+    model = app.preloaded_version.model if app.preloaded_version is not None else None
+    try:
+        # Benchmarked in a throwaway child: this process has to stay on one thread until it forks
+        plan = app.plan_cpu(model, workers=count, isolated=True)
+    except RuntimeError as plan_error:
+        logger.warning(f"CPU benchmark failed, sizing threads by cores: {plan_error}")
+        plan = app.plan_cpu(None, workers=count)
+
+    # Everything allocated so far is shared with the workers; keep the collector off those pages
+    gc.collect()
+    gc.freeze()
+
+    sock = bind_socket(config.SERVE_HOST, config.SERVE_PORT)
+    workers = {}
+    stopping = False
+
+    def spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(index, sock, plan)
+            except BaseException:
+                logger.exception(f"Worker {index} crashed")
+                code = 1
+            finally:
+                os._exit(code)
+        workers[pid] = index
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    logger.info(f"Starting {count} workers on {config.SERVE_HOST}:{config.SERVE_PORT}")
+    for index in range(count):
+        spawn(index)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = workers.pop(pid, None)
+        if index is None or stopping:
+            continue
+        logger.warning(f"Worker {index} (pid {pid}) exited with status {status}; restarting it")
+        # Keeps a worker that fails on startup from spinning
+        time.sleep(1.0)
+        if not stopping:
+            spawn(index)
+    sock.close()
+    logger.info("All workers stopped")
+
+
+if __name__ == "__main__":
+    main()
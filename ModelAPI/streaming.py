@@ -0,0 +1,113 @@
+import asyncio
+import collections
+import time
+
+import cv2
+import numpy as np
+
+from ingest import decode_image
+
+SIGNATURE_SIZE = 32
+
+
+def frame_signature(image):
+    """A 32x32 grayscale thumbnail: cheap to compare, and blind to sensor noise and JPEG artefacts."""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, (SIGNATURE_SIZE, SIGNATURE_SIZE), interpolation=cv2.INTER_AREA).astype(np.int16)
+
+
+def signature_distance(first, second):
+    """Mean absolute difference of two signatures, on the 0-255 pixel scale."""
+    return float(np.abs(first - second).mean())
+
+
+def decode_frame(contents, imgsz):
+    """(image, signature) for one frame; runs on the worker pool."""
+    image = decode_image(contents, imgsz)
+    return image, frame_signature(image)
+
+
+class LatestFrameSlot:
+    """Holds only the newest frame that has not been picked up yet.
+
+    When inference falls behind the camera, a new frame replaces the waiting
+    one instead of queueing behind it, so results never lag further than one
+    frame behind the live feed.
+    """
+
+    def __init__(self):
+        self._frame = None
+        self._ready = asyncio.Event()
+        self.closed = False
+
+    def put(self, frame):
+        """Stores the frame; returns True when it replaced (dropped) an unprocessed one."""
+        replaced = self._frame is not None
+        self._frame = frame
+        self._ready.set()
+        return replaced
+
+    async def get(self):
+        """The newest frame, waiting for one if needed; None once the slot is closed."""
+        while self._frame is None:
+            if self.closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+        frame, self._frame = self._frame, None
+        return frame
+
+    def close(self):
+        self.closed = True
+        self._ready.set()
+
+
+class StreamStats:
+    """Frame counters and rolling frame rates for one stream."""
+
+    def __init__(self, window=5.0):
+        self.window = window
+        self.started = time.monotonic()
+        self.received = 0
+        self.inferred = 0
+        self.deduplicated = 0
+        self.dropped = 0
+        self.errors = 0
+        self._received_at = collections.deque()
+        self._answered_at = collections.deque()
+        self._latency_total = 0.0
+
+    def record_received(self):
+        self.received += 1
+        self._received_at.append(time.monotonic())
+
+    def record_dropped(self):
+        self.dropped += 1
+
+    def record_answered(self, outcome, latency):
+        """outcome is "inferred", "deduplicated" or "errors"."""
+        setattr(self, outcome, getattr(self, outcome) + 1)
+        self._answered_at.append(time.monotonic())
+        self._latency_total += latency
+
+    def _rate(self, timestamps):
+        now = time.monotonic()
+        while timestamps and timestamps[0] < now - self.window:
+            timestamps.popleft()
+        span = min(self.window, now - self.started)
+        return len(timestamps) / span if span > 0 else 0.0
+
+    def snapshot(self):
+        answered = self.inferred + self.deduplicated + self.errors
+        return {
+            "received": self.received,
+            "inferred": self.inferred,
+            "deduplicated": self.deduplicated,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "input_fps": self._rate(self._received_at),
+            "output_fps": self._rate(self._answered_at),
+            "drop_rate": self.dropped / self.received if self.received else 0.0,
+            "avg_latency_ms": self._latency_total / answered * 1000.0 if answered else 0.0,
+            "duration_s": time.monotonic() - self.started,
+        }
@@ -0,0 +1,49 @@
+import unittest
+
+from backends import artifact_path, load_backend
+
+
+class LoadBackendTest(unittest.TestCase):
+    def load(self, backend, precision):
+        reference = object()
+        model, info = load_backend(reference, "/models/best.pt", "ab" * 32, backend, precision, 224)
+        self.assertIs(model, reference)
+        return info
+
+    def test_pytorch_fp32_needs_no_export(self):
+        info = self.load("pytorch", "fp32")
+        self.assertEqual((info["backend"], info["precision"]), ("pytorch", "fp32"))
+        self.assertNotIn("fallback_reason", info)
+
+    def test_unsupported_precisions_fall_back_instead_of_mislabelling(self):
+        for backend, precision in (("onnx", "fp16"), ("onnx", "int8"), ("torchscript", "fp16"), ("pytorch", "int8")):
+            with self.subTest(backend=backend, precision=precision), self.assertLogs("backends", "ERROR"):
+                info = self.load(backend, precision)
+                self.assertEqual((info["backend"], info["precision"]), ("pytorch", "fp32"))
+                self.assertEqual((info["requested"], info["requested_precision"]), (backend, precision))
+                self.assertIn("does not support", info["fallback_reason"])
+
+    def test_unknown_backend_or_precision_falls_back(self):
+        with self.assertLogs("backends", "ERROR"):
+            self.assertIn("Unknown backend", self.load("tensorrt", "fp32")["fallback_reason"])
+        with self.assertLogs("backends", "ERROR"):
+            self.assertIn("Unknown precision", self.load("openvino", "bf16")["fallback_reason"])
+
+    def test_prepared_fallback_is_reused(self):
+        prepared = {"backend": "pytorch", "precision": "fp32", "fallback_reason": "Parity check against PyTorch failed"}
+        reference = object()
+        model, info = load_backend(reference, "/models/best.pt", "ab" * 32, "onnx", "fp32", 224, prepared=prepared)
+        self.assertIs(model, reference)
+        self.assertEqual(info, prepared)
+
+
+class ArtifactPathTest(unittest.TestCase):
+    def test_keyed_by_checksum_and_precision(self):
+        self.assertEqual(artifact_path("/models/best.pt", "onnx", "fp32", "0123456789abcdef"),
+                         "/models/best-0123456789ab-fp32.onnx")
+        self.assertEqual(artifact_path("/models/best.pt", "openvino", "int8", "0123456789abcdef", "/exports"),
+                         "/exports/best-0123456789ab-int8_openvino_model")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+import unittest
+
+from batching import MicroBatcher
+
+
+class MicroBatcherTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncTearDown(self):
+        await self.batcher.stop()
+
+    def start(self, predict_fn, **kwargs):
+        self.batcher = MicroBatcher(predict_fn, **kwargs)
+        self.batcher.start()
+        return self.batcher
+
+    async def test_groups_concurrent_requests_and_returns_each_its_own_result(self):
+        batches = []
+
+        def predict(sources):
+            batches.append(list(sources))
+            return [source * 10 for source in sources]
+
+        batcher = self.start(predict, max_batch_size=4, max_wait_ms=50)
+        results = await asyncio.gather(*[batcher.submit(i) for i in range(6)])
+
+        self.assertEqual(results, [i * 10 for i in range(6)])
+        self.assertEqual([len(batch) for batch in batches], [4, 2])
+        stats = batcher.stats()
+        self.assertEqual((stats["batches"], stats["items"]), (2, 6))
+        self.assertEqual(stats["batch_size_histogram"], {"2": 1, "4": 1})
+
+    async def test_runs_a_lone_request_once_max_wait_passes(self):
+        batcher = self.start(lambda sources: sources, max_batch_size=8, max_wait_ms=5)
+        self.assertEqual(await asyncio.wait_for(batcher.submit("a"), 1.0), "a")
+
+    async def test_failure_reaches_every_request_in_the_batch(self):
+        def predict(sources):
+            if "bad" in sources:
+                raise ValueError("corrupt image")
+            return sources
+
+        batcher = self.start(predict, max_batch_size=4, max_wait_ms=50)
+        with self.assertLogs("batching", "ERROR"):
+            results = await asyncio.gather(batcher.submit("ok"), batcher.submit("bad"), return_exceptions=True)
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        # The runner survives a failed batch
+        self.assertEqual(await batcher.submit("ok"), "ok")
+        self.assertEqual(batcher.stats()["failed_batches"], 1)
+
+    async def test_rejects_a_wrong_number_of_results(self):
+        batcher = self.start(lambda sources: sources[:1], max_batch_size=4, max_wait_ms=50)
+        # Not assertRaises: it clears the traceback's frames, which would close the runner's coroutine
+        with self.assertLogs("batching", "ERROR"):
+            results = await asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+
+    async def test_skips_requests_whose_caller_went_away(self):
+        batches = []
+        blocked = threading.Event()
+
+        def predict(sources):
+            batches.append(list(sources))
+            blocked.wait(1.0)
+            return sources
+
+        batcher = self.start(predict, max_batch_size=1, max_wait_ms=0)
+        first = asyncio.ensure_future(batcher.submit("first"))
+        await asyncio.sleep(0.05)
+        abandoned = asyncio.ensure_future(batcher.submit("abandoned"))
+        await asyncio.sleep(0)
+        abandoned.cancel()
+        last = asyncio.ensure_future(batcher.submit("last"))
+        await asyncio.sleep(0)
+        blocked.set()
+        self.assertEqual(await first, "first")
+        self.assertEqual(await last, "last")
+        self.assertEqual(batches, [["first"], ["last"]])
+
+    async def test_stop_fails_pending_requests(self):
+        self.batcher = MicroBatcher(lambda sources: sources)
+        with self.assertRaises(RuntimeError):
+            await self.batcher.submit("a")
+
+        blocked = threading.Event()
+        batcher = self.start(lambda sources: blocked.wait(1.0) and sources, max_batch_size=1, max_wait_ms=0)
+        running = asyncio.ensure_future(batcher.submit("running"))
+        await asyncio.sleep(0.05)
+        pending = asyncio.ensure_future(batcher.submit("pending"))
+        await asyncio.sleep(0)
+        await batcher.stop()
+        blocked.set()
+        with self.assertRaisesRegex(RuntimeError, "stopped"):
+            await pending
+        self.assertFalse(batcher.running)
+        running.cancel()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from cache import PredictionCache, make_key
+
+
+class MakeKeyTest(unittest.TestCase):
+    def test_same_inputs_same_key(self):
+        self.assertEqual(make_key(b"img", "m1", top_k=3, imgsz=224), make_key(b"img", "m1", imgsz=224, top_k=3))
+
+    def test_model_and_params_change_the_key(self):
+        key = make_key(b"img", "m1", top_k=3)
+        self.assertNotEqual(key, make_key(b"img", "m2", top_k=3))
+        self.assertNotEqual(key, make_key(b"img", "m1", top_k=5))
+        self.assertNotEqual(key, make_key(b"other", "m1", top_k=3))
+
+
+class PredictionCacheTest(unittest.TestCase):
+    def test_evicts_least_recently_used_entry(self):
+        cache = PredictionCache(max_entries=2, max_bytes=1000, ttl=0)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((cache.get("a"), cache.get("c")), (1, 3))
+        self.assertEqual(cache.evictions, 1)
+
+    def test_evicts_by_size(self):
+        cache = PredictionCache(max_entries=10, max_bytes=10, sizeof=len, ttl=0)
+        cache.put("a", "xxxxxx")
+        cache.put("b", "yyyyyy")
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["bytes"], 6)
+
+    def test_skips_values_larger_than_the_cache(self):
+        cache = PredictionCache(max_entries=10, max_bytes=4, sizeof=len, ttl=0)
+        cache.put("a", "xxxxxx")
+        self.assertEqual(len(cache), 0)
+
+    def test_expires_entries_after_ttl(self):
+        cache = PredictionCache(ttl=10.0)
+        with mock.patch("cache.time.monotonic", return_value=100.0):
+            cache.put("a", 1)
+        with mock.patch("cache.time.monotonic", return_value=109.0):
+            self.assertEqual(cache.get("a"), 1)
+        with mock.patch("cache.time.monotonic", return_value=110.0):
+            self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.expirations, 1)
+        self.assertEqual(cache.stats()["bytes"], 0)
+
+
+class SingleFlightTest(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_callers_share_one_computation(self):
+        cache = PredictionCache()
+        calls = 0
+        release = asyncio.Event()
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return {"label": "healthy"}
+
+        waiters = [asyncio.ensure_future(cache.get_or_compute("k", compute)) for _ in range(5)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*waiters)
+
+        self.assertEqual(calls, 1)
+        self.assertTrue(all(result == {"label": "healthy"} for result in results))
+        self.assertEqual((cache.misses, cache.coalesced), (1, 4))
+        self.assertEqual(await cache.get_or_compute("k", compute), {"label": "healthy"})
+        self.assertEqual((calls, cache.hits), (1, 1))
+        self.assertEqual(cache.stats()["in_flight"], 0)
+
+    async def test_failures_are_not_cached(self):
+        cache = PredictionCache()
+        calls = 0
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            if calls == 1:
+                raise ValueError("model failed")
+            return "ok"
+
+        with self.assertRaises(ValueError):
+            await cache.get_or_compute("k", compute)
+        self.assertEqual(await cache.get_or_compute("k", compute), "ok")
+        self.assertEqual(calls, 2)
+
+    async def test_cancelled_caller_does_not_cancel_the_others(self):
+        cache = PredictionCache()
+        release = asyncio.Event()
+
+        async def compute():
+            await release.wait()
+            return "ok"
+
+        first = asyncio.ensure_future(cache.get_or_compute("k", compute))
+        second = asyncio.ensure_future(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        self.assertEqual(await second, "ok")
+        self.assertTrue(first.cancelled())
+        self.assertEqual(cache.get("k"), "ok")
+
+    async def test_disabled_cache_always_computes(self):
+        cache = PredictionCache(max_entries=0)
+        calls = 0
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            return "ok"
+
+        await cache.get_or_compute("k", compute)
+        await cache.get_or_compute("k", compute)
+        self.assertEqual((calls, len(cache)), (2, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+
+import numpy as np
+
+from cascade import needs_escalation
+from encoding import EncodedResult
+
+NAMES = {0: "healthy", 1: "scab", 2: "rust"}
+
+
+def classify(*scores):
+    return EncodedResult("classify", NAMES, np.arange(len(scores)), np.array(scores, dtype=np.float32))
+
+
+def detect(*scores):
+    boxes = np.zeros((len(scores), 4), dtype=np.float32)
+    return EncodedResult("detect", NAMES, np.zeros(len(scores), dtype=np.int64), np.array(scores, dtype=np.float32), boxes)
+
+
+class NeedsEscalationTest(unittest.TestCase):
+    def test_confident_classification_is_kept(self):
+        self.assertIsNone(needs_escalation(classify(0.9, 0.05, 0.05), 0.6, 0.2))
+
+    def test_low_top1_escalates(self):
+        self.assertEqual(needs_escalation(classify(0.5, 0.1, 0.1), 0.6, 0.2), "low_confidence")
+
+    def test_close_top2_escalates(self):
+        self.assertEqual(needs_escalation(classify(0.7, 0.25, 0.05), 0.6, 0.5), "ambiguous")
+
+    def test_thresholds_are_inclusive(self):
+        self.assertIsNone(needs_escalation(classify(0.75, 0.25), 0.75, 0.5))
+
+    def test_single_class_has_no_margin(self):
+        self.assertIsNone(needs_escalation(classify(0.9), 0.6, 0.5))
+
+    def test_empty_classification_escalates(self):
+        self.assertEqual(needs_escalation(classify(), 0.6, 0.2), "low_confidence")
+
+    def test_no_detections_escalates(self):
+        self.assertEqual(needs_escalation(detect(), 0.5, 0.2), "no_detections")
+
+    def test_weakest_detection_decides(self):
+        self.assertIsNone(needs_escalation(detect(0.9, 0.6), 0.5, 0.2))
+        self.assertEqual(needs_escalation(detect(0.9, 0.4), 0.5, 0.2), "low_confidence")
+
+    def test_margin_does_not_apply_to_detections(self):
+        self.assertIsNone(needs_escalation(detect(0.9, 0.89), 0.5, 0.5))
+
+
+if __name__ == "__main__":
+    unittest.main()
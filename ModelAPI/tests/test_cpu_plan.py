@@ -0,0 +1,71 @@
+import unittest
+from unittest import mock
+
+from cpu_plan import choose_threads, plan_cpus, split_cpus, thread_candidates
+
+
+class SplitCpusTest(unittest.TestCase):
+    def test_reserves_a_quarter_from_four_cores(self):
+        self.assertEqual(split_cpus(list(range(8))), ([0, 1, 2, 3, 4, 5], [6, 7]))
+        self.assertEqual(split_cpus(list(range(4))), ([0, 1, 2], [3]))
+
+    def test_small_machines_keep_every_core_for_inference(self):
+        self.assertEqual(split_cpus([0, 1, 2]), ([0, 1, 2], []))
+
+    def test_explicit_reserve_leaves_one_inference_core(self):
+        self.assertEqual(split_cpus(list(range(4)), decode_cpus=0), ([0, 1, 2, 3], []))
+        self.assertEqual(split_cpus(list(range(4)), decode_cpus=2), ([0, 1], [2, 3]))
+        self.assertEqual(split_cpus([0, 1], decode_cpus=5), ([0], [1]))
+
+
+class ThreadsTest(unittest.TestCase):
+    def test_candidates_double_up_to_the_limit(self):
+        self.assertEqual(thread_candidates(1), [1])
+        self.assertEqual(thread_candidates(4), [1, 2, 4])
+        self.assertEqual(thread_candidates(6), [1, 2, 4, 6])
+        self.assertEqual(thread_candidates(0), [1])
+
+    def test_chooses_the_fewest_threads_within_tolerance(self):
+        timings = {1: 0.100, 2: 0.055, 4: 0.050, 8: 0.049}
+        self.assertEqual(choose_threads(timings, tolerance=0.15), 2)
+        self.assertEqual(choose_threads(timings, tolerance=0.0), 8)
+
+
+class PlanCpusTest(unittest.TestCase):
+    def plan(self, cpus, quota=None, **kwargs):
+        with mock.patch("cpu_plan.usable_cpus", return_value=(cpus, quota)):
+            return plan_cpus(**kwargs)
+
+    def test_workers_get_equal_slices(self):
+        plan = self.plan(list(range(10)), workers=2)
+        self.assertEqual(plan.worker_cpus, [[0, 1, 2, 3], [4, 5, 6, 7]])
+        self.assertEqual(plan.decode_cpus, [8, 9])
+        self.assertEqual((plan.source, plan.intra_op), ("cores", 4))
+
+    def test_leftover_cores_go_to_decoding(self):
+        plan = self.plan(list(range(10)), workers=3)
+        self.assertEqual(plan.worker_cpus, [[0, 1], [2, 3], [4, 5]])
+        self.assertEqual(plan.decode_cpus, [6, 7, 8, 9])
+
+    def test_more_workers_than_cores_share_them(self):
+        plan = self.plan([0, 1], workers=3)
+        self.assertEqual(plan.worker_cpus, [[0], [1], [0]])
+        self.assertEqual(plan.decode_cpus, [])
+        self.assertEqual(plan.inference_cpus(4), [1])
+
+    def test_override_skips_the_benchmark(self):
+        with mock.patch("cpu_plan.benchmark_threads") as benchmark:
+            plan = self.plan(list(range(8)), intra_op=3, run=lambda: None)
+        benchmark.assert_not_called()
+        self.assertEqual((plan.source, plan.intra_op), ("override", 3))
+
+    def test_benchmark_picks_the_thread_count(self):
+        timings = {1: 0.1, 2: 0.052, 4: 0.05, 6: 0.05}
+        with mock.patch("cpu_plan.benchmark_threads", return_value=timings) as benchmark:
+            plan = self.plan(list(range(8)), run=lambda: None)
+        self.assertEqual(benchmark.call_args[0][1], [1, 2, 4, 6])
+        self.assertEqual((plan.source, plan.intra_op, plan.benchmark), ("benchmark", 2, timings))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import types
+import unittest
+
+import numpy as np
+import torch
+
+from encoding import EncodedResult, encode_result, render_columnar, render_predictions, select
+
+NAMES = {0: "healthy", 1: "scab", 2: "rust", 3: "blight"}
+
+
+def classification(scores):
+    order = np.argsort(-np.asarray(scores, dtype=np.float32), kind="stable")
+    return EncodedResult("classify", NAMES, order, np.asarray(scores, dtype=np.float32)[order])
+
+
+def detection():
+    boxes = np.array([[0.1, 0.1, 0.5, 0.5], [0.2, 0.2, 0.4, 0.6], [0.0, 0.0, 1.0, 1.0]], dtype=np.float32)
+    return EncodedResult("detect", NAMES, np.array([1, 2, 1]), np.array([0.9, 0.6, 0.3], dtype=np.float32), boxes)
+
+
+class SelectTest(unittest.TestCase):
+    def setUp(self):
+        self.encoded = classification([0.05, 0.5, 0.3, 0.15])
+
+    def test_keeps_everything_by_default(self):
+        self.assertEqual(select(self.encoded), slice(0, 4))
+
+    def test_threshold_keeps_scores_at_or_above_it(self):
+        self.assertEqual(select(self.encoded, min_confidence=0.3), slice(0, 2))
+        self.assertEqual(select(self.encoded, min_confidence=0.31), slice(0, 1))
+        self.assertEqual(select(self.encoded, min_confidence=0.99), slice(0, 0))
+
+    def test_threshold_keeps_ties(self):
+        encoded = classification([0.2, 0.4, 0.4, 0.0])
+        self.assertEqual(select(encoded, min_confidence=0.4), slice(0, 2))
+
+    def test_top_k_caps_the_threshold(self):
+        self.assertEqual(select(self.encoded, top_k=1, min_confidence=0.1), slice(0, 1))
+        self.assertEqual(select(self.encoded, top_k=10, min_confidence=0.1), slice(0, 3))
+        self.assertEqual(select(self.encoded, top_k=0), slice(0, 0))
+
+
+class RenderTest(unittest.TestCase):
+    def test_classification_predictions_are_sorted_by_probability(self):
+        predictions = render_predictions(classification([0.1, 0.6, 0.3, 0.0]), top_k=2)
+        self.assertEqual([p["class"] for p in predictions], ["scab", "rust"])
+        self.assertAlmostEqual(predictions[0]["probability"], 0.6, places=6)
+        self.assertEqual(set(predictions[0]), {"class", "probability"})
+
+    def test_detection_predictions_carry_boxes(self):
+        predictions = render_predictions(detection(), min_confidence=0.5)
+        self.assertEqual([p["class"] for p in predictions], ["scab", "rust"])
+        self.assertEqual(set(predictions[0]), {"class", "confidence", "box"})
+        np.testing.assert_allclose(predictions[1]["box"], [0.2, 0.2, 0.4, 0.6], rtol=1e-6)
+
+    def test_columnar_matches_the_object_form(self):
+        encoded = detection()
+        columns = render_columnar(encoded, top_k=2)
+        objects = render_predictions(encoded, top_k=2)
+        self.assertEqual(columns["task"], "detect")
+        self.assertEqual(columns["classes"], [p["class"] for p in objects])
+        self.assertEqual(columns["scores"], [p["confidence"] for p in objects])
+        self.assertEqual(columns["boxes"], [p["box"] for p in objects])
+        self.assertEqual(columns["class_ids"], [1, 2])
+
+    def test_classification_columns_have_no_boxes(self):
+        self.assertNotIn("boxes", render_columnar(classification([0.5, 0.5, 0.0, 0.0])))
+
+    def test_unknown_class_id_falls_back_to_the_number(self):
+        encoded = EncodedResult("classify", NAMES, np.array([7]), np.array([1.0], dtype=np.float32))
+        self.assertEqual(render_predictions(encoded)[0]["class"], "7")
+
+
+class EncodeResultTest(unittest.TestCase):
+    def test_classification(self):
+        result = types.SimpleNamespace(names=NAMES, probs=types.SimpleNamespace(data=torch.tensor([0.1, 0.7, 0.2, 0.0])))
+        encoded = encode_result(result)
+        self.assertEqual(encoded.task, "classify")
+        self.assertEqual(encoded.class_ids.tolist(), [1, 2, 0, 3])
+        self.assertIsNone(encoded.boxes)
+
+    def test_detection_boxes_are_normalized_and_sorted(self):
+        data = torch.tensor([[0.0, 0.0, 50.0, 25.0, 0.4, 2.0], [10.0, 20.0, 100.0, 50.0, 0.8, 1.0]])
+        result = types.SimpleNamespace(names=NAMES, probs=None, boxes=types.SimpleNamespace(data=data),
+                                       orig_shape=(50, 100))
+        encoded = encode_result(result)
+        self.assertEqual(encoded.class_ids.tolist(), [1, 2])
+        np.testing.assert_allclose(encoded.boxes, [[0.1, 0.4, 1.0, 1.0], [0.0, 0.0, 0.5, 0.5]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+
+from executor import InferenceExecutor, Overloaded
+
+
+class AdmissionTest(unittest.TestCase):
+    def setUp(self):
+        self.executor = InferenceExecutor(workers=2, max_queue=2, retry_after=3)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_rejects_beyond_capacity(self):
+        admissions = [self.executor.admit() for _ in range(4)]
+        with self.assertRaises(Overloaded) as raised:
+            self.executor.admit()
+        self.assertEqual(raised.exception.retry_after, 3)
+        admissions[0].release()
+        self.executor.admit()
+        self.assertEqual(self.executor.stats()["rejected"], 1)
+
+    def test_multi_slot_admission_counts_every_slot(self):
+        with self.executor.admit(3):
+            self.assertEqual(self.executor.in_flight, 3)
+            self.executor.admit()
+            with self.assertRaises(Overloaded):
+                self.executor.admit()
+        self.assertEqual(self.executor.in_flight, 1)
+        with self.assertRaises(Overloaded):
+            self.executor.admit(4)
+
+    def test_release_is_idempotent(self):
+        admission = self.executor.admit(2)
+        admission.release()
+        admission.release()
+        self.assertEqual(self.executor.in_flight, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
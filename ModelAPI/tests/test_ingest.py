@@ -0,0 +1,135 @@
+import asyncio
+import io
+import json
+import tempfile
+import unittest
+import zipfile
+
+from ingest import MaxBodySizeMiddleware, UploadTooLarge, iter_zip_images
+
+
+def make_zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, contents in members:
+            archive.writestr(name, contents)
+    return buffer.getvalue()
+
+
+class ZipImagesTest(unittest.TestCase):
+    def read_all(self, archive, max_member_bytes=100, max_members=10):
+        results = []
+        for name, read in iter_zip_images(archive, max_member_bytes, max_members):
+            try:
+                results.append((name, read()))
+            except UploadTooLarge:
+                results.append((name, "too large"))
+        return results
+
+    def test_skips_directories_and_resource_forks(self):
+        archive = make_zip([("leaves/", b""), ("leaves/a.jpg", b"a"), ("__MACOSX/leaves/._a.jpg", b"x"),
+                            ("._b.jpg", b"x"), ("b.jpg", b"b")])
+        self.assertEqual(self.read_all(archive), [("leaves/a.jpg", b"a"), ("b.jpg", b"b")])
+
+    def test_oversized_member_only_fails_itself(self):
+        archive = make_zip([("big.jpg", b"x" * 101), ("ok.jpg", b"x" * 100)])
+        self.assertEqual(self.read_all(archive), [("big.jpg", "too large"), ("ok.jpg", b"x" * 100)])
+
+    def test_member_whose_header_lies_fails_when_read(self):
+        data = make_zip([("a.jpg", b"x" * 500), ("b.jpg", b"b")])
+        # Shrink a.jpg's uncompressed size in the central directory: 500 -> 50
+        directory = data.index(b"PK\x01\x02")
+        data = data[:directory + 24] + (50).to_bytes(4, "little") + data[directory + 28:]
+        members = dict(iter_zip_images(data, 100, 10))
+        with self.assertRaises(zipfile.BadZipFile):
+            members["a.jpg"]()
+        self.assertEqual(members["b.jpg"](), b"b")
+
+    def test_stops_at_max_members(self):
+        archive = make_zip([(f"{index}.jpg", b"x") for index in range(5)])
+        self.assertEqual([name for name, _ in iter_zip_images(archive, 100, 3)], ["0.jpg", "1.jpg", "2.jpg"])
+
+    def test_reads_from_a_spooled_upload_file(self):
+        with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as upload:
+            upload.write(make_zip([("a.jpg", b"a")]))
+            upload.seek(0)
+            self.assertEqual(self.read_all(upload), [("a.jpg", b"a")])
+
+    def test_rejects_what_is_not_a_zip(self):
+        with self.assertRaises(zipfile.BadZipFile):
+            list(iter_zip_images(b"not a zip", 100, 10))
+
+
+async def read_body_app(scope, receive, send):
+    """Reads the whole body, then answers 200 with its size."""
+    size = 0
+    while True:
+        message = await receive()
+        size += len(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": str(size).encode()})
+
+
+async def swallowing_app(scope, receive, send):
+    """Turns a failed body read into its own 400, as a form parser would."""
+    try:
+        await receive()
+        await receive()
+    except UploadTooLarge:
+        pass
+    await send({"type": "http.response.start", "status": 400, "headers": []})
+    await send({"type": "http.response.body", "body": b"bad form"})
+
+
+class MaxBodySizeMiddlewareTest(unittest.TestCase):
+    def call(self, app, path, chunks, headers=(), default=10, limits=None):
+        middleware = MaxBodySizeMiddleware(app, default=default, limits=limits)
+        scope = {"type": "http", "path": path, "headers": list(headers)}
+        messages = [{"type": "http.request", "body": chunk, "more_body": index < len(chunks) - 1}
+                    for index, chunk in enumerate(chunks)]
+        received = []
+        sent = []
+
+        async def receive():
+            received.append(messages[len(received)])
+            return received[-1]
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(middleware(scope, receive, send))
+        return sent[0]["status"], b"".join(message.get("body", b"") for message in sent[1:]), len(received)
+
+    def test_body_within_the_limit_passes(self):
+        self.assertEqual(self.call(read_body_app, "/predict", [b"x" * 6, b"x" * 4]), (200, b"10", 2))
+
+    def test_declared_length_is_rejected_without_reading(self):
+        status, body, received = self.call(read_body_app, "/predict", [b"x"], headers=[(b"content-length", b"11")])
+        self.assertEqual((status, received), (413, 0))
+        self.assertEqual(json.loads(body)["predictions"], [])
+        self.assertIn("10 bytes", json.loads(body)["error"])
+
+    def test_streamed_body_is_cut_off_at_the_limit(self):
+        status, _, received = self.call(read_body_app, "/predict", [b"x" * 6, b"x" * 6, b"x" * 6])
+        self.assertEqual((status, received), (413, 2))
+
+    def test_unparseable_length_falls_back_to_counting(self):
+        status, _, _ = self.call(read_body_app, "/predict", [b"x" * 11], headers=[(b"content-length", b"lots")])
+        self.assertEqual(status, 413)
+
+    def test_app_response_after_the_limit_is_replaced(self):
+        status, body, _ = self.call(swallowing_app, "/predict", [b"x" * 6, b"x" * 6])
+        self.assertEqual(status, 413)
+        self.assertNotIn(b"bad form", body)
+
+    def test_per_path_limits(self):
+        limits = {"/batch": 100, "/health": 0}
+        self.assertEqual(self.call(read_body_app, "/batch", [b"x" * 50], limits=limits)[0], 200)
+        self.assertEqual(self.call(read_body_app, "/health", [b"x" * 50], limits=limits)[0], 200)
+        self.assertEqual(self.call(read_body_app, "/predict", [b"x" * 50], limits=limits)[0], 413)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+import os
+import tempfile
+import time
+import unittest
+
+from jobs import JobQueueFull, JobStore
+
+
+class JobStoreTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "jobs", "jobs.sqlite3")
+        self.store = JobStore(self.path)
+        self.addCleanup(self.store.close)
+
+    def submit(self, image=b"jpeg", params=None, max_queued=100):
+        return self.store.submit("leaf.jpg", image, params or {"top_k": 3}, max_queued)
+
+    def claim(self, owner="run-1", stale_after=600.0, max_attempts=3):
+        return self.store.claim(owner, stale_after, max_attempts)
+
+    def test_job_lifecycle(self):
+        job_id = self.submit()
+        self.assertEqual(self.store.get(job_id)["state"], "queued")
+
+        job = self.claim()
+        self.assertEqual((job["id"], job["image"], job["params"], job["attempts"]),
+                         (job_id, b"jpeg", {"top_k": 3}, 1))
+        self.assertEqual(self.store.get(job_id)["state"], "running")
+        self.assertIsNone(self.claim())
+
+        self.store.complete(job_id, {"predictions": [{"class": "healthy"}]})
+        status = self.store.get(job_id)
+        self.assertEqual(status["state"], "done")
+        self.assertEqual(status["result"], {"predictions": [{"class": "healthy"}]})
+        self.assertIsNotNone(status["finished_at"])
+        stats = self.store.stats()
+        self.assertEqual((stats["done"], stats["queued_bytes"]), (1, 0))
+
+    def test_failed_job_keeps_its_error(self):
+        job_id = self.submit()
+        self.claim()
+        self.store.fail(job_id, "ValueError: bad image")
+        status = self.store.get(job_id)
+        self.assertEqual((status["state"], status["error"], status["result"]), ("failed", "ValueError: bad image", None))
+
+    def test_unknown_job(self):
+        self.assertIsNone(self.store.get("missing"))
+
+    def test_claims_oldest_first(self):
+        ids = [self.submit() for _ in range(3)]
+        self.assertEqual([self.claim()["id"] for _ in range(3)], ids)
+
+    def test_rejects_submissions_when_the_queue_is_full(self):
+        self.submit(max_queued=2)
+        self.submit(max_queued=2)
+        with self.assertRaises(JobQueueFull) as raised:
+            self.submit(max_queued=2)
+        self.assertEqual(raised.exception.limit, 2)
+        # Running jobs no longer count against the queue
+        self.claim()
+        self.submit(max_queued=2)
+
+    def test_stale_running_job_is_claimed_again(self):
+        job_id = self.submit()
+        self.claim(owner="crashed")
+        self.assertIsNone(self.claim(stale_after=600.0))
+        job = self.claim(stale_after=-1.0)
+        self.assertEqual((job["id"], job["attempts"]), (job_id, 2))
+
+    def test_gives_up_after_max_attempts(self):
+        job_id = self.submit()
+        self.claim(max_attempts=2)
+        self.claim(stale_after=-1.0, max_attempts=2)
+        with self.assertLogs("jobs", "WARNING"):
+            self.assertIsNone(self.claim(stale_after=-1.0, max_attempts=2))
+        status = self.store.get(job_id)
+        self.assertEqual((status["state"], status["error"]), ("failed", "Gave up after 2 attempts"))
+
+    def test_requeues_jobs_left_running_by_an_earlier_run(self):
+        mine = self.submit()
+        theirs = self.submit()
+        self.claim(owner="earlier-run")
+        self.claim(owner="this-run")
+        self.assertEqual(self.store.requeue_abandoned("this-run"), 1)
+        self.assertEqual(self.store.get(mine)["state"], "queued")
+        self.assertEqual(self.store.get(theirs)["state"], "running")
+
+    def test_late_completion_of_a_requeued_job_is_ignored(self):
+        job_id = self.submit()
+        self.claim(owner="earlier-run")
+        self.store.requeue_abandoned("this-run")
+        self.store.complete(job_id, {"predictions": []})
+        self.assertEqual(self.store.get(job_id)["state"], "queued")
+
+    def test_evicts_expired_jobs_but_never_unfinished_ones(self):
+        done = self.submit()
+        self.claim()
+        self.store.complete(done, {"predictions": []})
+        queued = self.submit()
+        time.sleep(0.01)
+        self.assertEqual(self.store.evict(ttl=0.0, max_bytes=10 ** 9), 1)
+        self.assertIsNone(self.store.get(done))
+        self.assertEqual(self.store.get(queued)["state"], "queued")
+
+    def test_evicts_oldest_results_beyond_max_bytes(self):
+        ids = []
+        for index in range(3):
+            ids.append(self.submit())
+            self.claim()
+            self.store.complete(ids[-1], {"predictions": [index]})
+            time.sleep(0.01)
+        size = len('{"predictions": [0]}')
+        self.assertEqual(self.store.evict(ttl=3600.0, max_bytes=size), 2)
+        self.assertEqual([self.store.get(job_id) is not None for job_id in ids], [False, False, True])
+
+    def test_jobs_survive_reopening(self):
+        job_id = self.submit()
+        self.store.close()
+        reopened = JobStore(self.path)
+        self.addCleanup(reopened.close)
+        self.assertEqual(reopened.get(job_id)["state"], "queued")
+        self.assertEqual(reopened.claim("run-2", 600.0, 3)["id"], job_id)
+
+
+if __name__ == "__main__":
+    unittest.main()
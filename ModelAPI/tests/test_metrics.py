@@ -0,0 +1,81 @@
+import unittest
+from unittest import mock
+
+from metrics import Counter, Gauge, Histogram, Registry, SlowRequestLog
+
+
+class HistogramTest(unittest.TestCase):
+    def test_bucket_bounds_are_inclusive_and_cumulative(self):
+        histogram = Histogram("latency_seconds", "Latency.", buckets=(0.5, 0.1, 1.0))
+        for value in (0.05, 0.1, 0.2, 1.0, 3.0):
+            histogram.observe(value)
+        self.assertEqual(histogram.collect(), [
+            "# HELP latency_seconds Latency.",
+            "# TYPE latency_seconds histogram",
+            'latency_seconds_bucket{le="0.1"} 2',
+            'latency_seconds_bucket{le="0.5"} 3',
+            'latency_seconds_bucket{le="1.0"} 4',
+            'latency_seconds_bucket{le="+Inf"} 5',
+            "latency_seconds_sum 4.35",
+            "latency_seconds_count 5",
+        ])
+
+    def test_values_above_the_last_bucket_only_count_in_inf(self):
+        histogram = Histogram("size", "Size.", buckets=(1, 2))
+        histogram.observe(10)
+        self.assertIn('size_bucket{le="2.0"} 0', histogram.collect())
+        self.assertIn('size_bucket{le="+Inf"} 1', histogram.collect())
+
+    def test_series_per_label_value(self):
+        histogram = Histogram("latency", "Latency.", ["route"], buckets=(1,))
+        histogram.observe(0.5, route="/predict")
+        histogram.observe(2, route="/batch")
+        lines = histogram.collect()
+        self.assertIn('latency_bucket{route="/batch",le="1.0"} 0', lines)
+        self.assertIn('latency_bucket{route="/predict",le="1.0"} 1', lines)
+        self.assertIn('latency_count{route="/predict"} 1', lines)
+
+    def test_labels_must_match(self):
+        histogram = Histogram("latency", "Latency.", ["route"])
+        with self.assertRaises(ValueError):
+            histogram.observe(1.0)
+
+
+class CounterTest(unittest.TestCase):
+    def test_increments_per_label_value(self):
+        counter = Counter("requests_total", "Requests.", ["status"])
+        counter.inc(status=200)
+        counter.inc(2, status="200")
+        counter.inc(status=500)
+        self.assertEqual(counter.value(status=200), 3.0)
+        self.assertEqual(counter.collect()[2:], ['requests_total{status="200"} 3.0', 'requests_total{status="500"} 1.0'])
+
+    def test_label_values_are_escaped(self):
+        counter = Counter("errors_total", "Errors.", ["message"])
+        counter.inc(message='bad "path"\\\n')
+        self.assertEqual(counter.collect()[-1], 'errors_total{message="bad \\"path\\"\\\\\\n"} 1.0')
+
+    def test_callback_is_read_at_scrape_time(self):
+        gauge = Gauge("queue_depth", "Queued.", ["stage"], callback=lambda: {("decode",): 3, ("infer",): 1})
+        self.assertEqual(gauge.collect()[2:], ['queue_depth{stage="decode"} 3.0', 'queue_depth{stage="infer"} 1.0'])
+
+    def test_registry_renders_every_metric(self):
+        registry = Registry()
+        registry.gauge("up", "Up.").set(1)
+        registry.counter("hits_total", "Hits.").inc()
+        self.assertEqual(registry.render().splitlines()[2::3], ["up 1.0", "hits_total 1.0"])
+
+
+class SlowRequestLogTest(unittest.TestCase):
+    def test_keeps_the_slowest_within_the_window(self):
+        log = SlowRequestLog(capacity=2, window=60.0)
+        with mock.patch("metrics.time.time", return_value=1000.0):
+            for duration in (0.3, 0.1, 0.5, 0.2):
+                log.add(duration, {"path": f"/{duration}"})
+            self.assertEqual([entry["path"] for entry in log.snapshot()], ["/0.5", "/0.3"])
+        with mock.patch("metrics.time.time", return_value=1061.0):
+            self.assertEqual(log.snapshot(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+
+from cache import file_sha256
+from model_store import ChecksumMismatch, ModelStore, ModelUnavailable, resolve_weights
+
+
+class ModelStoreTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = os.path.join(directory.name, "store")
+        self.seed = os.path.join(directory.name, "best.pt")
+        self.write(self.seed, b"weights v1")
+
+    def write(self, path, contents):
+        with open(path, "wb") as f:
+            f.write(contents)
+
+    def fetch(self, **kwargs):
+        return ModelStore(self.root).fetch("best.pt", seed_path=kwargs.pop("seed_path", self.seed), **kwargs)
+
+    def test_seeds_the_store_and_records_the_checksum(self):
+        path, digest = self.fetch()
+        self.assertEqual(path, os.path.join(self.root, "best.pt"))
+        self.assertEqual(digest, file_sha256(self.seed))
+        self.assertTrue(os.path.exists(path + ".sha256"))
+
+    def test_new_seed_replaces_the_stored_copy(self):
+        self.fetch()
+        self.write(self.seed, b"weights v2")
+        with self.assertLogs("model_store", "WARNING"):
+            path, digest = self.fetch()
+        self.assertEqual(digest, file_sha256(self.seed))
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"weights v2")
+
+    def test_without_a_seed_the_stored_copy_is_used(self):
+        path, digest = self.fetch()
+        os.remove(self.seed)
+        self.assertEqual(self.fetch(), (path, digest))
+
+    def test_expected_checksum_wins_over_a_different_seed(self):
+        path, digest = self.fetch()
+        self.write(self.seed, b"weights v2")
+        with self.assertLogs("model_store", "WARNING"):
+            self.assertEqual(self.fetch(expected_sha256=digest), (path, digest))
+
+    def test_stored_copy_with_the_wrong_checksum_is_replaced(self):
+        path, _ = self.fetch()
+        self.write(path, b"corrupted")
+        with self.assertLogs("model_store", "WARNING"):
+            _, digest = self.fetch(expected_sha256=file_sha256(self.seed))
+        self.assertEqual(digest, file_sha256(self.seed))
+
+    def test_unavailable_offline_without_a_copy(self):
+        with self.assertRaises(ModelUnavailable):
+            ModelStore(self.root, offline=True).fetch("best.pt", url="https://example.com/best.pt")
+
+    def test_without_a_store_the_weights_are_checked_in_place(self):
+        self.assertEqual(resolve_weights(self.seed), (self.seed, file_sha256(self.seed)))
+        with self.assertRaises(ChecksumMismatch):
+            resolve_weights(self.seed, expected_sha256="0" * 64)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from registry import ModelRegistry, RegistryError
+
+
+class FakeBatcher:
+    def __init__(self):
+        self.started = False
+        self.stopped = False
+
+    def start(self):
+        self.started = True
+
+    async def stop(self):
+        self.stopped = True
+
+
+def loader(version):
+    if version.source == "broken.pt":
+        raise FileNotFoundError(version.source)
+    version.model = object()
+    version.model_id = f"{version.name}:{version.source}"
+    version.imgsz = 224
+
+
+class ModelRegistryTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        # Unloading would import torch to empty the CUDA cache
+        patcher = mock.patch("registry.release_memory")
+        self.release_memory = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.registry = ModelRegistry(loader, lambda version: {version.imgsz: FakeBatcher()})
+
+    async def asyncTearDown(self):
+        await self.registry.stop()
+
+    async def settle(self):
+        """Lets the registry's background load and unload tasks finish."""
+        for _ in range(100):
+            if not self.registry._tasks:
+                return
+            await asyncio.sleep(0.01)
+        self.fail("Registry tasks did not finish")
+
+    async def load(self, name, activate=False, source="best.pt"):
+        version = self.registry.load(name, source, activate=activate)
+        await self.settle()
+        return version
+
+    async def test_load_and_activate(self):
+        version = await self.load("v1", activate=True)
+        self.assertEqual(version.state, "ready")
+        self.assertTrue(version.batcher.started)
+        self.assertEqual(self.registry.primary, "v1")
+        self.assertIs(self.registry.pick(), version)
+
+    async def test_failed_load_is_recorded(self):
+        with self.assertLogs("registry", "ERROR"):
+            version = await self.load("v1", activate=True, source="broken.pt")
+        self.assertEqual(version.state, "failed")
+        self.assertIn("FileNotFoundError", version.error)
+        self.assertFalse(self.registry.ready)
+
+    async def test_rejects_invalid_and_duplicate_names(self):
+        for name in ("../escape", "a/b", "..", ".", "", "v 1"):
+            with self.assertRaises(RegistryError) as raised:
+                self.registry.load(name, "best.pt")
+            self.assertEqual(raised.exception.status_code, 400)
+        await self.load("v1.2_rc-1")
+        with self.assertRaises(RegistryError) as raised:
+            self.registry.load("v1.2_rc-1", "best.pt")
+        self.assertEqual(raised.exception.status_code, 409)
+
+    async def test_swap_unloads_the_idle_previous_primary(self):
+        old = await self.load("v1", activate=True)
+        old_batcher = old.batcher
+        await self.load("v2", activate=True)
+        await self.settle()
+        self.assertEqual(self.registry.primary, "v2")
+        self.assertEqual(self.registry.swaps, 1)
+        self.assertEqual(old.state, "unloaded")
+        self.assertIsNone(old.model)
+        self.assertTrue(old_batcher.stopped)
+        self.release_memory.assert_called_once()
+        with self.assertRaises(RegistryError):
+            self.registry.get("v1")
+
+    async def test_leased_version_stays_loaded_until_released(self):
+        old = await self.load("v1", activate=True)
+        lease = self.registry.lease()
+        await self.load("v2", activate=True)
+        await self.settle()
+        self.assertIs(lease.version, old)
+        self.assertEqual((old.state, old.retired, old.leases), ("ready", True, 1))
+        self.assertIsNotNone(old.model)
+        self.assertIs(self.registry.pick(), self.registry.get("v2"))
+
+        lease.release()
+        lease.release()
+        await self.settle()
+        self.assertEqual((old.state, old.leases), ("unloaded", 0))
+
+    async def test_version_deleted_while_loading_is_unloaded_once_ready(self):
+        version = self.registry.load("v1", "best.pt")
+        self.registry.retire("v1")
+        await self.settle()
+        await self.settle()
+        self.assertEqual(version.state, "unloaded")
+
+    async def test_cannot_retire_or_split_to_the_primary(self):
+        await self.load("v1", activate=True)
+        with self.assertRaises(RegistryError):
+            self.registry.retire("v1")
+        with self.assertRaises(RegistryError) as raised:
+            self.registry.set_traffic(split={"v1": 10})
+        self.assertEqual(raised.exception.status_code, 400)
+
+    async def test_set_traffic(self):
+        await self.load("v1", activate=True)
+        canary = await self.load("v2")
+        await self.load("v3")
+
+        with self.assertRaises(RegistryError) as raised:
+            self.registry.set_traffic(split={"v2": 60, "v3": 50})
+        self.assertEqual(raised.exception.status_code, 400)
+        with self.assertRaises(RegistryError) as raised:
+            self.registry.set_traffic(split={"missing": 10})
+        self.assertEqual(raised.exception.status_code, 404)
+
+        self.registry.set_traffic(split={"v2": 100, "v3": 0}, shadow=["v3", "v3"])
+        self.assertEqual(self.registry.split, {"v2": 100.0})
+        self.assertEqual([version.name for version in self.registry.shadow_versions()], ["v3"])
+        self.assertIs(self.registry.pick(), canary)
+
+        # Activating a canary takes it out of the split
+        self.registry.activate("v2")
+        self.assertEqual(self.registry.split, {})
+
+    async def test_cannot_activate_a_version_that_is_not_ready(self):
+        self.registry.load("v1", "best.pt")
+        with self.assertRaises(RegistryError):
+            self.registry.activate("v1")
+        await self.settle()
+
+
+if __name__ == "__main__":
+    unittest.main()
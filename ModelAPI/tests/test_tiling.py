@@ -0,0 +1,82 @@
+import types
+import unittest
+
+import numpy as np
+import torch
+
+from tiling import content_tiles, merge_detections, offset_detections, tile_grid
+
+NAMES = {0: "healthy", 1: "scab"}
+
+
+class FakeBoxes:
+    """The part of ultralytics' Boxes that offset_detections uses."""
+
+    def __init__(self, data):
+        self.data = torch.as_tensor(data)
+
+    def __len__(self):
+        return len(self.data)
+
+
+class TileGridTest(unittest.TestCase):
+    def test_covers_the_image_with_the_requested_overlap(self):
+        windows = tile_grid(1000, 640, 640, 0.25)
+        # stride 480: x starts 0, 360 (shifted back to the border); a single row
+        self.assertEqual(windows, [(0, 0, 640, 640), (360, 0, 1000, 640)])
+
+    def test_last_tile_ends_at_the_border(self):
+        windows = tile_grid(2000, 1500, 640, 0.2)
+        xs = sorted({x0 for x0, _, _, _ in windows})
+        ys = sorted({y0 for _, y0, _, _ in windows})
+        self.assertEqual(xs, [0, 512, 1024, 1360])
+        self.assertEqual(ys, [0, 512, 860])
+        self.assertTrue(all(x1 - x0 == 640 and y1 - y0 == 640 for x0, y0, x1, y1 in windows))
+        self.assertEqual(len(windows), len(xs) * len(ys))
+
+    def test_short_sides_get_one_window(self):
+        self.assertEqual(tile_grid(300, 200, 640, 0.2), [(0, 0, 300, 200)])
+        self.assertEqual(tile_grid(640, 640, 640, 0.2), [(0, 0, 640, 640)])
+
+    def test_full_overlap_still_advances(self):
+        windows = tile_grid(10, 4, 4, 1.0)
+        self.assertEqual([x0 for x0, _, _, _ in windows], [0, 1, 2, 3, 4, 5, 6])
+
+
+class ContentTilesTest(unittest.TestCase):
+    def test_skips_blank_tiles(self):
+        image = np.zeros((64, 128, 3), dtype=np.uint8)
+        image[:, 64:] = np.random.default_rng(0).integers(0, 255, (64, 64, 3), dtype=np.uint8)
+        tiles, skipped = content_tiles(image, 64, 0.0, min_std=2.0)
+        self.assertEqual(([offset for _, offset in tiles], skipped), ([(64, 0)], 1))
+        self.assertTrue(np.shares_memory(tiles[0][0], image))
+
+
+class MergeDetectionsTest(unittest.TestCase):
+    def test_offsets_tile_boxes_into_image_pixels(self):
+        result = types.SimpleNamespace(boxes=FakeBoxes([[1.0, 2.0, 11.0, 12.0, 0.9, 1.0]]))
+        np.testing.assert_allclose(offset_detections(result, (100, 50)), [[101, 52, 111, 62, 0.9, 1]])
+        empty = types.SimpleNamespace(boxes=FakeBoxes(torch.empty((0, 6))))
+        self.assertEqual(offset_detections(empty, (100, 50)).shape, (0, 6))
+
+    def test_suppresses_duplicates_across_tiles_per_class(self):
+        tile_a = np.array([[100, 100, 200, 200, 0.9, 1], [100, 100, 200, 200, 0.8, 0]], dtype=np.float32)
+        # The same scab cut by the tile border, seen again by the neighbouring tile
+        tile_b = np.array([[105, 100, 200, 200, 0.7, 1], [500, 300, 600, 400, 0.95, 1]], dtype=np.float32)
+        merged = merge_detections([tile_a, tile_b], NAMES, 1000, 500, iou=0.5)
+        self.assertEqual(merged.task, "detect")
+        self.assertEqual(merged.class_ids.tolist(), [1, 1, 0])
+        np.testing.assert_allclose(merged.scores, [0.95, 0.9, 0.8])
+        np.testing.assert_allclose(merged.boxes[0], [0.5, 0.6, 0.6, 0.8])
+
+    def test_boxes_are_clipped_to_the_image(self):
+        merged = merge_detections([np.array([[-10, 0, 1100, 600, 0.5, 0]], dtype=np.float32)], NAMES, 1000, 500, 0.5)
+        np.testing.assert_allclose(merged.boxes[0], [0.0, 0.0, 1.0, 1.0])
+
+    def test_no_detections(self):
+        merged = merge_detections([], NAMES, 1000, 500, 0.5)
+        self.assertEqual((len(merged), merged.boxes.shape), (0, (0, 4)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import numpy as np
+import torch
+from torchvision.ops import batched_nms
+
+from encoding import EncodedResult
+
+
+def tile_grid(width, height, tile_size, overlap):
+    """(x0, y0, x1, y1) windows covering the image, each overlapping its neighbours by ``overlap`` (a fraction).
+
+    Windows are tile_size square. Sides shorter than a tile get a single
+    window spanning the whole side. The last row and column are shifted back
+    to end at the image border instead of hanging over it.
+    """
+    stride = max(1, int(tile_size * (1.0 - overlap)))
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        positions = list(range(0, length - tile_size, stride))
+        positions.append(length - tile_size)
+        return positions
+
+    return [
+        (x0, y0, min(x0 + tile_size, width), min(y0 + tile_size, height))
+        for y0 in starts(height)
+        for x0 in starts(width)
+    ]
+
+
+def is_blank(tile, min_std):
+    """True for tiles with (almost) no texture, e.g. sky or a flat background; sampled on a sparse grid."""
+    return float(tile[::4, ::4].std()) < min_std
+
+
+def content_tiles(image, tile_size, overlap, min_std):
+    """(tiles, skipped): the non-blank windows as (view, (x0, y0)) pairs; views share the image's memory."""
+    height, width = image.shape[:2]
+    tiles = []
+    skipped = 0
+    for x0, y0, x1, y1 in tile_grid(width, height, tile_size, overlap):
+        view = image[y0:y1, x0:x1]
+        if min_std and is_blank(view, min_std):
+            skipped += 1
+            continue
+        tiles.append((view, (x0, y0)))
+    return tiles, skipped
+
+
+def offset_detections(result, offset):
+    """A tile result's boxes as an (N, 6) array (x1, y1, x2, y2, conf, cls) in full-image pixels."""
+    boxes = getattr(result, "boxes", None)
+    if boxes is None or len(boxes) == 0:
+        return np.empty((0, 6), dtype=np.float32)
+    data = boxes.data.float().cpu().numpy().copy()
+    x0, y0 = offset
+    data[:, [0, 2]] += x0
+    data[:, [1, 3]] += y0
+    return data
+
+
+def merge_detections(detections, names, width, height, iou):
+    """Class-aware NMS over the detections of all tiles, as an EncodedResult with normalized boxes.
+
+    Objects cut by a tile border show up in several tiles; NMS keeps the
+    highest-scoring box per object and class, so overlapping classes do not
+    suppress each other.
+    """
+    data = np.concatenate(detections) if detections else np.empty((0, 6), dtype=np.float32)
+    if len(data):
+        tensor = torch.from_numpy(data)
+        keep = batched_nms(tensor[:, :4], tensor[:, 4], tensor[:, 5].long(), iou).numpy()
+        # batched_nms returns the kept indices sorted by decreasing score
+        data = data[keep]
+    xyxyn = data[:, :4] / np.array([width, height, width, height], dtype=np.float32)
+    np.clip(xyxyn, 0.0, 1.0, out=xyxyn)
+    return EncodedResult("detect", names, data[:, 5].astype(np.int64), data[:, 4], xyxyn)